@@ -0,0 +1,236 @@
+"""
+Attack and ray lookup tables shared by the move generators, computed once at import time.
+Square indices follow the board list layout: square = row * 8 + col, so a8 is 0 and h1 is 63.
+
+Two flavours of every table are kept:
+    - square lists of (row, col) tuples for the list based GameState generators to walk
+    - 64 bit masks for BitboardGameState
+
+Building the sliding piece occupancy tables takes a noticeable part of a second, so the finished tables are written
+to a marshal file in the package's __pycache__ folder and read back from there on later imports. The occupancy
+tables are stored as flat arrays of 64 bit words rather than as dicts, which would take as long to unmarshal as to
+build.
+Run from the ChessEngine folder: python -m Chess.AttackTables - rebuilds the cache file and reports its size
+"""
+
+import marshal
+import os
+import sys
+import time
+from array import array
+
+TABLE_VERSION = 1 #bump whenever the layout of the tables changes so stale cache files are rebuilt
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__",
+                          "AttackTables." + (sys.implementation.cache_tag or "python") + ".tables")
+
+#order matters: GameState treats directions 0-3 as orthogonal and 4-7 as diagonal
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+OPPOSITE = (2, 3, 0, 1, 7, 6, 5, 4) #index of the direction pointing the other way
+ROOK_DIRECTIONS = DIRECTIONS[:4]
+BISHOP_DIRECTIONS = DIRECTIONS[4:]
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+SQUARES = [(sq // 8, sq % 8) for sq in range(64)]
+
+
+def _stepTargets(offsets):
+    #for every square, the (row, col) squares one step away by each offset
+    table = []
+    for r, c in SQUARES:
+        table.append(tuple((r + dr, c + dc) for dr, dc in offsets if 0 <= r + dr < 8 and 0 <= c + dc < 8))
+    return table
+
+
+def _rays():
+    #rays[sq][j] - the (row, col) squares going outward from sq in DIRECTIONS[j], nearest first
+    rays = []
+    for r, c in SQUARES:
+        squareRays = []
+        for dr, dc in DIRECTIONS:
+            ray = []
+            i, j = r + dr, c + dc
+            while 0 <= i < 8 and 0 <= j < 8:
+                ray.append((i, j))
+                i += dr
+                j += dc
+            squareRays.append(tuple(ray))
+        rays.append(tuple(squareRays))
+    return rays
+
+
+def _toMask(squares):
+    mask = 0
+    for r, c in squares:
+        mask |= 1 << (r * 8 + c)
+    return mask
+
+
+def _slide(sq, occupied, directions, rays):
+    #attacks from sq along directions, stopping at (and including) the first occupied square
+    attacks = 0
+    for d in directions:
+        for r, c in rays[sq][DIRECTIONS.index(d)]:
+            attacks |= 1 << (r * 8 + c)
+            if occupied >> (r * 8 + c) & 1:
+                break
+    return attacks
+
+
+def _sliderTables(directions, rays):
+    #for every square, map each subset of the relevant occupancy (the rays without their last square, which never
+    #changes the attack set) to the attack set
+    masks = []
+    tables = []
+    for sq in range(64):
+        mask = 0
+        for d in directions:
+            mask |= _toMask(rays[sq][DIRECTIONS.index(d)][:-1])
+        table = {}
+        subset = 0
+        while True:
+            table[subset] = _slide(sq, subset, directions, rays)
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+def _lineTables(rays):
+    #squaresBetween[a][b] - (row, col) squares strictly between a and b, between[a][b] - the same as a mask,
+    #line[a][b] - mask of the whole line through a and b. All empty if a and b don't share a line.
+    squaresBetween = [[()] * 64 for _ in range(64)]
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for a in range(64):
+        for j in range(8):
+            ray = rays[a][j]
+            opposite = rays[a][OPPOSITE[j]]
+            full = _toMask(ray) | _toMask(opposite) | (1 << a)
+            for k in range(len(ray)):
+                b = ray[k][0] * 8 + ray[k][1]
+                squaresBetween[a][b] = ray[:k]
+                between[a][b] = _toMask(ray[:k])
+                line[a][b] = full
+    return squaresBetween, between, line
+
+
+def buildTables():
+    rays = _rays()
+    knightTargets = _stepTargets(KNIGHT_OFFSETS)
+    kingTargets = _stepTargets(KING_OFFSETS)
+    rookMasks, rookTables = _sliderTables(ROOK_DIRECTIONS, rays)
+    bishopMasks, bishopTables = _sliderTables(BISHOP_DIRECTIONS, rays)
+    squaresBetween, between, line = _lineTables(rays)
+    return {
+        "version": TABLE_VERSION,
+        "rays": rays,
+        "knightTargets": knightTargets,
+        "kingTargets": kingTargets,
+        "squaresBetween": squaresBetween,
+        "knightAttacks": [_toMask(targets) for targets in knightTargets],
+        "kingAttacks": [_toMask(targets) for targets in kingTargets],
+        #pawnAttacks[0][sq] - squares a white pawn on sq attacks, pawnAttacks[1][sq] - the same for black
+        "pawnAttacks": [[_toMask(targets) for targets in _stepTargets(((-1, -1), (-1, 1)))],
+                        [_toMask(targets) for targets in _stepTargets(((1, -1), (1, 1)))]],
+        "rookMasks": rookMasks,
+        "rookTables": rookTables,
+        "bishopMasks": bishopMasks,
+        "bishopTables": bishopTables,
+        "between": between,
+        "line": line,
+    }
+
+
+SLIDER_TABLES = ("rookTables", "bishopTables")
+
+
+def _pack(table):
+    #occupancy -> attacks dict as a pair of byte strings holding the keys and the values
+    return array('Q', table.keys()).tobytes(), array('Q', table.values()).tobytes()
+
+
+def _unpack(packed):
+    keys = array('Q')
+    keys.frombytes(packed[0])
+    values = array('Q')
+    values.frombytes(packed[1])
+    return dict(zip(keys, values))
+
+
+def saveTables(tables, path=CACHE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    stored = dict(tables)
+    for name in SLIDER_TABLES:
+        stored[name] = [_pack(table) for table in tables[name]]
+    temporary = path + "." + str(os.getpid())
+    with open(temporary, "wb") as f:
+        marshal.dump(stored, f)
+    os.replace(temporary, path) #atomic, so a concurrent import never reads a half written file
+
+
+"""
+Reads the tables from the cache file, building (and trying to cache) them if the file is missing, unreadable or from
+an older layout. A read only install just builds the tables on every import.
+"""
+def loadTables(path=CACHE_PATH):
+    try:
+        with open(path, "rb") as f:
+            tables = marshal.load(f)
+        if isinstance(tables, dict) and tables.get("version") == TABLE_VERSION:
+            for name in SLIDER_TABLES:
+                tables[name] = [_unpack(packed) for packed in tables[name]]
+            return tables
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    tables = buildTables()
+    try:
+        saveTables(tables, path)
+    except OSError:
+        pass
+    return tables
+
+
+_tables = loadTables()
+RAYS = _tables["rays"]
+KNIGHT_TARGETS = _tables["knightTargets"]
+KING_TARGETS = _tables["kingTargets"]
+SQUARES_BETWEEN = _tables["squaresBetween"]
+KNIGHT_ATTACKS = _tables["knightAttacks"]
+KING_ATTACKS = _tables["kingAttacks"]
+PAWN_ATTACKS = _tables["pawnAttacks"]
+ROOK_MASKS = _tables["rookMasks"]
+ROOK_TABLES = _tables["rookTables"]
+BISHOP_MASKS = _tables["bishopMasks"]
+BISHOP_TABLES = _tables["bishopTables"]
+BETWEEN = _tables["between"]
+LINE = _tables["line"]
+ROOK_EMPTY = [ROOK_TABLES[sq][0] for sq in range(64)]
+BISHOP_EMPTY = [BISHOP_TABLES[sq][0] for sq in range(64)]
+del _tables
+
+
+def rookAttacks(sq, occupied):
+    return ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]]
+
+
+def bishopAttacks(sq, occupied):
+    return BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]]
+
+
+def main():
+    start = time.perf_counter()
+    tables = buildTables()
+    built = time.perf_counter()
+    saveTables(tables)
+    start2 = time.perf_counter()
+    loadTables()
+    loaded = time.perf_counter()
+    print("built in %.3f s, loaded from cache in %.3f s, %s is %d KB" %
+          (built - start, loaded - start2, CACHE_PATH, os.path.getsize(CACHE_PATH) // 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+"""
+Batch legal move generation for analysis pipelines that need move lists, move counts and check/mate/stalemate flags
+for many positions at once, without building a GameState for each of them.
+Positions are packed into an (N, 64) uint8 array of piece codes (0 empty, PIECES index + 1 otherwise, square =
+row * 8 + col) plus an (N,) bool array of whose turn it is. Every step after that - occupancy, attack maps, checkers,
+pins and destination sets - is a NumPy operation over the whole batch, with sliding attacks computed by Kogge-Stone
+fills on uint64 bitboards. Follows the engine's rules: no castling, en passant or promotion.
+Needs NumPy 2.0 or later (numpy.bitwise_count).
+Run from the ChessEngine folder: python -m Chess.BatchMoveGen FILE [--chunk-size N] [--counts-only]
+    - reads one FEN per line and reports positions per second
+"""
+
+import argparse
+import itertools
+import time
+import numpy as np
+from Chess import AttackTables
+from Chess.BitboardEngine import PIECES, FULL, FILE_A, FILE_H, ROW_5, ROW_2
+from Chess.ChessEngine import Move
+
+DEFAULT_CHUNK_SIZE = 16384
+
+#FEN characters to piece codes, 255 marks characters that can't appear in the piece placement field
+_FEN_EXPAND = str.maketrans({str(n): "." * n for n in range(1, 9)})
+_FEN_EXPAND[ord("/")] = None
+_CODE_OF_CHAR = np.full(256, 255, np.uint8)
+_CODE_OF_CHAR[ord(".")] = 0
+for _code, _piece in enumerate(PIECES, 1):
+    _CODE_OF_CHAR[ord(_piece[1].upper() if _piece[0] == "w" else _piece[1].lower())] = _code
+_CODE_OF_PIECE = {piece: code for code, piece in enumerate(PIECES, 1)}
+_CODE_OF_PIECE["--"] = 0
+
+SQUARE_BITS = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+ALL = np.uint64(FULL)
+NOT_FILE_A = np.uint64(FULL ^ FILE_A)
+NOT_FILE_H = np.uint64(FULL ^ FILE_H)
+NOT_FILE_AB = np.uint64(FULL ^ FILE_A ^ (FILE_A << 1))
+NOT_FILE_GH = np.uint64(FULL ^ FILE_H ^ (FILE_H >> 1))
+ROW_5_NP = np.uint64(ROW_5)
+ROW_2_NP = np.uint64(ROW_2)
+
+#(shift, mask) per direction: positive shifts go towards h1, the mask drops squares that wrapped around a board edge
+ORTHOGONAL = ((-8, ALL), (8, ALL), (1, NOT_FILE_A), (-1, NOT_FILE_H))
+DIAGONAL = ((-7, NOT_FILE_A), (-9, NOT_FILE_H), (9, NOT_FILE_A), (7, NOT_FILE_H))
+
+KNIGHT_ATTACKS = np.array(AttackTables.KNIGHT_ATTACKS, np.uint64)
+KING_ATTACKS = np.array(AttackTables.KING_ATTACKS, np.uint64)
+PAWN_ATTACKS = np.array(AttackTables.PAWN_ATTACKS, np.uint64)
+BETWEEN = np.array(AttackTables.BETWEEN, np.uint64)
+LINE = np.array(AttackTables.LINE, np.uint64)
+
+
+class BatchResult():
+    def __init__(self, boards, whiteToMove, moveCounts, inCheck, checkMate, staleMate, moveIDs=None, moveOffsets=None):
+        self.boards = boards
+        self.whiteToMove = whiteToMove
+        self.moveCounts = moveCounts #(N,) number of legal moves
+        self.inCheck = inCheck #(N,) bool
+        self.checkMate = checkMate #(N,) bool
+        self.staleMate = staleMate #(N,) bool
+        #moveIDs holds the Move.moveID of every legal move, those of position i are moveIDs[moveOffsets[i]:moveOffsets[i + 1]]
+        self.moveIDs = moveIDs
+        self.moveOffsets = moveOffsets
+
+    def __len__(self):
+        return len(self.boards)
+
+    def getMoveIDs(self, i):
+        return self.moveIDs[self.moveOffsets[i]:self.moveOffsets[i + 1]]
+
+    """
+    Legal moves of position i as Move objects, the same moves GameState.getValidMoves returns (in a different order)
+    """
+    def getMoves(self, i):
+        board = unpackBoard(self.boards[i])
+        return [Move(AttackTables.SQUARES[moveID & 63], AttackTables.SQUARES[moveID >> 6], board)
+                for moveID in self.getMoveIDs(i).tolist()]
+
+
+"""
+Packs FEN strings into (boards, whiteToMove) arrays. Only the piece placement and side to move fields are read.
+"""
+def packFENs(fens):
+    fens = list(fens)
+    placements = []
+    whiteToMove = []
+    for fen in fens:
+        fields = fen.split()
+        placement = fields[0].translate(_FEN_EXPAND) if fields else ""
+        if len(placement) != 64:
+            raise ValueError("Invalid FEN, expected 64 squares: " + fen)
+        placements.append(placement)
+        whiteToMove.append(len(fields) < 2 or fields[1] == "w")
+    boards = _CODE_OF_CHAR[np.frombuffer("".join(placements).encode("ascii"), np.uint8)].reshape(-1, 64)
+    if (boards == 255).any():
+        raise ValueError("Invalid FEN, unknown piece: " + fens[int(np.nonzero((boards == 255).any(axis=1))[0][0])])
+    return boards, np.array(whiteToMove, bool)
+
+
+"""
+Packs GameState or BitboardGameState objects into (boards, whiteToMove) arrays
+"""
+def packGameStates(states):
+    codes = []
+    whiteToMove = []
+    for gs in states:
+        codes.extend(_CODE_OF_PIECE[piece] for row in gs.board for piece in row)
+        whiteToMove.append(gs.whiteToMove)
+    return np.array(codes, np.uint8).reshape(-1, 64), np.array(whiteToMove, bool)
+
+
+"""
+Turns a row of a packed boards array back into a board in the GameState format
+"""
+def unpackBoard(codes):
+    names = ["--"] + PIECES
+    flat = [names[code] for code in codes.tolist()]
+    return [flat[r * 8:r * 8 + 8] for r in range(8)]
+
+
+def _shift(bitboards, n):
+    return bitboards << np.uint64(n) if n > 0 else bitboards >> np.uint64(-n)
+
+
+def _slide(sliders, empty, directions):
+    #Kogge-Stone occluded fill: attacks of all the sliders in each bitboard, stopping at the first occupied square
+    attacks = np.zeros_like(sliders)
+    for n, mask in directions:
+        generator = sliders
+        propagator = empty & mask
+        generator = generator | (propagator & _shift(generator, n))
+        propagator = propagator & _shift(propagator, n)
+        generator = generator | (propagator & _shift(generator, 2 * n))
+        propagator = propagator & _shift(propagator, 2 * n)
+        generator = generator | (propagator & _shift(generator, 4 * n))
+        attacks |= _shift(generator, n) & mask
+    return attacks
+
+
+def _knightAttacks(knights):
+    one = ((knights >> np.uint64(1)) & NOT_FILE_H) | ((knights << np.uint64(1)) & NOT_FILE_A)
+    two = ((knights >> np.uint64(2)) & NOT_FILE_GH) | ((knights << np.uint64(2)) & NOT_FILE_AB)
+    return (one << np.uint64(16)) | (one >> np.uint64(16)) | (two << np.uint64(8)) | (two >> np.uint64(8))
+
+
+def _pawnAttacks(pawns, black):
+    white = ((pawns >> np.uint64(9)) & NOT_FILE_H) | ((pawns >> np.uint64(7)) & NOT_FILE_A)
+    blackAttacks = ((pawns << np.uint64(7)) & NOT_FILE_H) | ((pawns << np.uint64(9)) & NOT_FILE_A)
+    return np.where(black, blackAttacks, white)
+
+
+def _squareOf(bitboards):
+    #index of the single set bit of each bitboard
+    return np.bitwise_count(bitboards - np.uint64(1)).astype(np.intp)
+
+
+"""
+Legal moves of every position in the batch. boards is an (N, 64) uint8 array of piece codes and whiteToMove an (N,)
+bool array, as returned by packFENs or packGameStates. With withMoves=False only the counts and flags are filled in,
+which skips expanding the destination bitboards into individual moves.
+"""
+def generateMoves(boards, whiteToMove, withMoves=True):
+    boards = np.ascontiguousarray(boards, np.uint8)
+    whiteToMove = np.asarray(whiteToMove, bool)
+    n = len(boards)
+    black = ~whiteToMove
+    us = black.astype(np.intp)
+
+    #one bitboard per piece code, bit i set when square i holds that piece
+    pieceBitboards = np.zeros((n, 13), np.uint64)
+    for code in range(1, 13):
+        pieceBitboards[:, code] = np.packbits(boards == code, axis=1, bitorder="little").view("<u8")[:, 0]
+    own = np.where(black[:, None], pieceBitboards[:, 7:13], pieceBitboards[:, 1:7])
+    enemy = np.where(black[:, None], pieceBitboards[:, 1:7], pieceBitboards[:, 7:13])
+    if not ((np.bitwise_count(own[:, 5]) == 1) & (np.bitwise_count(enemy[:, 5]) == 1)).all():
+        raise ValueError("Every position needs exactly one king of each colour")
+    ownOccupancy = np.bitwise_or.reduce(own, axis=1)
+    enemyOccupancy = np.bitwise_or.reduce(enemy, axis=1)
+    empty = ~(ownOccupancy | enemyOccupancy)
+    kingBit = own[:, 5]
+    kingSq = _squareOf(kingBit)
+    enemyOrthogonal = enemy[:, 3] | enemy[:, 4]
+    enemyDiagonal = enemy[:, 2] | enemy[:, 4]
+
+    #squares the enemy attacks, looking through our king so it can't step back along a checking line
+    emptyWithoutKing = empty | kingBit
+    attacked = _pawnAttacks(enemy[:, 0], ~black) | _knightAttacks(enemy[:, 1]) | KING_ATTACKS[_squareOf(enemy[:, 5])] | \
+        _slide(enemyOrthogonal, emptyWithoutKing, ORTHOGONAL) | _slide(enemyDiagonal, emptyWithoutKing, DIAGONAL)
+
+    kingOrthogonal = _slide(kingBit, empty, ORTHOGONAL)
+    kingDiagonal = _slide(kingBit, empty, DIAGONAL)
+    checkers = (PAWN_ATTACKS[us, kingSq] & enemy[:, 0]) | (KNIGHT_ATTACKS[kingSq] & enemy[:, 1]) | \
+        (kingOrthogonal & enemyOrthogonal) | (kingDiagonal & enemyDiagonal)
+    checkCount = np.bitwise_count(checkers)
+    checkerSq = _squareOf(np.where(checkCount == 1, checkers, np.uint64(1)))
+    #squares a non-king move has to land on: anywhere, on the checker or between it and the king, or nowhere
+    evasion = np.where(checkCount == 0, ALL,
+                       np.where(checkCount == 1, checkers | BETWEEN[kingSq, checkerSq], np.uint64(0)))
+
+    #one entry per piece of the side to move, grouped by position in square order
+    isOwn = np.where(black[:, None], boards >= 7, (boards >= 1) & (boards <= 6))
+    square = np.flatnonzero(isOwn) #flat indices are cheaper to find than np.nonzero's index pairs
+    pos, sq = square >> 6, square & 63
+    pieceType = (boards[pos, sq] - 1) % 6 #0 pawn, 1 knight, 2 bishop, 3 rook, 4 queen, 5 king
+    bit = SQUARE_BITS[sq]
+    pieceEmpty = empty[pos]
+    targets = np.zeros(len(pos), np.uint64)
+
+    selected = pieceType == 0
+    pawns, pawnsEmpty, pawnsBlack = bit[selected], pieceEmpty[selected], black[pos[selected]]
+    whitePush = (pawns >> np.uint64(8)) & pawnsEmpty
+    blackPush = (pawns << np.uint64(8)) & pawnsEmpty
+    targets[selected] = np.where(pawnsBlack, blackPush | (((blackPush & ROW_2_NP) << np.uint64(8)) & pawnsEmpty),
+                                 whitePush | (((whitePush & ROW_5_NP) >> np.uint64(8)) & pawnsEmpty)) | \
+        (PAWN_ATTACKS[pawnsBlack.astype(np.intp), sq[selected]] & enemyOccupancy[pos[selected]])
+    selected = pieceType == 1
+    targets[selected] = KNIGHT_ATTACKS[sq[selected]]
+    selected = (pieceType == 2) | (pieceType == 4)
+    targets[selected] |= _slide(bit[selected], pieceEmpty[selected], DIAGONAL)
+    selected = (pieceType == 3) | (pieceType == 4)
+    targets[selected] |= _slide(bit[selected], pieceEmpty[selected], ORTHOGONAL)
+    selected = pieceType == 5
+    targets[selected] = KING_ATTACKS[sq[selected]] & ~attacked[pos[selected]]
+    targets &= ~ownOccupancy[pos]
+
+    #a piece is pinned if taking it off the board lets an enemy slider see the king, it can then only move along the pin
+    nonKing = pieceType != 5
+    targets[nonKing] &= evasion[pos[nonKing]]
+    line = LINE[kingSq[pos], sq]
+    selected = np.nonzero(nonKing & (line != 0))[0]
+    if len(selected):
+        at = pos[selected]
+        emptyWithout = empty[at] | bit[selected]
+        revealed = (_slide(kingBit[at], emptyWithout, ORTHOGONAL) & ~kingOrthogonal[at] & enemyOrthogonal[at]) | \
+            (_slide(kingBit[at], emptyWithout, DIAGONAL) & ~kingDiagonal[at] & enemyDiagonal[at])
+        pinned = selected[revealed != 0]
+        targets[pinned] &= line[pinned]
+
+    moveCounts = np.bincount(pos, weights=np.bitwise_count(targets), minlength=n).astype(np.int64)
+    inCheck = checkCount > 0
+    noMoves = moveCounts == 0
+    result = BatchResult(boards, whiteToMove, moveCounts, inCheck, inCheck & noMoves, ~inCheck & noMoves)
+    if withMoves:
+        destinations = np.unpackbits(targets.astype("<u8").view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+        destination = np.flatnonzero(destinations.view(bool))
+        piece, endSq = destination >> 6, destination & 63
+        result.moveIDs = (sq[piece] | (endSq << 6)).astype(np.uint16)
+        result.moveOffsets = np.zeros(n + 1, np.int64)
+        np.cumsum(moveCounts, out=result.moveOffsets[1:])
+    return result
+
+
+"""
+Generates moves for a list or stream of FEN strings chunkSize positions at a time, yielding a BatchResult per chunk
+"""
+def generateFromFENs(fens, chunkSize=DEFAULT_CHUNK_SIZE, withMoves=True):
+    fens = iter(fens)
+    while True:
+        chunk = list(itertools.islice(fens, chunkSize))
+        if not chunk:
+            return
+        boards, whiteToMove = packFENs(chunk)
+        yield generateMoves(boards, whiteToMove, withMoves)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch legal move generation over a file of FENs")
+    parser.add_argument("file", help="text file with one FEN per line")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--counts-only", action="store_true", help="skip building the move lists")
+    args = parser.parse_args()
+
+    with open(args.file) as f:
+        fens = [line.strip() for line in f if line.strip()]
+    start = time.perf_counter()
+    positions = moves = checks = mates = stalemates = 0
+    for result in generateFromFENs(fens, args.chunk_size, not args.counts_only):
+        positions += len(result)
+        moves += int(result.moveCounts.sum())
+        checks += int(result.inCheck.sum())
+        mates += int(result.checkMate.sum())
+        stalemates += int(result.staleMate.sum())
+    elapsed = time.perf_counter() - start
+    print("%d positions, %d moves, %d in check, %d checkmates, %d stalemates" %
+          (positions, moves, checks, mates, stalemates))
+    print("%.3f s, %d positions/sec" % (elapsed, positions / max(elapsed, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
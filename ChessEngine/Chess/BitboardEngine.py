@@ -0,0 +1,671 @@
+"""
+Bitboard backed alternative to ChessEngine.GameState.
+The position is stored as one 64 bit integer per piece type and colour plus an occupancy mask per colour.
+Square indices follow the board list layout: square = row * 8 + col, so a8 is 0 and h1 is 63.
+It exposes the same surface as GameState (board, moveLog, makeMove, undoMove, getValidMoves, ...) so ChessMain
+and other callers can use either one.
+Move generation loops such as perft can skip the Move objects altogether: getValidMoveIDs returns the legal moves as
+plain moveIDs (start | end << 6), and makeMoveID / undoMoveID play and take back a moveID on the bitboards alone.
+"""
+
+from Chess import Zobrist
+from Chess.Evaluation import MG_TABLES, EG_TABLES, PHASE, evaluateBoard
+from Chess.AttackTables import SQUARES, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, ROOK_MASKS, ROOK_TABLES, \
+    BISHOP_MASKS, BISHOP_TABLES, ROOK_EMPTY, BISHOP_EMPTY, BETWEEN, LINE, rookAttacks, bishopAttacks
+from Chess.ChessEngine import Move, parseFEN, boardToFEN
+
+PIECES = ["wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK"]
+PIECE_INDEX = {piece: i for i, piece in enumerate(PIECES)}
+WP, WN, WB, WR, WQ, WK, BP, BN, BB, BR, BQ, BK = range(12)
+EMPTY = 12 #piece index of an empty square in squares
+
+FULL = (1 << 64) - 1
+FILE_A = sum(1 << (r * 8) for r in range(8))
+FILE_H = FILE_A << 7
+NOT_FILE_A = FULL ^ FILE_A
+NOT_FILE_H = FULL ^ FILE_H
+ROW_5 = 0xFF << 40 #white pawns land here after a single push from their starting row
+ROW_2 = 0xFF << 16 #black pawns land here after a single push from their starting row
+
+#square a set-wise pawn move came from, relative to its target: push, double push, capture left, capture right
+PAWN_OFFSETS = ((8, 16, 9, 7), (-8, -16, -7, -9))
+
+
+def _sign(x):
+    return (x > 0) - (x < 0)
+
+
+class BitboardGameState():
+    def __init__(self):
+        #mailbox copy of the position kept in the same format as GameState.board so the GUI and Move objects can read it
+        self.board = [
+            ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
+            ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
+            ["--", "--", "--", "--", "--", "--", "--", "--"],
+            ["--", "--", "--", "--", "--", "--", "--", "--"],
+            ["--", "--", "--", "--", "--", "--", "--", "--"],
+            ["--", "--", "--", "--", "--", "--", "--", "--"],
+            ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
+            ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]
+        ]
+        self.moveLog = []
+        self.whiteToMove = True
+        self.inCheck = False
+        self.pins = []
+        self.checks = []
+        self.checkMate = False
+        self.staleMate = False
+        self.loadBoard(self.board, True)
+
+    #Rebuilds the bitboards from a board list in GameState format
+    def loadBoard(self, board, whiteToMove):
+        self.board = [row[:] for row in board]
+        self.pieceBitboards = [0] * 12
+        self.colourOccupancy = [0, 0] #white, black
+        self.squares = [EMPTY] * 64 #piece index on every square
+        self.idLog = [] #moveID | piece moved << 12 | piece captured << 16 of every makeMoveID not yet taken back
+        self.whiteKingLocation = None
+        self.blackKingLocation = None
+        for sq in range(64):
+            r, c = SQUARES[sq]
+            piece = self.board[r][c]
+            if piece != "--":
+                self.squares[sq] = PIECE_INDEX[piece]
+                self.pieceBitboards[PIECE_INDEX[piece]] |= 1 << sq
+                self.colourOccupancy[0 if piece[0] == "w" else 1] |= 1 << sq
+                if piece == "wK":
+                    self.whiteKingLocation = (r, c)
+                elif piece == "bK":
+                    self.blackKingLocation = (r, c)
+        self.whiteToMove = whiteToMove
+        self.moveLog = []
+        self.inCheck = False
+        self.pins = []
+        self.checks = []
+        self.checkMate = False
+        self.staleMate = False
+        self.zobristKey = Zobrist.hashBoard(self.board, whiteToMove)
+        self.mgScore, self.egScore, self.phase = evaluateBoard(self.board)
+
+    def loadFEN(self, fen):
+        board, whiteToMove = parseFEN(fen)
+        self.loadBoard(board, whiteToMove)
+
+    def getFEN(self):
+        return boardToFEN(self.board, self.whiteToMove)
+
+    def makeMove(self, move):
+        start = move.moveID & 63
+        end = move.moveID >> 6
+        fromTo = (1 << start) | (1 << end)
+        us = 0 if move.pieceMoved[0] == "w" else 1
+        self.pieceBitboards[PIECE_INDEX[move.pieceMoved]] ^= fromTo
+        self.colourOccupancy[us] ^= fromTo
+        if move.pieceCaptured != "--":
+            self.pieceBitboards[PIECE_INDEX[move.pieceCaptured]] ^= 1 << end
+            self.colourOccupancy[1 - us] ^= 1 << end
+        self.board[move.startRow][move.startCol] = "--"
+        self.board[move.endRow][move.endCol] = move.pieceMoved
+        self.squares[start] = EMPTY
+        self.squares[end] = PIECE_INDEX[move.pieceMoved]
+        self.moveLog.append(move)
+        if move.pieceMoved == "wK":
+            self.whiteKingLocation = (move.endRow, move.endCol)
+        elif move.pieceMoved == "bK":
+            self.blackKingLocation = (move.endRow, move.endCol)
+        self.whiteToMove = not self.whiteToMove
+        self.zobristKey ^= Zobrist.moveKey(move)
+        self.mgScore += MG_TABLES[move.pieceMoved][end] - MG_TABLES[move.pieceMoved][start]
+        self.egScore += EG_TABLES[move.pieceMoved][end] - EG_TABLES[move.pieceMoved][start]
+        if move.pieceCaptured != "--":
+            self.mgScore -= MG_TABLES[move.pieceCaptured][end]
+            self.egScore -= EG_TABLES[move.pieceCaptured][end]
+            self.phase -= PHASE[move.pieceCaptured]
+
+    def undoMove(self):
+        if len(self.moveLog) > 0:
+            move = self.moveLog.pop()
+            start = move.moveID & 63
+            end = move.moveID >> 6
+            fromTo = (1 << start) | (1 << end)
+            us = 0 if move.pieceMoved[0] == "w" else 1
+            self.pieceBitboards[PIECE_INDEX[move.pieceMoved]] ^= fromTo
+            self.colourOccupancy[us] ^= fromTo
+            if move.pieceCaptured != "--":
+                self.pieceBitboards[PIECE_INDEX[move.pieceCaptured]] ^= 1 << end
+                self.colourOccupancy[1 - us] ^= 1 << end
+            self.board[move.startRow][move.startCol] = move.pieceMoved
+            self.board[move.endRow][move.endCol] = move.pieceCaptured
+            self.squares[start] = PIECE_INDEX[move.pieceMoved]
+            self.squares[end] = PIECE_INDEX[move.pieceCaptured] if move.pieceCaptured != "--" else EMPTY
+            if move.pieceMoved == "wK":
+                self.whiteKingLocation = (move.startRow, move.startCol)
+            elif move.pieceMoved == "bK":
+                self.blackKingLocation = (move.startRow, move.startCol)
+            self.whiteToMove = not self.whiteToMove
+            self.checkMate = False
+            self.staleMate = False
+            self.zobristKey ^= Zobrist.moveKey(move)
+            self.mgScore -= MG_TABLES[move.pieceMoved][end] - MG_TABLES[move.pieceMoved][start]
+            self.egScore -= EG_TABLES[move.pieceMoved][end] - EG_TABLES[move.pieceMoved][start]
+            if move.pieceCaptured != "--":
+                self.mgScore += MG_TABLES[move.pieceCaptured][end]
+                self.egScore += EG_TABLES[move.pieceCaptured][end]
+                self.phase += PHASE[move.pieceCaptured]
+
+    """
+    makeMove for a moveID from getValidMoveIDs, for move generation loops. Only the bitboards, squares and the side to
+    move change: board, moveLog, the king locations, zobristKey and the evaluation scores stay as they were until the
+    move is taken back with undoMoveID, so nothing but getValidMoveIDs, countValidMoves and these two may be used
+    in between.
+    """
+    def makeMoveID(self, moveID):
+        start = moveID & 63
+        end = moveID >> 6
+        squares = self.squares
+        moved = squares[start]
+        captured = squares[end]
+        fromTo = 1 << start | 1 << end
+        us = 0 if moved < 6 else 1
+        self.pieceBitboards[moved] ^= fromTo
+        self.colourOccupancy[us] ^= fromTo
+        if captured != EMPTY:
+            self.pieceBitboards[captured] ^= 1 << end
+            self.colourOccupancy[1 - us] ^= 1 << end
+        squares[start] = EMPTY
+        squares[end] = moved
+        self.whiteToMove = not self.whiteToMove
+        self.idLog.append(moveID | moved << 12 | captured << 16)
+
+    def undoMoveID(self):
+        entry = self.idLog.pop()
+        start = entry & 63
+        end = entry >> 6 & 63
+        moved = entry >> 12 & 15
+        captured = entry >> 16
+        fromTo = 1 << start | 1 << end
+        us = 0 if moved < 6 else 1
+        self.pieceBitboards[moved] ^= fromTo
+        self.colourOccupancy[us] ^= fromTo
+        if captured != EMPTY:
+            self.pieceBitboards[captured] ^= 1 << end
+            self.colourOccupancy[1 - us] ^= 1 << end
+        squares = self.squares
+        squares[start] = moved
+        squares[end] = captured
+        self.whiteToMove = not self.whiteToMove
+
+    """
+    Returns a bitboard of the pieces of the given colour (0 white, 1 black) attacking sq
+    """
+    def attackersTo(self, sq, colour, occupied):
+        bbs = self.pieceBitboards
+        base = 6 * colour
+        queens = bbs[base + 4]
+        return (PAWN_ATTACKS[1 - colour][sq] & bbs[base]) | (KNIGHT_ATTACKS[sq] & bbs[base + 1]) | \
+               (KING_ATTACKS[sq] & bbs[base + 5]) | \
+               (BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]] & (bbs[base + 2] | queens)) | \
+               (ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]] & (bbs[base + 3] | queens))
+
+    """
+    Returns (kingSq, checkers, pinned) for the side to move: the king's square, a bitboard of the enemy pieces giving
+    check and a bitboard of the own pieces pinned to the king
+    """
+    def _checkersAndPinned(self):
+        bbs = self.pieceBitboards
+        if self.whiteToMove:
+            us, base, enemyBase = 0, 0, 6
+        else:
+            us, base, enemyBase = 1, 6, 0
+        own = self.colourOccupancy[us]
+        occupied = own | self.colourOccupancy[1 - us]
+        kingSq = bbs[base + 5].bit_length() - 1
+        #checkers and pinned pieces come from the enemy sliders that see the king on an empty board
+        enemyQueens = bbs[enemyBase + 4]
+        checkers = (PAWN_ATTACKS[us][kingSq] & bbs[enemyBase]) | (KNIGHT_ATTACKS[kingSq] & bbs[enemyBase + 1])
+        pinned = 0
+        snipers = (ROOK_EMPTY[kingSq] & (bbs[enemyBase + 3] | enemyQueens)) | \
+                  (BISHOP_EMPTY[kingSq] & (bbs[enemyBase + 2] | enemyQueens))
+        betweenKing = BETWEEN[kingSq]
+        while snipers:
+            bit = snipers & -snipers
+            snipers ^= bit
+            blockers = betweenKing[bit.bit_length() - 1] & occupied
+            if blockers == 0:
+                checkers |= bit
+            elif blockers & (blockers - 1) == 0 and blockers & own:
+                pinned |= blockers
+        return kingSq, checkers, pinned
+
+    """
+    Core of the legal move generator. Returns (kingSq, checkers, pinned, pieceFrom, pieceTargets, pawnTargets) where
+    pieceTargets[i] is the bitboard of legal destinations of the piece on pieceFrom[i] and pawnTargets holds the
+    destinations of the pawns moved set-wise - each square t in pawnTargets[i] was reached from t + PAWN_OFFSETS[us][i].
+    checkersAndPinned is the result of _checkersAndPinned if the caller already has it.
+    """
+    def _legalTargets(self, checkersAndPinned=None):
+        bbs = self.pieceBitboards
+        bishopTables = BISHOP_TABLES
+        bishopMasks = BISHOP_MASKS
+        rookTables = ROOK_TABLES
+        rookMasks = ROOK_MASKS
+        if self.whiteToMove:
+            us, them, base, enemyBase = 0, 1, 0, 6
+        else:
+            us, them, base, enemyBase = 1, 0, 6, 0
+        own = self.colourOccupancy[us]
+        enemy = self.colourOccupancy[them]
+        occupied = own | enemy
+        kingSq, checkers, pinned = checkersAndPinned or self._checkersAndPinned()
+        betweenKing = BETWEEN[kingSq]
+        pieceFrom = []
+        pieceTargets = []
+        legal = self._kingTargets(kingSq, us, own, occupied, enemyBase)
+        if legal:
+            pieceFrom.append(kingSq)
+            pieceTargets.append(legal)
+
+        if checkers:
+            if checkers & (checkers - 1): #double check, only the king can move
+                return kingSq, checkers, pinned, pieceFrom, pieceTargets, [0, 0, 0, 0]
+            targetMask = betweenKing[checkers.bit_length() - 1] | checkers
+        else:
+            targetMask = FULL
+        notOwn = (FULL ^ own) & targetMask
+
+        #pawns - unpinned ones set-wise, pinned ones one by one
+        pawns, knights, bishops, rooks, queens = bbs[base:base + 5]
+        empty = FULL ^ occupied
+        if pinned:
+            lineKing = LINE[kingSq]
+            unpinned = FULL ^ pinned
+            freePawns = pawns & unpinned
+            pinnedPieces = pinned & (FULL ^ knights) #a pinned knight can never move
+            knights &= unpinned
+            while pinnedPieces:
+                bit = pinnedPieces & -pinnedPieces
+                pinnedPieces ^= bit
+                sq = bit.bit_length() - 1
+                if bit & pawns:
+                    targets = self._pawnTargets(sq, us, empty, enemy)
+                elif bit & bishops:
+                    targets = bishopTables[sq][occupied & bishopMasks[sq]]
+                elif bit & rooks:
+                    targets = rookTables[sq][occupied & rookMasks[sq]]
+                else:
+                    targets = bishopTables[sq][occupied & bishopMasks[sq]] | rookTables[sq][occupied & rookMasks[sq]]
+                pieceFrom.append(sq)
+                pieceTargets.append(targets & notOwn & lineKing[sq])
+            bishops &= unpinned
+            rooks &= unpinned
+            queens &= unpinned
+        else:
+            freePawns = pawns
+        if us == 0:
+            push = (freePawns >> 8) & empty
+            pawnTargets = [push & targetMask, ((push & ROW_5) >> 8) & empty & targetMask,
+                           ((freePawns & NOT_FILE_A) >> 9) & enemy & targetMask,
+                           ((freePawns & NOT_FILE_H) >> 7) & enemy & targetMask]
+        else:
+            push = (freePawns << 8) & empty
+            pawnTargets = [push & targetMask, ((push & ROW_2) << 8) & empty & targetMask,
+                           ((freePawns & NOT_FILE_A) << 7) & enemy & targetMask,
+                           ((freePawns & NOT_FILE_H) << 9) & enemy & targetMask]
+
+        while knights:
+            bit = knights & -knights
+            knights ^= bit
+            sq = bit.bit_length() - 1
+            pieceFrom.append(sq)
+            pieceTargets.append(KNIGHT_ATTACKS[sq] & notOwn)
+        diagonal = bishops | queens
+        while diagonal:
+            bit = diagonal & -diagonal
+            diagonal ^= bit
+            sq = bit.bit_length() - 1
+            pieceFrom.append(sq)
+            pieceTargets.append(bishopTables[sq][occupied & bishopMasks[sq]] & notOwn)
+        orthogonal = rooks | queens
+        while orthogonal:
+            bit = orthogonal & -orthogonal
+            orthogonal ^= bit
+            sq = bit.bit_length() - 1
+            pieceFrom.append(sq)
+            pieceTargets.append(rookTables[sq][occupied & rookMasks[sq]] & notOwn)
+        return kingSq, checkers, pinned, pieceFrom, pieceTargets, pawnTargets
+
+    #legal king moves, tested with the king taken off the board so it can't hide behind itself
+    def _kingTargets(self, kingSq, us, own, occupied, enemyBase):
+        enemyPawns, enemyKnights, enemyBishops, enemyRooks, enemyQueens, enemyKing = \
+            self.pieceBitboards[enemyBase:enemyBase + 6]
+        #squares covered by the enemy pawns and king are dropped set-wise, the rest are tested one by one
+        if us == 0:
+            covered = (enemyPawns & NOT_FILE_A) << 7 | (enemyPawns & NOT_FILE_H) << 9
+        else:
+            covered = (enemyPawns & NOT_FILE_A) >> 9 | (enemyPawns & NOT_FILE_H) >> 7
+        targets = KING_ATTACKS[kingSq] & (FULL ^ (own | covered | KING_ATTACKS[enemyKing.bit_length() - 1]))
+        if not targets:
+            return 0
+        enemyDiagonal = enemyBishops | enemyQueens
+        enemyOrthogonal = enemyRooks | enemyQueens
+        occupiedNoKing = occupied ^ (1 << kingSq)
+        legal = 0
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            sq = bit.bit_length() - 1
+            if not ((KNIGHT_ATTACKS[sq] & enemyKnights) or
+                    (BISHOP_EMPTY[sq] & enemyDiagonal and
+                     BISHOP_TABLES[sq][occupiedNoKing & BISHOP_MASKS[sq]] & enemyDiagonal) or
+                    (ROOK_EMPTY[sq] & enemyOrthogonal and
+                     ROOK_TABLES[sq][occupiedNoKing & ROOK_MASKS[sq]] & enemyOrthogonal)):
+                legal |= bit
+        return legal
+
+    def _pawnTargets(self, sq, us, empty, enemy):
+        if us == 0:
+            push = (1 << sq >> 8) & empty
+            if push & ROW_5:
+                push |= (push >> 8) & empty
+        else:
+            push = (1 << sq << 8) & empty & FULL
+            if push & ROW_2:
+                push |= (push << 8) & empty
+        return push | (PAWN_ATTACKS[us][sq] & enemy)
+
+    #All moves considering the check
+    def getValidMoves(self):
+        kingSq, checkers, pinned, pieceFrom, pieceTargets, pawnTargets = self._legalTargets()
+        self._setPinsAndChecks(kingSq, checkers, pinned)
+        board = self.board
+        moves = []
+        for i in range(len(pieceFrom)):
+            start = SQUARES[pieceFrom[i]]
+            targets = pieceTargets[i]
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                moves.append(Move(start, SQUARES[bit.bit_length() - 1], board))
+        for targets, offset in zip(pawnTargets, PAWN_OFFSETS[0 if self.whiteToMove else 1]):
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                end = bit.bit_length() - 1
+                moves.append(Move(SQUARES[end + offset], SQUARES[end], board))
+
+        if len(moves) == 0:
+            if self.inCheck:
+                self.checkMate = True
+            else:
+                self.staleMate = True
+        else:
+            self.checkMate = False
+            self.staleMate = False
+        return moves
+
+    """
+    The legal moves as moveIDs for makeMoveID, without building Move objects. Unlike getValidMoves it leaves inCheck,
+    pins, checks and the mate flags alone.
+    """
+    def getValidMoveIDs(self):
+        kingSq, checkers, pinned, pieceFrom, pieceTargets, pawnTargets = self._legalTargets()
+        moveIDs = []
+        append = moveIDs.append
+        for start, targets in zip(pieceFrom, pieceTargets):
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                append(start | (bit.bit_length() - 1) << 6)
+        for targets, offset in zip(pawnTargets, PAWN_OFFSETS[0 if self.whiteToMove else 1]):
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                end = bit.bit_length() - 1
+                append(end + offset | end << 6)
+        return moveIDs
+
+    """
+    Number of legal moves in the position without building any Move objects (bulk counting for perft)
+    """
+    def countValidMoves(self):
+        bbs = self.pieceBitboards
+        if self.whiteToMove:
+            us, base, enemyBase = 0, 0, 6
+            own, enemy = self.colourOccupancy
+        else:
+            us, base, enemyBase = 1, 6, 0
+            enemy, own = self.colourOccupancy
+        occupied = own | enemy
+        kingSq = bbs[base + 5].bit_length() - 1
+        pawns, knights, bishops, rooks, queens = bbs[base:base + 5]
+        notOwn = FULL ^ own
+        count = 0
+        if KING_ATTACKS[kingSq] & notOwn: #a boxed in king, common in the middlegame, needs no attack tests
+            count = self._kingTargets(kingSq, us, own, occupied, enemyBase).bit_count()
+        #only a piece that checks the king, or an enemy slider seeing it on an empty board, can check or pin
+        enemyQueens = bbs[enemyBase + 4]
+        if (PAWN_ATTACKS[us][kingSq] & bbs[enemyBase]) or (KNIGHT_ATTACKS[kingSq] & bbs[enemyBase + 1]) or \
+                (ROOK_EMPTY[kingSq] & (bbs[enemyBase + 3] | enemyQueens)) or \
+                (BISHOP_EMPTY[kingSq] & (bbs[enemyBase + 2] | enemyQueens)):
+            kingSq, checkers, pinned = self._checkersAndPinned()
+            if checkers:
+                if checkers & (checkers - 1): #double check, only the king can move
+                    return count
+                targetMask = BETWEEN[kingSq][checkers.bit_length() - 1] | checkers
+                notOwn &= targetMask
+            else:
+                targetMask = FULL
+            if pinned:
+                #the pinned pieces are counted one by one along their pin line and left out of the sets below
+                lineKing = LINE[kingSq]
+                empty = FULL ^ occupied
+                unpinned = FULL ^ pinned
+                pinnedPieces = pinned & (FULL ^ knights) #a pinned knight can never move
+                while pinnedPieces:
+                    bit = pinnedPieces & -pinnedPieces
+                    pinnedPieces ^= bit
+                    sq = bit.bit_length() - 1
+                    if bit & pawns:
+                        targets = self._pawnTargets(sq, us, empty, enemy)
+                    elif bit & bishops:
+                        targets = BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]]
+                    elif bit & rooks:
+                        targets = ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]]
+                    else:
+                        targets = BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]] | \
+                                  ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]]
+                    count += (targets & notOwn & lineKing[sq]).bit_count()
+                pawns &= unpinned
+                knights &= unpinned
+                bishops &= unpinned
+                rooks &= unpinned
+                queens &= unpinned
+        else:
+            targetMask = FULL
+        #every other piece can go wherever it attacks (within targetMask when in check), so the moves of
+        #_legalTargets are counted straight from the attack tables without collecting them
+        empty = FULL ^ occupied
+        enemy &= targetMask
+        if us == 0:
+            push = (pawns >> 8) & empty
+            count += ((push | (push & ROW_5) >> 8 & empty) & targetMask).bit_count() + \
+                ((pawns & NOT_FILE_A) >> 9 & enemy).bit_count() + ((pawns & NOT_FILE_H) >> 7 & enemy).bit_count()
+        else:
+            push = (pawns << 8) & empty
+            count += ((push | (push & ROW_2) << 8 & empty) & targetMask).bit_count() + \
+                ((pawns & NOT_FILE_A) << 7 & enemy).bit_count() + ((pawns & NOT_FILE_H) << 9 & enemy).bit_count()
+        while knights:
+            bit = knights & -knights
+            knights ^= bit
+            count += (KNIGHT_ATTACKS[bit.bit_length() - 1] & notOwn).bit_count()
+        diagonal = bishops | queens
+        while diagonal:
+            bit = diagonal & -diagonal
+            diagonal ^= bit
+            sq = bit.bit_length() - 1
+            count += (BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]] & notOwn).bit_count()
+        orthogonal = rooks | queens
+        while orthogonal:
+            bit = orthogonal & -orthogonal
+            orthogonal ^= bit
+            sq = bit.bit_length() - 1
+            count += (ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]] & notOwn).bit_count()
+        return count
+
+    def _setPinsAndChecks(self, kingSq, checkers, pinned):
+        #translate the bitboards into the (row, col, dirRow, dirCol) tuples GameState uses
+        kingRow, kingCol = SQUARES[kingSq]
+        self.pins = []
+        self.checks = []
+        while pinned:
+            bit = pinned & -pinned
+            pinned ^= bit
+            r, c = SQUARES[bit.bit_length() - 1]
+            self.pins.append((r, c, _sign(r - kingRow), _sign(c - kingCol)))
+        while checkers:
+            bit = checkers & -checkers
+            checkers ^= bit
+            r, c = SQUARES[bit.bit_length() - 1]
+            if bit & self.pieceBitboards[WN if self.whiteToMove else BN]:
+                self.checks.append((r, c, r - kingRow, c - kingCol))
+            else:
+                self.checks.append((r, c, _sign(r - kingRow), _sign(c - kingCol)))
+        self.inCheck = len(self.checks) > 0
+
+    """
+    Returns if the player is in check, a list of pins and a list of checks
+    """
+    def checkForPinsAndChecks(self):
+        kingSq, checkers, pinned = self._checkersAndPinned()
+        self._setPinsAndChecks(kingSq, checkers, pinned)
+        return self.inCheck, self.pins, self.checks
+
+    """
+    Pseudo legal captures and quiet moves of the side to move - pins, checks and the safety of the king's destination
+    are not looked at. MovePicker checks the legality of each move as it hands it out.
+    """
+    def getCaptureMoves(self):
+        return self.getPseudoLegalMoves(True)
+
+    def getQuietMoves(self):
+        return self.getPseudoLegalMoves(False)
+
+    def getPseudoLegalMoves(self, captures):
+        bbs = self.pieceBitboards
+        us = 0 if self.whiteToMove else 1
+        base = 6 * us
+        enemy = self.colourOccupancy[1 - us]
+        occupied = self.colourOccupancy[us] | enemy
+        empty = FULL ^ occupied
+        targetMask = enemy if captures else empty
+        board = self.board
+        moves = []
+        pawns = bbs[base]
+        if captures:
+            if us == 0:
+                pawnTargets = [0, 0, ((pawns & NOT_FILE_A) >> 9) & enemy, ((pawns & NOT_FILE_H) >> 7) & enemy]
+            else:
+                pawnTargets = [0, 0, ((pawns & NOT_FILE_A) << 7) & enemy, ((pawns & NOT_FILE_H) << 9) & enemy]
+        elif us == 0:
+            push = (pawns >> 8) & empty
+            pawnTargets = [push, ((push & ROW_5) >> 8) & empty, 0, 0]
+        else:
+            push = (pawns << 8) & empty
+            pawnTargets = [push, ((push & ROW_2) << 8) & empty, 0, 0]
+        for targets, offset in zip(pawnTargets, PAWN_OFFSETS[us]):
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                end = bit.bit_length() - 1
+                moves.append(Move(SQUARES[end + offset], SQUARES[end], board))
+        for kind in range(1, 6):
+            pieces = bbs[base + kind]
+            while pieces:
+                bit = pieces & -pieces
+                pieces ^= bit
+                sq = bit.bit_length() - 1
+                if kind == 1:
+                    targets = KNIGHT_ATTACKS[sq]
+                elif kind == 2:
+                    targets = BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]]
+                elif kind == 3:
+                    targets = ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]]
+                elif kind == 4:
+                    targets = BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]] | ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]]
+                else:
+                    targets = KING_ATTACKS[sq]
+                targets &= targetMask
+                start = SQUARES[sq]
+                while targets:
+                    bit = targets & -targets
+                    targets ^= bit
+                    moves.append(Move(start, SQUARES[bit.bit_length() - 1], board))
+        return moves
+
+    #All moves not taking check into consideration (pins from the last getValidMoves call are respected)
+    def getAllPossibleMoves(self):
+        moves = []
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if (piece[0] == "w" and self.whiteToMove) or (piece[0] == "b" and not self.whiteToMove):
+                    self._getPieceMoves(r, c, moves)
+        return moves
+
+    def _getPieceMoves(self, r, c, moves, kind=None):
+        sq = r * 8 + c
+        us = 0 if self.whiteToMove else 1
+        own = self.colourOccupancy[us]
+        enemy = self.colourOccupancy[1 - us]
+        occupied = own | enemy
+        kind = kind or self.board[r][c][1]
+        if kind == "p":
+            targets = self._pawnTargets(sq, us, FULL ^ occupied, enemy)
+        elif kind == "N":
+            targets = KNIGHT_ATTACKS[sq]
+        elif kind == "B":
+            targets = bishopAttacks(sq, occupied)
+        elif kind == "R":
+            targets = rookAttacks(sq, occupied)
+        elif kind == "Q":
+            targets = bishopAttacks(sq, occupied) | rookAttacks(sq, occupied)
+        else:
+            targets = KING_ATTACKS[sq]
+            occupiedNoKing = occupied ^ (1 << sq)
+            legal = 0
+            targets &= ~own
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                if not self.attackersTo(bit.bit_length() - 1, 1 - us, occupiedNoKing):
+                    legal |= bit
+            targets = legal
+        targets &= ~own
+        for pin in self.pins:
+            if pin[0] == r and pin[1] == c:
+                kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+                targets &= 0 if kind == "N" else LINE[kingRow * 8 + kingCol][sq]
+                break
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            moves.append(Move((r, c), SQUARES[bit.bit_length() - 1], self.board))
+
+    #Per piece generators with the same signatures as GameState (pins respected, checks ignored)
+    def getPawnMoves(self, r, c, moves):
+        self._getPieceMoves(r, c, moves, "p")
+
+    def getRookMoves(self, r, c, moves):
+        self._getPieceMoves(r, c, moves, "R")
+
+    def getBishopMoves(self, r, c, moves):
+        self._getPieceMoves(r, c, moves, "B")
+
+    def getKnightMoves(self, r, c, moves):
+        self._getPieceMoves(r, c, moves, "N")
+
+    def getQueenMoves(self, r, c, moves):
+        self._getPieceMoves(r, c, moves, "Q")
+
+    def getKingMoves(self, r, c, moves):
+        self._getPieceMoves(r, c, moves, "K")
@@ -0,0 +1,373 @@
+"""
+The engine's search. Runs a negamax alpha-beta search with iterative deepening over any game state with the
+GameState interface (getValidMoves, makeMove, undoMove), so it works with both ChessEngine.GameState and
+BitboardEngine.BitboardGameState.
+Run from the ChessEngine folder:
+    python -m Chess.ChessAI [--fen FEN] [--movetime MS] [--depth N] [--bitboard] [--hash MB] [--workers N]
+                            [--tablebases DIR]
+"""
+
+import argparse
+import multiprocessing
+import time
+from Chess import ChessEngine, BitboardEngine
+from Chess.Evaluation import evaluate
+from Chess.MovePicker import MovePicker, pieceScore
+from Chess.Tablebase import Tablebase, MAX_DISTANCE
+from Chess.TranspositionTable import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+
+CHECKMATE = 100000 #score of being mated at the root, mates further away score closer to zero
+STALEMATE = 0
+MAX_DEPTH = 64
+#scores beyond this are mates, found by the search or by a tablebase probe up to MAX_DISTANCE plies past its ply
+MATE_BOUND = CHECKMATE - MAX_DEPTH - MAX_DISTANCE
+TIME_CHECK_INTERVAL = 1024 #nodes searched between looking at the clock
+INFO_INTERVAL = 0.25 #seconds between progress reports to an infoCallback
+DEFAULT_HASH_MB = 16
+TABLEBASE_PHASE = 4 #a position with more material than a queen (Evaluation phase) is never in the tablebases
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchResult():
+    def __init__(self, bestMove, score, pv, depth, nodes, elapsed, workerNodes=None):
+        self.bestMove = bestMove #None if there are no legal moves
+        self.score = score #centipawns from the point of view of the side to move
+        self.pv = pv #principal variation, list of Move objects starting with bestMove
+        self.depth = depth #deepest iteration that was completed
+        self.nodes = nodes
+        self.elapsed = elapsed #seconds
+        self.workerNodes = workerNodes #nodes searched by each worker of a parallel search, None for a single process
+
+    def nodesPerSecond(self):
+        return int(self.nodes / self.elapsed) if self.elapsed > 0 else 0
+
+
+"""
+Mate scores count plies from the root, but a transposition table entry can be reached at any ply, so they are stored
+relative to the node they were found at and converted back when probed.
+"""
+def scoreToTT(score, ply):
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def scoreFromTT(score, ply):
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+"""
+Orders moves so the alpha-beta window closes early: the hash move (or the principal variation move from the previous
+iteration) first, then captures with the most valuable victim and least valuable attacker, then the quiet moves.
+"""
+def orderMoves(moves, firstMoveID=None):
+    def moveOrder(move):
+        if move.moveID == firstMoveID:
+            return -100000
+        if move.pieceCaptured != "--":
+            return -(10 * pieceScore[move.pieceCaptured[1]] - pieceScore[move.pieceMoved[1]])
+        return 0
+    moves.sort(key=moveOrder)
+    return moves
+
+
+class Searcher():
+    def __init__(self, gs, timeLimitMs=1000, maxDepth=MAX_DEPTH, tt=None, rootMoveIDs=None, stopEvent=None,
+                 infoCallback=None, nodeLimit=None, tablebase=None):
+        self.gs = gs
+        self.timeLimitMs = timeLimitMs
+        self.maxDepth = maxDepth
+        self.nodeLimit = nodeLimit #stop after searching this many nodes, None for no limit
+        self.tt = tt if tt is not None else TranspositionTable(DEFAULT_HASH_MB)
+        self.rootMoveIDs = rootMoveIDs #only search these root moves (by moveID), None for all of them
+        #anything with is_set() (threading or multiprocessing Event), the search stops as soon as it is set
+        self.stopEvent = stopEvent
+        #called with a SearchResult after every iteration and every INFO_INTERVAL seconds in between, where the
+        #in-between reports carry the depth being searched and the best move of the last completed iteration
+        self.infoCallback = infoCallback
+        self.tablebase = tablebase #Tablebase probed for exact scores once few enough pieces are left, None to not probe
+        self.nodes = 0
+        self.nextCheck = TIME_CHECK_INTERVAL #node count at which to next look at the clock and the limits
+        self.deadline = None
+        self.start = 0.0
+        self.depth = 0 #iteration in progress
+        self.result = None #result of the deepest completed iteration
+        self.lastInfo = 0.0
+        self.pvTable = [[] for _ in range(MAX_DEPTH + 1)]
+        self.previousPV = []
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)] #two most recent quiet cutoff moves per ply
+        self.history = [[0] * 4096, [0] * 4096] #per side, moveID -> how often it caused a cutoff, weighted by depth
+        self.iterations = [] #SearchResult of every completed iteration, shallowest first
+
+    """
+    Iterative deepening: searches depth 1, 2, 3, ... until the time budget or maxDepth runs out and returns the result
+    of the deepest completed iteration. The game state is left exactly as it was passed in.
+    """
+    def search(self):
+        gs = self.gs
+        start = time.perf_counter()
+        self.deadline = start + self.timeLimitMs / 1000 if self.timeLimitMs is not None else None
+        self.nodes = 0
+        self.nextCheck = min(TIME_CHECK_INTERVAL, self.nodeLimit) if self.nodeLimit is not None else TIME_CHECK_INTERVAL
+        self.iterations = []
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+        self.history = [[0] * 4096, [0] * 4096]
+        self.tt.newSearch()
+        rootMoves = gs.getValidMoves()
+        if len(rootMoves) == 0:
+            return SearchResult(None, -CHECKMATE if gs.checkMate else STALEMATE, [], 0, 0, 0.0)
+        if self.rootMoveIDs is not None:
+            rootMoves = [move for move in rootMoves if move.moveID in self.rootMoveIDs]
+            if len(rootMoves) == 0:
+                return SearchResult(None, -CHECKMATE - 1, [], 0, 0, 0.0)
+        result = SearchResult(rootMoves[0], 0, [rootMoves[0]], 0, 0, 0.0)
+        self.start = self.lastInfo = start
+        self.result = result
+        rootLength = len(gs.moveLog)
+        for depth in range(1, min(self.maxDepth, MAX_DEPTH) + 1):
+            self.depth = depth
+            try:
+                score = self.negamax(depth, -CHECKMATE - 1, CHECKMATE + 1, 0)
+            except SearchTimeout:
+                while len(gs.moveLog) > rootLength: #unwind the moves of the interrupted iteration
+                    gs.undoMove()
+                break
+            self.previousPV = self.pvTable[0][:]
+            result = SearchResult(self.previousPV[0], score, self.previousPV, depth, self.nodes,
+                                  time.perf_counter() - start)
+            self.iterations.append(result)
+            self.result = result
+            if self.infoCallback is not None:
+                self.infoCallback(result)
+            if abs(score) >= MATE_BOUND: #found a forced mate, searching deeper won't change it
+                break
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - start
+        gs.getValidMoves() #restore the root's check and mate flags
+        return result
+
+    def checkTime(self):
+        now = time.perf_counter()
+        if (self.deadline is not None and now >= self.deadline) or (self.stopEvent is not None and self.stopEvent.is_set()):
+            raise SearchTimeout()
+        self.nextCheck = self.nodes + TIME_CHECK_INTERVAL
+        if self.nodeLimit is not None:
+            if self.nodes >= self.nodeLimit:
+                raise SearchTimeout()
+            self.nextCheck = min(self.nextCheck, self.nodeLimit)
+        if self.infoCallback is not None and now - self.lastInfo >= INFO_INTERVAL:
+            self.lastInfo = now
+            result = self.result
+            self.infoCallback(SearchResult(result.bestMove, result.score, result.pv, self.depth, self.nodes,
+                                           now - self.start))
+
+    def negamax(self, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes >= self.nextCheck:
+            self.checkTime()
+        self.pvTable[ply] = []
+        if depth == 0:
+            return self.quiescence(alpha, beta, ply)
+        gs = self.gs
+        if self.tablebase is not None and ply > 0 and gs.phase <= TABLEBASE_PHASE:
+            result = self.tablebase.probe(gs)
+            if result is not None:
+                wdl, distance = result
+                return 0 if wdl == 0 else wdl * (CHECKMATE - ply - distance)
+        key = gs.zobristKey
+        entry = self.tt.probe(key)
+        hashMoveID = None
+        if entry is not None:
+            entryDepth, entryScore, boundType, hashMoveID = entry
+            if entryDepth >= depth and ply > 0:
+                entryScore = scoreFromTT(entryScore, ply)
+                if boundType == EXACT or (boundType == LOWER_BOUND and entryScore >= beta) or \
+                        (boundType == UPPER_BOUND and entryScore <= alpha):
+                    return entryScore
+        if not hashMoveID and ply < len(self.previousPV):
+            hashMoveID = self.previousPV[ply].moveID
+        originalAlpha = alpha
+        bestScore = -CHECKMATE - 1
+        bestMove = None
+        rootMoveIDs = self.rootMoveIDs if ply == 0 else None
+        killers = self.killers[ply]
+        history = self.history[0 if gs.whiteToMove else 1]
+        picker = MovePicker(gs, hashMoveID, killers, history)
+        for move in picker:
+            if rootMoveIDs is not None and move.moveID not in rootMoveIDs:
+                continue
+            gs.makeMove(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            gs.undoMove()
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+                if score > alpha:
+                    alpha = score
+                    self.pvTable[ply] = [move] + self.pvTable[ply + 1]
+                    if alpha >= beta:
+                        if move.pieceCaptured == "--":
+                            if killers[0] != move.moveID:
+                                killers[1] = killers[0]
+                                killers[0] = move.moveID
+                            history[move.moveID] += depth * depth
+                        break
+        if picker.legalMoves == 0:
+            return -CHECKMATE + ply if picker.inCheck else STALEMATE
+        if bestScore <= originalAlpha:
+            boundType = UPPER_BOUND
+        elif bestScore >= beta:
+            boundType = LOWER_BOUND
+        else:
+            boundType = EXACT
+        self.tt.store(key, depth, scoreToTT(bestScore, ply), boundType, bestMove.moveID)
+        return bestScore
+
+    """
+    Searches captures only until the position is quiet so the static evaluation isn't taken in the middle of an exchange
+    """
+    def quiescence(self, alpha, beta, ply):
+        standPat = evaluate(self.gs)
+        if standPat >= beta or ply >= MAX_DEPTH:
+            return standPat
+        if standPat > alpha:
+            alpha = standPat
+        gs = self.gs
+        for move in MovePicker(gs, capturesOnly=True):
+            self.nodes += 1
+            if self.nodes >= self.nextCheck:
+                self.checkTime()
+            gs.makeMove(move)
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            gs.undoMove()
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return alpha
+
+
+"""
+Searches the position for at most timeLimitMs milliseconds (None for no limit) and maxDepth plies.
+Pass the same TranspositionTable to consecutive searches to keep what was learned between moves, and a Tablebase to
+score the endings it covers exactly.
+Returns a SearchResult with the best move, score, principal variation, depth reached and nodes searched.
+"""
+def findBestMove(gs, timeLimitMs=1000, maxDepth=MAX_DEPTH, tt=None, tablebase=None):
+    return Searcher(gs, timeLimitMs, maxDepth, tt, tablebase=tablebase).search()
+
+
+"""
+Entry point of a background search process, as started by ChessMain. Searches the position given as a FEN and puts
+("info", depth, score, nodes, nodesPerSecond) tuples on returnQueue while it runs and ("bestmove", moveID) once it is
+done (moveID is None when there is no legal move). Setting stopEvent ends the search early with the best move so far.
+tablebaseDirectory is a folder of Tablebase files to probe during the search, None for none.
+"""
+def searchProcess(fen, bitboard, timeLimitMs, maxDepth, returnQueue, stopEvent, tablebaseDirectory=None):
+    gs = BitboardEngine.BitboardGameState() if bitboard else ChessEngine.GameState()
+    gs.loadFEN(fen)
+    tablebase = Tablebase(tablebaseDirectory) if tablebaseDirectory is not None else None
+
+    def report(result):
+        returnQueue.put(("info", result.depth, result.score, result.nodes, result.nodesPerSecond()))
+
+    result = Searcher(gs, timeLimitMs, maxDepth, stopEvent=stopEvent, infoCallback=report,
+                      tablebase=tablebase).search()
+    returnQueue.put(("bestmove", result.bestMove.moveID if result.bestMove else None))
+
+
+def _searchRootMoves(task):
+    #runs in a worker process on its own copy of the position
+    fen, bitboard, rootMoveIDs, timeLimitMs, maxDepth, hashMB = task
+    gs = BitboardEngine.BitboardGameState() if bitboard else ChessEngine.GameState()
+    gs.loadFEN(fen)
+    searcher = Searcher(gs, timeLimitMs, maxDepth, TranspositionTable(hashMB), rootMoveIDs)
+    result = searcher.search()
+    return searcher.iterations, result.nodes
+
+
+"""
+Parallel search by splitting the root moves: the ordered root moves are dealt out round-robin to the workers, every
+worker runs its own iterative deepening search over its share on its own copy of the position and transposition
+table, and the best move is taken from the deepest iteration all workers completed (or the quickest forced mate any
+of them found). Pass a multiprocessing.Pool to reuse the worker processes between searches.
+The returned SearchResult has the node count of every worker in workerNodes.
+"""
+def findBestMoveParallel(gs, timeLimitMs=1000, maxDepth=MAX_DEPTH, workers=None, pool=None, hashMB=DEFAULT_HASH_MB):
+    start = time.perf_counter()
+    workers = workers or multiprocessing.cpu_count()
+    rootMoves = orderMoves(gs.getValidMoves())
+    if len(rootMoves) <= 1 or workers == 1:
+        result = findBestMove(gs, timeLimitMs, maxDepth, TranspositionTable(hashMB))
+        result.workerNodes = [result.nodes]
+        return result
+    workers = min(workers, len(rootMoves))
+    fen = gs.getFEN()
+    bitboard = isinstance(gs, BitboardEngine.BitboardGameState)
+    tasks = [(fen, bitboard, {move.moveID for move in rootMoves[i::workers]}, timeLimitMs, maxDepth, hashMB)
+             for i in range(workers)]
+    if pool is None:
+        with multiprocessing.Pool(workers) as ownPool:
+            outcomes = ownPool.map(_searchRootMoves, tasks, chunksize=1)
+    else:
+        outcomes = pool.map(_searchRootMoves, tasks, chunksize=1)
+
+    workerNodes = [nodes for _, nodes in outcomes]
+    finished = [iterations for iterations, _ in outcomes if iterations]
+    mates = [iterations[-1] for iterations in finished if iterations[-1].score >= MATE_BOUND]
+    if mates:
+        best = max(mates, key=lambda result: result.score)
+    elif finished:
+        #a worker whose moves are all mated stops deepening early, leave it out so it can't cap everyone's depth
+        surviving = [iterations for iterations in finished if iterations[-1].score > -MATE_BOUND] or finished
+        depth = min(len(iterations) for iterations in surviving)
+        best = max((iterations[min(depth, len(iterations)) - 1] for iterations in finished),
+                   key=lambda result: result.score)
+    else: #no worker finished a single iteration
+        best = SearchResult(rootMoves[0], 0, [rootMoves[0]], 0, 0, 0.0)
+    #moves were rebuilt in the workers, hand back the caller's own Move objects for the root
+    bestMove = next(move for move in rootMoves if move.moveID == best.bestMove.moveID)
+    return SearchResult(bestMove, best.score, [bestMove] + best.pv[1:], best.depth, sum(workerNodes),
+                        time.perf_counter() - start, workerNodes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search a position with the engine")
+    parser.add_argument("--fen", default=ChessEngine.START_FEN)
+    parser.add_argument("--movetime", type=int, default=1000, help="time budget in milliseconds")
+    parser.add_argument("--depth", type=int, default=MAX_DEPTH)
+    parser.add_argument("--bitboard", action="store_true", help="search on BitboardGameState")
+    parser.add_argument("--hash", type=int, default=DEFAULT_HASH_MB, help="transposition table size in MB")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for a root split parallel search")
+    parser.add_argument("--tablebases", metavar="DIR", help="probe the endgame tablebases in DIR (single worker only)")
+    args = parser.parse_args()
+
+    gs = BitboardEngine.BitboardGameState() if args.bitboard else ChessEngine.GameState()
+    gs.loadFEN(args.fen)
+    if args.workers > 1:
+        result = findBestMoveParallel(gs, args.movetime, args.depth, args.workers, hashMB=args.hash)
+    else:
+        tt = TranspositionTable(args.hash)
+        tablebase = Tablebase(args.tablebases) if args.tablebases else None
+        result = findBestMove(gs, args.movetime, args.depth, tt, tablebase)
+    print("depth %d score %d nodes %d nps %d time %.3f" %
+          (result.depth, result.score, result.nodes, result.nodesPerSecond(), result.elapsed))
+    print("pv " + " ".join(move.getUCINotation() for move in result.pv))
+    if args.workers > 1:
+        print("worker nodes " + " ".join(str(nodes) for nodes in result.workerNodes))
+    else:
+        print(tt.statsReport())
+    print("bestmove " + (result.bestMove.getUCINotation() if result.bestMove else "(none)"))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,10 @@ Also responsible for the valid moves in the current state.
 Also keeps a move log.
 """
 
+from Chess import Zobrist
+from Chess.Evaluation import MG_TABLES, EG_TABLES, PHASE, evaluateBoard
+from Chess.AttackTables import DIRECTIONS, OPPOSITE, RAYS, KNIGHT_TARGETS, KING_TARGETS, SQUARES_BETWEEN
+
 
 class GameState():
     def __init__(self):
@@ -29,6 +33,32 @@ class GameState():
         self.checks = []
         self.checkMate = False
         self.staleMate = False
+        self.attackedSquares = None #squares the side not to move attacks, built on demand and cleared by every move
+        self.zobristKey = Zobrist.hashBoard(self.board, self.whiteToMove) #position identity, updated by every move
+        #middlegame and endgame scores (white positive) and game phase, also updated by every move, see Evaluation
+        self.mgScore, self.egScore, self.phase = evaluateBoard(self.board)
+
+    #Sets up the position from a FEN string. Castling and en passant fields are ignored since those moves aren't supported
+    def loadFEN(self, fen):
+        self.board, self.whiteToMove = parseFEN(fen)
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] == "wK":
+                    self.whiteKingLocation = (r, c)
+                elif self.board[r][c] == "bK":
+                    self.blackKingLocation = (r, c)
+        self.moveLog = []
+        self.inCheck = False
+        self.pins = []
+        self.checks = []
+        self.checkMate = False
+        self.staleMate = False
+        self.attackedSquares = None
+        self.zobristKey = Zobrist.hashBoard(self.board, self.whiteToMove)
+        self.mgScore, self.egScore, self.phase = evaluateBoard(self.board)
+
+    def getFEN(self):
+        return boardToFEN(self.board, self.whiteToMove)
 
     #will not work for moves like en passant, castling and pawn promotion.
     def makeMove(self, move):
@@ -41,6 +71,15 @@ class GameState():
         elif move.pieceMoved == "bK":
             self.blackKingLocation = (move.endRow, move.endCol)
         self.whiteToMove = not self.whiteToMove #switch turns
+        self.attackedSquares = None
+        self.zobristKey ^= Zobrist.moveKey(move)
+        end = move.moveID >> 6
+        self.mgScore += MG_TABLES[move.pieceMoved][end] - MG_TABLES[move.pieceMoved][move.moveID & 63]
+        self.egScore += EG_TABLES[move.pieceMoved][end] - EG_TABLES[move.pieceMoved][move.moveID & 63]
+        if move.pieceCaptured != "--":
+            self.mgScore -= MG_TABLES[move.pieceCaptured][end]
+            self.egScore -= EG_TABLES[move.pieceCaptured][end]
+            self.phase -= PHASE[move.pieceCaptured]
 
     #Undo move using key Z
     def undoMove(self):
@@ -56,6 +95,15 @@ class GameState():
             self.whiteToMove = not self.whiteToMove
             self.checkMate = False
             self.staleMate = False
+            self.attackedSquares = None
+            self.zobristKey ^= Zobrist.moveKey(move)
+            end = move.moveID >> 6
+            self.mgScore -= MG_TABLES[move.pieceMoved][end] - MG_TABLES[move.pieceMoved][move.moveID & 63]
+            self.egScore -= EG_TABLES[move.pieceMoved][end] - EG_TABLES[move.pieceMoved][move.moveID & 63]
+            if move.pieceCaptured != "--":
+                self.mgScore += MG_TABLES[move.pieceCaptured][end]
+                self.egScore += EG_TABLES[move.pieceCaptured][end]
+                self.phase += PHASE[move.pieceCaptured]
 
     #All moves considering the check
     def getValidMoves(self):
@@ -69,27 +117,13 @@ class GameState():
             kingCol = self.blackKingLocation[1]
         if self.inCheck:
             if len(self.checks) == 1: #only 1 check, block check or move king
-                moves = self.getAllPossibleMoves()
-                #to block a check you must move a piece into one of the squares between enemy piece and king
-                check = self.checks[0] #check information
-                checkRow = check[0]
-                checkCol = check[1]
-                pieceChecking = self.board[checkRow][checkCol] #enemy piece causing the check
-                validSquares = [] #squares that pieces can move to
-                #if knight, must capture the knight or move the king. other pieces can be blocked
-                if pieceChecking[1] == "N":
-                    validSquares = [(checkRow, checkCol)] #Knight's position
-                else:
-                    for i in range(1, 8):
-                        validSquare = (kingRow + check[2]*i, kingCol + check[3]*i) #check[2] and check[3] are the check directions
-                        validSquares.append(validSquare)
-                        if validSquare[0] == checkRow and validSquare[1] == checkCol: #once you get to piece and checks
-                            break
-                #get rid of any moves that don't block check or move king
-                for i in range(len(moves) - 1, -1, -1): #go through the moves list backwards since we are removing from a list while iterating on it
-                    if moves[i].pieceMoved[1] != 'K': #move doesn't move king so it must block or capture
-                        if not (moves[i].endRow, moves[i].endCol) in validSquares: #move doesn't block OR capture piece
-                            moves.remove(moves[i])
+                self.getKingMoves(kingRow, kingCol, moves)
+                #otherwise a piece has to capture the checking piece or move onto a square between it and the king.
+                #a knight's or pawn's check can't be blocked, and squares between are only found for sliding pieces
+                checkRow, checkCol = self.checks[0][0], self.checks[0][1]
+                self.getMovesTo(checkRow, checkCol, moves)
+                for blockRow, blockCol in SQUARES_BETWEEN[kingRow * 8 + kingCol][checkRow * 8 + checkCol]:
+                    self.getMovesTo(blockRow, blockCol, moves)
             else: #double check, king HAS to move
                 self.getKingMoves(kingRow, kingCol, moves)
         else: #not in check so all moves are fine
@@ -127,6 +161,61 @@ class GameState():
                         self.getKingMoves(r,c, moves)
         return moves
 
+    """
+    Pseudo legal captures and quiet moves of the side to move - pins, checks and the safety of the king's destination
+    are not looked at. They are generated separately so the search can try the captures before paying for the quiet
+    moves, and MovePicker checks the legality of each move as it hands it out.
+    """
+    def getCaptureMoves(self):
+        return self.getPseudoLegalMoves(True)
+
+    def getQuietMoves(self):
+        return self.getPseudoLegalMoves(False)
+
+    def getPseudoLegalMoves(self, captures):
+        moves = []
+        board = self.board
+        if self.whiteToMove:
+            allyColor, enemyColor, forward, pawnRow = "w", "b", -1, 6
+        else:
+            allyColor, enemyColor, forward, pawnRow = "b", "w", 1, 1
+        for r in range(8):
+            for c in range(8):
+                piece = board[r][c]
+                if piece[0] != allyColor:
+                    continue
+                type = piece[1]
+                if type == 'p':
+                    endRow = r + forward
+                    if not 0 <= endRow < 8: #no promotion, so a pawn on the last row is stuck
+                        continue
+                    if captures:
+                        for endCol in (c - 1, c + 1):
+                            if 0 <= endCol < 8 and board[endRow][endCol][0] == enemyColor:
+                                moves.append(Move((r, c), (endRow, endCol), board))
+                    elif board[endRow][c] == "--":
+                        moves.append(Move((r, c), (endRow, c), board))
+                        if r == pawnRow and board[endRow + forward][c] == "--":
+                            moves.append(Move((r, c), (endRow + forward, c), board))
+                elif type == 'N' or type == 'K':
+                    for endRow, endCol in (KNIGHT_TARGETS if type == 'N' else KING_TARGETS)[r * 8 + c]:
+                        endPiece = board[endRow][endCol]
+                        if (endPiece[0] == enemyColor) if captures else (endPiece == "--"):
+                            moves.append(Move((r, c), (endRow, endCol), board))
+                else:
+                    rays = RAYS[r * 8 + c]
+                    for d in (range(4) if type == 'R' else range(4, 8) if type == 'B' else range(8)):
+                        for endRow, endCol in rays[d]:
+                            endPiece = board[endRow][endCol]
+                            if endPiece == "--":
+                                if not captures:
+                                    moves.append(Move((r, c), (endRow, endCol), board))
+                            else:
+                                if captures and endPiece[0] == enemyColor:
+                                    moves.append(Move((r, c), (endRow, endCol), board))
+                                break
+        return moves
+
 
 #Get all the pawn moves for the pawn located at row r and col c and add those moves to list
     def getPawnMoves(self, r, c, moves):
@@ -142,7 +231,7 @@ class GameState():
         if self.whiteToMove: #white pawn moves
             if r-1>=0:
                 if self.board[r-1][c] == "--": #1 move ahead of pawn is valid or not
-                    if not piecePinned or pinDirection == (-1, 0):
+                    if not piecePinned or pinDirection == (-1, 0) or pinDirection == (1, 0): #pushing along a file pin is fine
                         moves.append(Move((r, c), (r-1, c), self.board))
                         if r == 6 and self.board[r-2][c] == "--":
                             moves.append(Move((r, c), (r - 2, c), self.board))
@@ -155,7 +244,7 @@ class GameState():
         else: #black pawn moves
             if r+1<=7:
                 if self.board[r+1][c] == "--": #1 move ahead of pawn is valid or not
-                    if not piecePinned or pinDirection == (1, 0):
+                    if not piecePinned or pinDirection == (1, 0) or pinDirection == (-1, 0): #pushing along a file pin is fine
                         moves.append(Move((r, c), (r+1, c), self.board))
                         if r == 1 and self.board[r+2][c] == "--":
                             moves.append(Move((r, c), (r + 2, c), self.board))
@@ -178,22 +267,21 @@ class GameState():
                     self.pins.remove(self.pins[i])
                 break
         opposingTeam = "b" if self.whiteToMove else "w"
-        directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]  # Up, Down, Left, Right
-
-        for d in directions:
-            i, j = r + d[0], c + d[1]
-            while 0 <= i < 8 and 0 <= j < 8:
-                if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                    currentSquare = self.board[i][j]
-                    if currentSquare == "--":
-                        moves.append(Move((r, c), (i, j), self.board))
-                    elif currentSquare[0] == opposingTeam:
-                        moves.append(Move((r, c), (i, j), self.board))
-                        break  # Can't move past captured piece
-                    else:
-                        break  # Blocked by own piece
-                i += d[0]
-                j += d[1]
+        board = self.board
+        rays = RAYS[r * 8 + c]
+
+        for d in range(4):  # Up, Left, Down, Right
+            if piecePinned and pinDirection != DIRECTIONS[d] and pinDirection != DIRECTIONS[OPPOSITE[d]]:
+                continue
+            for i, j in rays[d]:
+                currentSquare = board[i][j]
+                if currentSquare == "--":
+                    moves.append(Move((r, c), (i, j), board))
+                elif currentSquare[0] == opposingTeam:
+                    moves.append(Move((r, c), (i, j), board))
+                    break  # Can't move past captured piece
+                else:
+                    break  # Blocked by own piece
 
     # Get all the Bishop moves for the bishop located at row r and col c and add those moves to list
     def getBishopMoves(self, r, c, moves):
@@ -206,22 +294,21 @@ class GameState():
                 self.pins.remove(self.pins[i])
                 break
         opposingTeam = "b" if self.whiteToMove else "w"
-        directions = [(-1, -1), (-1, +1), (+1, +1), (+1, -1)]  # Diagonal directions
-
-        for d in directions:
-            i, j = r + d[0], c + d[1]
-            while 0 <= i < 8 and 0 <= j < 8:
-                if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                    currentSquare = self.board[i][j]
-                    if currentSquare == "--":
-                        moves.append(Move((r, c), (i, j), self.board))
-                    elif currentSquare[0] == opposingTeam:
-                        moves.append(Move((r, c), (i, j), self.board))
-                        break
-                    else:
-                        break
-                i += d[0]
-                j += d[1]
+        board = self.board
+        rays = RAYS[r * 8 + c]
+
+        for d in range(4, 8):  # Diagonal directions
+            if piecePinned and pinDirection != DIRECTIONS[d] and pinDirection != DIRECTIONS[OPPOSITE[d]]:
+                continue
+            for i, j in rays[d]:
+                currentSquare = board[i][j]
+                if currentSquare == "--":
+                    moves.append(Move((r, c), (i, j), board))
+                elif currentSquare[0] == opposingTeam:
+                    moves.append(Move((r, c), (i, j), board))
+                    break
+                else:
+                    break
 
 # Get all the Knight moves for the knight located at row r and col c and add those moves to list
     def getKnightMoves(self, r, c, moves):
@@ -233,15 +320,14 @@ class GameState():
                 pinDirection = (self.pins[i][2], self.pins[i][3])
                 self.pins.remove(self.pins[i])
                 break
+        if piecePinned: #a pinned knight can never move
+            return
         opposingTeam = "b" if self.whiteToMove else "w"
-        directions = [(-2, -1), (-2, +1), (-1, -2), (-1, +2), (+1, -2), (+1, +2), (+2, -1), (+2, +1)]  # Knight L directions
+        board = self.board
 
-        for d in directions:
-            i, j = r + d[0], c + d[1]
-            if 0<=i<8 and 0<=j<8:
-                if not piecePinned:
-                    if self.board[i][j] == "--" or self.board[i][j][0] == opposingTeam:
-                        moves.append(Move((r, c), (i, j), self.board))
+        for i, j in KNIGHT_TARGETS[r * 8 + c]:
+            if board[i][j] == "--" or board[i][j][0] == opposingTeam:
+                moves.append(Move((r, c), (i, j), board))
 
 # Get all the Queen moves for the queen located at row r and col c and add those moves to list
     def getQueenMoves(self, r, c, moves):
@@ -250,28 +336,88 @@ class GameState():
 
 # Get all the King moves for the king located at row r and col c and add those moves to list
     def getKingMoves(self, r, c, moves):
-        rowMoves = (-1, -1, -1, 0, 0, 1, 1, 1)
-        colMoves = (-1, 0, 1, -1, 1, -1, 0, 1)
         allyColor = "w" if self.whiteToMove else "b"
-        for i in range(8):
-            endRow = r + rowMoves[i]
-            endCol = c + colMoves[i]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor: #not an ally piece (empty or enemy piece)
-                    #place king on end square and check for checks
-                    if allyColor == "w":
-                        self.whiteKingLocation = (endRow, endCol)
-                    else:
-                        self.blackKingLocation = (endRow, endCol)
-                    inCheck, pins, checks = self.checkForPinsAndChecks()
-                    if not inCheck:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                    #place king back on original location
-                    if allyColor == "w":
-                        self.whiteKingLocation = (r, c)
-                    else:
-                        self.blackKingLocation = (r, c)
+        for endRow, endCol in KING_TARGETS[r * 8 + c]:
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] != allyColor: #not an ally piece (empty or enemy piece)
+                if self.attackedSquares is None: #built once per position, every other king square is a lookup
+                    self.attackedSquares = self.getAttackedSquares("b" if allyColor == "w" else "w")
+                if not self.attackedSquares[endRow][endCol]:
+                    moves.append(Move((r, c), (endRow, endCol), self.board))
+
+    """
+    Adds the moves of every non-king piece of the side to move that can go to (r, c), which is either empty or holds an
+    enemy piece. Only used to answer a check, so pinned pieces are skipped - a pinned piece can never block or capture
+    a checking piece without exposing its own king along the pin.
+    """
+    def getMovesTo(self, r, c, moves):
+        allyColor = "w" if self.whiteToMove else "b"
+        pinned = [(pin[0], pin[1]) for pin in self.pins]
+        target = self.board[r][c]
+        #pawns
+        pawn = allyColor + "p"
+        pawnRow = r + 1 if allyColor == "w" else r - 1 #row a pawn arrives from
+        if 0 <= pawnRow < 8:
+            if target == "--":
+                if self.board[pawnRow][c] == pawn:
+                    if (pawnRow, c) not in pinned:
+                        moves.append(Move((pawnRow, c), (r, c), self.board))
+                elif self.board[pawnRow][c] == "--" and ((allyColor == "w" and r == 4) or (allyColor == "b" and r == 3)):
+                    startRow = pawnRow + 1 if allyColor == "w" else pawnRow - 1 #double push from the pawn's first row
+                    if self.board[startRow][c] == pawn and (startRow, c) not in pinned:
+                        moves.append(Move((startRow, c), (r, c), self.board))
+            else:
+                for pawnCol in (c - 1, c + 1):
+                    if 0 <= pawnCol < 8 and self.board[pawnRow][pawnCol] == pawn and (pawnRow, pawnCol) not in pinned:
+                        moves.append(Move((pawnRow, pawnCol), (r, c), self.board))
+        #knights
+        for startRow, startCol in KNIGHT_TARGETS[r * 8 + c]:
+            if self.board[startRow][startCol] == allyColor + "N" and (startRow, startCol) not in pinned:
+                moves.append(Move((startRow, startCol), (r, c), self.board))
+        #sliding pieces - the first piece in each direction from the target square
+        rays = RAYS[r * 8 + c]
+        for j in range(8):
+            for startRow, startCol in rays[j]:
+                piece = self.board[startRow][startCol]
+                if piece != "--":
+                    if piece[0] == allyColor and (piece[1] == 'Q' or (j <= 3 and piece[1] == 'R') or (j >= 4 and piece[1] == 'B')):
+                        if (startRow, startCol) not in pinned:
+                            moves.append(Move((startRow, startCol), (r, c), self.board))
+                    break
+
+    """
+    Returns an 8x8 grid of booleans marking every square attacked by the pieces of the given colour.
+    The other side's king is looked through, so a king can't step back along the line of a checking rook or bishop.
+    """
+    def getAttackedSquares(self, colour):
+        attacked = [[False] * 8 for _ in range(8)]
+        enemyKing = ("b" if colour == "w" else "w") + "K"
+        pawnRow = -1 if colour == "w" else 1 #direction the pawns of this colour capture in
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece[0] != colour:
+                    continue
+                type = piece[1]
+                if type == 'p':
+                    endRow = r + pawnRow
+                    if 0 <= endRow < 8:
+                        if c - 1 >= 0:
+                            attacked[endRow][c - 1] = True
+                        if c + 1 <= 7:
+                            attacked[endRow][c + 1] = True
+                elif type == 'N' or type == 'K':
+                    for endRow, endCol in (KNIGHT_TARGETS if type == 'N' else KING_TARGETS)[r * 8 + c]:
+                        attacked[endRow][endCol] = True
+                else:
+                    rays = RAYS[r * 8 + c]
+                    for d in (range(4) if type == 'R' else range(4, 8) if type == 'B' else range(8)):
+                        for endRow, endCol in rays[d]:
+                            attacked[endRow][endCol] = True
+                            endPiece = self.board[endRow][endCol]
+                            if endPiece != "--" and endPiece != enemyKing: #blocked
+                                break
+        return attacked
 
 
     """
@@ -293,58 +439,57 @@ class GameState():
             startRow = self.blackKingLocation[0]
             startCol = self.blackKingLocation[1]
         #check outward from king for pins and checks, keep track of all pins
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1) )
-        for j in range(len(directions)):
-            d = directions[j]
+        rays = RAYS[startRow * 8 + startCol]
+        for j in range(8):
+            d = DIRECTIONS[j]
             possiblePin = () #reset possible pins
-            for i in range(1, 8):
-                endRow = startRow + d[0]*i
-                endCol = startCol + d[1]*i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == allyColor and endPiece[1] != 'K':
-                        if possiblePin == (): #1st allied piece could be pinned
-                            possiblePin = (endRow, endCol, d[0], d[1])
-                        else: #2nd allied piece so no pin and stop checking in this direction
-                            break
-                    elif endPiece[0] == enemyColor:
-                        type = endPiece[1]
-                        """
-                        5 possibilities here in this conditional:
-                        1. orthogonally away from king and piece is a rook
-                        2. diagonally away from king and piece is a bishop
-                        3. 1 square away diagonally from king and piece is a pawn
-                        4. any direction and piece is a Queen
-                        5. any direction 1 square away and piece is a king (this is necessary to prevent a king from moving to a square controlled by another king)
-                        """
-                        if (0<=j<=3 and type == 'R') or (4 <= j <= 7 and type == 'B') or (i == 1 and type == 'p' and ((enemyColor == 'w' and 6<=j<=7) or (enemyColor == 'b' and 4<=j<=5))) or \
-                                (type == 'Q') or (i==1 and type == 'K'):
-                            if possiblePin == (): #no piece blocking, so check
-                                inCheck = True
-                                checks.append((endRow, endCol, d[0], d[1]))
-                            else: #piece blocking so pin
-                                pins.append(possiblePin)
-                                break
-                        else: #enemy piece not applying check
+            for i, (endRow, endCol) in enumerate(rays[j], 1):
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == allyColor and endPiece[1] != 'K':
+                    if possiblePin == (): #1st allied piece could be pinned
+                        possiblePin = (endRow, endCol, d[0], d[1])
+                    else: #2nd allied piece so no pin and stop checking in this direction
+                        break
+                elif endPiece[0] == enemyColor:
+                    type = endPiece[1]
+                    """
+                    5 possibilities here in this conditional:
+                    1. orthogonally away from king and piece is a rook
+                    2. diagonally away from king and piece is a bishop
+                    3. 1 square away diagonally from king and piece is a pawn
+                    4. any direction and piece is a Queen
+                    5. any direction 1 square away and piece is a king (this is necessary to prevent a king from moving to a square controlled by another king)
+                    """
+                    if (0<=j<=3 and type == 'R') or (4 <= j <= 7 and type == 'B') or (i == 1 and type == 'p' and ((enemyColor == 'w' and 6<=j<=7) or (enemyColor == 'b' and 4<=j<=5))) or \
+                            (type == 'Q') or (i==1 and type == 'K'):
+                        if possiblePin == (): #no piece blocking, so check
+                            inCheck = True
+                            checks.append((endRow, endCol, d[0], d[1]))
+                            break #the checking piece shields anything behind it
+                        else: #piece blocking so pin
+                            pins.append(possiblePin)
                             break
-                else: #off board
-                    break
+                    else: #enemy piece not applying check
+                        break
         #now check for knight attacks
-        knightMoves = ((-2, -1), (-2, 1), (-1,-2), (-1, 2), (1, -2), (1,2), (2, -1), (2,1))
-        for m in knightMoves:
-            endRow = startRow + m[0]
-            endCol = startCol + m[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] == enemyColor and endPiece[1] == 'N': #enemy knight attacking king
-                    inCheck = True
-                    checks.append((endRow, endCol, m[0], m[1]))
+        for endRow, endCol in KNIGHT_TARGETS[startRow * 8 + startCol]:
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] == enemyColor and endPiece[1] == 'N': #enemy knight attacking king
+                inCheck = True
+                checks.append((endRow, endCol, endRow - startRow, endCol - startCol))
         return inCheck, pins, checks
 
 
 
 
+"""
+A move is created for every pseudo legal move the generators find, so it is kept small: __slots__ instead of a
+per-instance __dict__, and moveID packs the start and end squares into 12 bits (square = row * 8 + col) -
+bits 0-5 start square, bits 6-11 end square. moveID fits the 16 bit move field of the transposition table and
+is also the move's hash, so moves can be used as dictionary keys and looked up by ID.
+"""
 class Move():
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured", "moveID")
 
     #Mapping rows and cols to standard chess notations. example - a8 is black rook
     ranksToRows = { "1": 7, "2" : 6, "3" : 5, "4" : 4, "5" : 3, "6" : 2, "7" : 1, "8": 0}
@@ -352,21 +497,81 @@ class Move():
     filesToCols = { "a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v:k for k,v in filesToCols.items()}
     def __init__(self, startSq, endSq, board):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
-
+        self.startRow = startRow = startSq[0]
+        self.startCol = startCol = startSq[1]
+        self.endRow = endRow = endSq[0]
+        self.endCol = endCol = endSq[1]
+        self.pieceMoved = board[startRow][startCol]
+        self.pieceCaptured = board[endRow][endCol]
+        self.moveID = (startRow * 8 + startCol) | ((endRow * 8 + endCol) << 6)
 
     def __eq__(self, other):
         if isinstance(other, Move):
             return self.moveID == other.moveID
+        return NotImplemented
+
+    def __hash__(self):
+        return self.moveID
+
+    def startSquare(self):
+        return self.moveID & 63
+
+    def endSquare(self):
+        return self.moveID >> 6
 
     def getChessNotation(self):
         return self.pieceMoved + self.getRankFiles(self.endRow, self.endCol)
 
+    #Long algebraic notation as used by UCI and perft divide output, example - e2e4
+    def getUCINotation(self):
+        return self.getRankFiles(self.startRow, self.startCol) + self.getRankFiles(self.endRow, self.endCol)
+
     def getRankFiles(self, row, col):
-        return self.colsToFiles[col] + self.rowsToRanks[row]
\ No newline at end of file
+        return self.colsToFiles[col] + self.rowsToRanks[row]
+
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+"""
+Converts a FEN string into a board in the GameState format and whether it is white to move
+"""
+def parseFEN(fen):
+    fields = fen.split()
+    rows = fields[0].split("/")
+    if len(rows) != 8:
+        raise ValueError("Invalid FEN, expected 8 ranks: " + fen)
+    board = []
+    for rank in rows:
+        row = []
+        for char in rank:
+            if char.isdigit():
+                row.extend(["--"] * int(char))
+            elif char.lower() in "pnbrqk":
+                colour = "w" if char.isupper() else "b"
+                row.append(colour + ("p" if char.lower() == "p" else char.upper()))
+            else:
+                raise ValueError("Invalid FEN piece " + char + ": " + fen)
+        if len(row) != 8:
+            raise ValueError("Invalid FEN, rank does not have 8 squares: " + fen)
+        board.append(row)
+    whiteToMove = len(fields) < 2 or fields[1] == "w"
+    return board, whiteToMove
+
+
+def boardToFEN(board, whiteToMove):
+    rows = []
+    for row in board:
+        rank = ""
+        empty = 0
+        for piece in row:
+            if piece == "--":
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            rank += piece[1].upper() if piece[0] == "w" else piece[1].lower()
+        if empty:
+            rank += str(empty)
+        rows.append(rank)
+    return "/".join(rows) + (" w" if whiteToMove else " b") + " - - 0 1"
\ No newline at end of file
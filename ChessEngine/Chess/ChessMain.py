@@ -3,8 +3,12 @@ This is our main driver file. It is responsible for handling user input and disp
 """
 
 import pygame as p
-from Chess import ChessEngine
+from Chess import ChessEngine, BitboardEngine, ChessAI
+from Chess.OpeningBook import OpeningBook
+from Chess.Tablebase import Tablebase
 import math
+from multiprocessing import Process, Queue, Event
+import queue
 
 p.init()
 checkAlert = p.font.SysFont("Arial", 26, True).render("!", True, p.Color("red"))
@@ -12,8 +16,17 @@ WIDTH = HEIGHT = 512
 DIMENSION = 8 #Dimension of chess board = 8x8
 SQ_SIZE = HEIGHT // DIMENSION
 MAX_FPS = 15
+DIRTY_RECT_RENDERING = True #only repaint the squares that changed each frame instead of the whole window
+USE_BITBOARDS = False #play on the bitboard backed game state instead of the list based one
+AI_PLAYS_WHITE = False #let the engine move for white
+AI_PLAYS_BLACK = False #let the engine move for black
+AI_MOVE_TIME = 2000 #milliseconds the engine thinks per move
+BOOK_PATH = None #Polyglot .bin opening book the engine plays from while the position is in it, None for no book
+TABLEBASE_PATH = None #folder of endgame tables built by python -m Chess.Tablebase --build, None to not use them
 IMAGES = {}
 checkMateFont = p.font.SysFont("Arial", 42, True, False)
+thinkingFont = p.font.SysFont("Arial", 16, True, False)
+endGameFont = p.font.SysFont("Arial", 42, True, True)
 invalidOverlay = p.image.load("images/crossed out.png")
 invalidOverlay = p.transform.scale(invalidOverlay, (SQ_SIZE, SQ_SIZE))
 """
@@ -35,20 +48,33 @@ def main():
     screen = p.display.set_mode((WIDTH, HEIGHT))
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
-    gs = ChessEngine.GameState()
+    gs = BitboardEngine.BitboardGameState() if USE_BITBOARDS else ChessEngine.GameState()
     validMoves = gs.getValidMoves()
+    moveIndex = MoveIndex(gs, validMoves)
     moveMade = False #flag variable for when a valid move is made
     loadImages() #only once
+    renderer = BoardRenderer(screen) if DIRTY_RECT_RENDERING else None
+    book = OpeningBook(BOOK_PATH) if BOOK_PATH is not None else None
+    tablebase = Tablebase(TABLEBASE_PATH) if TABLEBASE_PATH is not None else None
     running = True
     sqSelected = ()
     player_clicks = []
     captureSq = []
     moveSq = []
+    #the engine searches in a separate process so the window keeps responding while it thinks
+    moveFinderProcess = None
+    returnQueue = None
+    stopEvent = None
+    thinkingInfo = None #(depth, nodes per second) of the search in progress
     while running:
+        humanTurn = not (AI_PLAYS_WHITE if gs.whiteToMove else AI_PLAYS_BLACK)
         for event in p.event.get():
             if event.type == p.QUIT:
                 running = False
-            elif not gs.checkMate and not gs.staleMate and event.type == p.MOUSEBUTTONDOWN:
+                if moveFinderProcess is not None:
+                    stopSearch(moveFinderProcess, stopEvent)
+                    moveFinderProcess = None
+            elif humanTurn and not gs.checkMate and not gs.staleMate and event.type == p.MOUSEBUTTONDOWN:
                 location = p.mouse.get_pos() #(x,y) of mouse
                 col = location[0] // SQ_SIZE
                 row = location[1] // SQ_SIZE
@@ -64,10 +90,10 @@ def main():
                     if len(player_clicks) == 2:
                         move = ChessEngine.Move(player_clicks[0], player_clicks[1], gs.board)
                         print(move.getChessNotation())
-                        for i in range(len(validMoves)):
-                            if move == validMoves[i]:
-                                gs.makeMove(validMoves[i])
-                                moveMade = True
+                        validMove = moveIndex.movesByID.get(move.moveID)
+                        if validMove is not None:
+                            gs.makeMove(validMove)
+                            moveMade = True
 
                         if not moveMade and move.pieceCaptured[0] == move.pieceMoved[0]:
                             sqSelected = (move.endRow, move.endCol)
@@ -84,44 +110,282 @@ def main():
                             sqSelected = ()
                             player_clicks = []
                         else:
-                            captureSq = []
-                            moveSq = []
-                            for move in validMoves:
-                                if move.startRow == sqSelected[0] and move.startCol == sqSelected[1]:
-                                    if (gs.whiteToMove and move.pieceCaptured[0] == "b") or (not gs.whiteToMove and move.pieceCaptured[0] == "w"):
-                                        captureSq.append((move.endRow, move.endCol))
-                                    elif move.pieceCaptured == "--":
-                                        moveSq.append((move.endRow, move.endCol))
+                            captureSq = moveIndex.getCaptureSquares(sqSelected)
+                            moveSq = moveIndex.getMoveSquares(sqSelected)
 
+            elif event.type == p.VIDEOEXPOSE and renderer is not None: #window contents were lost, paint everything
+                renderer.invalidate()
             elif event.type == p.KEYDOWN:
                 if event.key == p.K_z: #user pressed Z key
-                    gs.undoMove()
-                    moveMade = True
+                    if moveFinderProcess is not None: #cancel the search, its position is about to change
+                        stopSearch(moveFinderProcess, stopEvent)
+                        moveFinderProcess = None
+                        thinkingInfo = None
+                    #against the engine take back its reply too, or it would just play it again
+                    undoPlies = 2 if humanTurn and AI_PLAYS_WHITE != AI_PLAYS_BLACK else 1
+                    for _ in range(min(undoPlies, len(gs.moveLog))):
+                        gs.undoMove()
+                    humanTurn = not (AI_PLAYS_WHITE if gs.whiteToMove else AI_PLAYS_BLACK)
+                    #rebuilt now rather than at the end of the frame, the engine may move below in this same frame
+                    validMoves = gs.getValidMoves()
+                    moveIndex = MoveIndex(gs, validMoves)
                     sqSelected = ()
                     player_clicks = []
                     captureSq = []
                     moveSq = []
 
+        #engine's turn: start a search, then pick up its progress and result without waiting for it
+        if running and not humanTurn and not gs.checkMate and not gs.staleMate:
+            bookMove = book.pickMove(gs) if book is not None and moveFinderProcess is None else None
+            if bookMove is None and tablebase is not None and moveFinderProcess is None:
+                bookMove = tablebase.bestMove(gs) #an ending the tables know the perfect move of
+            #a move the index doesn't know (an odd book entry) is ignored and the engine searches instead
+            bookMove = moveIndex.movesByID.get(bookMove.moveID) if bookMove is not None else None
+            if bookMove is not None: #still in the opening book or in the tablebases, nothing to think about
+                gs.makeMove(bookMove)
+                moveMade = True
+            else:
+                if moveFinderProcess is None:
+                    returnQueue = Queue()
+                    stopEvent = Event()
+                    moveFinderProcess = Process(target=ChessAI.searchProcess, args=(gs.getFEN(), USE_BITBOARDS,
+                                                AI_MOVE_TIME, ChessAI.MAX_DEPTH, returnQueue, stopEvent,
+                                                TABLEBASE_PATH))
+                    moveFinderProcess.start()
+                    thinkingInfo = (0, 0)
+                try:
+                    while True:
+                        message = returnQueue.get_nowait()
+                        if message[0] == "info":
+                            thinkingInfo = (message[1], message[4])
+                        else:
+                            move = moveIndex.movesByID.get(message[1])
+                            if move is not None:
+                                gs.makeMove(move)
+                                moveMade = True
+                            moveFinderProcess.join()
+                            moveFinderProcess = None
+                            thinkingInfo = None
+                            break
+                except queue.Empty:
+                    pass
+
         if moveMade:
             validMoves = gs.getValidMoves()
+            moveIndex = MoveIndex(gs, validMoves)
             moveMade = False
 
         clock.tick(MAX_FPS)
-        p.display.flip()
-        drawGameState(screen, gs, captureSq, moveSq, sqSelected, frameCount, validMoves)
+        overlays = []
         if gs.checkMate:
-            text = "Black wins by checkmate!" if gs.whiteToMove else "White wins by checkmate!"
-            drawText(screen, text)
+            overlays.append(textOverlay("Black wins by checkmate!" if gs.whiteToMove else "White wins by checkmate!"))
         elif gs.staleMate:
-            drawText(screen, "Stalemate")
+            overlays.append(textOverlay("Stalemate"))
+        if thinkingInfo is not None:
+            overlays.append(thinkingOverlay(thinkingInfo))
+        if renderer is not None:
+            renderer.draw(gs, captureSq, moveSq, sqSelected, frameCount, moveIndex, overlays)
+        else:
+            p.display.flip()
+            drawGameState(screen, gs, captureSq, moveSq, sqSelected, frameCount, moveIndex)
+            for _, textObject, textLocation in overlays:
+                screen.blit(textObject, textLocation)
 
         frameCount += 1
 
-def drawGameState(screen, gs, captureSq, moveSq, sqSelected, frameCount, validMoves):
+"""
+Asks a background search to stop and waits for its process to end, killing it if it doesn't stop in time
+"""
+def stopSearch(process, stopEvent):
+    stopEvent.set()
+    process.join(1)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+
+"""
+The legal moves of the current position indexed for the GUI, built once per position instead of scanning validMoves
+every click and frame: movesByID finds the move for a pair of clicked squares, and the capture, move and crossed out
+target squares of every piece are looked up by its square. The crossed out squares (where the piece could go if it
+weren't for checks and pins) need move generation, so they are only worked out the first time a piece is selected.
+"""
+class MoveIndex():
+    def __init__(self, gs, validMoves):
+        self.gs = gs
+        self.movesByID = {move.moveID: move for move in validMoves}
+        self.captureSquares = {}
+        self.moveSquares = {}
+        self.invalidSquares = {}
+        for move in validMoves:
+            start = (move.startRow, move.startCol)
+            if move.pieceCaptured == "--":
+                self.moveSquares.setdefault(start, set()).add((move.endRow, move.endCol))
+            else:
+                self.captureSquares.setdefault(start, set()).add((move.endRow, move.endCol))
+
+    def getCaptureSquares(self, sq):
+        return self.captureSquares.get(sq, set())
+
+    def getMoveSquares(self, sq):
+        return self.moveSquares.get(sq, set())
+
+    def getInvalidSquares(self, sq):
+        if sq == ():
+            return set()
+        if sq not in self.invalidSquares:
+            self.invalidSquares[sq] = self.findInvalidSquares(sq)
+        return self.invalidSquares[sq]
+
+    def findInvalidSquares(self, sq):
+        gs = self.gs
+        r, c = sq
+        piece = gs.board[r][c]
+
+        if piece == "--" or (piece[0] == 'w' and not gs.whiteToMove) or (piece[0] == 'b' and gs.whiteToMove):
+            return set()  # Don't show overlay if invalid piece is selected
+
+        # Get all possible moves for this piece (ignoring checks and pins - the generators read gs.pins and
+        # GameState's also remove entries from it, so they run against an empty list that is swapped back after)
+        pseudoMoves = []
+        pins = gs.pins
+        gs.pins = []
+        try:
+            if piece[1] == 'p':
+                gs.getPawnMoves(r, c, pseudoMoves)
+            elif piece[1] == 'R':
+                gs.getRookMoves(r, c, pseudoMoves)
+            elif piece[1] == 'B':
+                gs.getBishopMoves(r, c, pseudoMoves)
+            elif piece[1] == 'N':
+                gs.getKnightMoves(r, c, pseudoMoves)
+            elif piece[1] == 'Q':
+                gs.getQueenMoves(r, c, pseudoMoves)
+        finally:
+            gs.pins = pins
+        if piece[1] == 'K':
+            sameTeam = "w" if gs.whiteToMove else "b"
+            for m in range(-1, 2):
+                for n in range(-1, 2):
+                    if m == 0 and n == 0:
+                        continue  # skip the square the king is on
+                    i, j = r + m, c + n
+                    if 0 <= i < 8 and 0 <= j < 8:
+                        if gs.board[i][j] == "--" or gs.board[i][j][0] != sameTeam:
+                            pseudoMoves.append(ChessEngine.Move((r, c), (i, j), gs.board))
+
+        # Find which of these were filtered out due to checks/pins
+        return {(move.endRow, move.endCol) for move in pseudoMoves if move.moveID not in self.movesByID}
+
+
+"""
+Dirty rectangle renderer. The checkered board is drawn once into a cached surface, and every frame only the squares
+whose contents changed since the last frame (a move, an undo, a new selection, the bouncing selected piece, text
+appearing over them) are repainted and passed to display.update, instead of redrawing and flipping the whole window.
+"""
+class BoardRenderer():
+    def __init__(self, screen):
+        self.screen = screen
+        self.boardSurface = p.Surface((WIDTH, HEIGHT))
+        colours = [p.Color("white"), p.Color("gray")]
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                self.boardSurface.fill(colours[(r + c) % 2], squareRect(r, c))
+        self.drawn = [None] * (DIMENSION * DIMENSION) #what each square showed in the last frame
+        self.overlays = [] #(key, rect) of the text drawn over the board in the last frame
+        self.fullRedraw = True
+
+    def invalidate(self):
+        self.fullRedraw = True
+
+    def draw(self, gs, captureSq, moveSq, sqSelected, frameCount, moveIndex, overlays):
+        invalidSquares = moveIndex.getInvalidSquares(sqSelected)
+        checkSq = None
+        if gs.inCheck:
+            checkSq = gs.whiteKingLocation if gs.whiteToMove else gs.blackKingLocation
+        dirty = set()
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                if (r, c) in captureSq:
+                    highlight = "red"
+                elif (r, c) in moveSq:
+                    highlight = "blue"
+                else:
+                    highlight = None
+                bounce = bounceOffset(frameCount) if sqSelected == (r, c) and gs.board[r][c] != "--" else None
+                state = (gs.board[r][c], highlight, (r, c) in invalidSquares, checkSq == (r, c), bounce)
+                previous = self.drawn[r * DIMENSION + c]
+                if state != previous:
+                    self.drawn[r * DIMENSION + c] = state
+                    dirty.add((r, c))
+                    if bounce is not None or (previous is not None and previous[4] is not None):
+                        #a bouncing piece pokes into the squares above and below it
+                        dirty.update(sq for sq in ((r - 1, c), (r + 1, c)) if 0 <= sq[0] < DIMENSION)
+        overlayKeys = [(key, rect) for key, _, rect in overlays]
+        if overlayKeys != self.overlays:
+            for _, rect in self.overlays + overlayKeys:
+                dirty.update(squaresUnder(rect))
+            self.overlays = overlayKeys
+        elif overlays: #text stays on top of any square repainted under it
+            for _, rect in overlayKeys:
+                if any(sq in dirty for sq in squaresUnder(rect)):
+                    dirty.update(squaresUnder(rect))
+        if self.fullRedraw:
+            dirty = {(r, c) for r in range(DIMENSION) for c in range(DIMENSION)}
+        if not dirty:
+            return
+        for r, c in dirty:
+            self.drawSquare(r, c)
+        #pieces that bounce out of their square go on top of the neighbours just repainted
+        for r, c in dirty:
+            bounce = self.drawn[r * DIMENSION + c][4]
+            if bounce is not None:
+                self.screen.blit(IMAGES[gs.board[r][c]], (c * SQ_SIZE, r * SQ_SIZE - bounce))
+        for _, textObject, textLocation in overlays:
+            self.screen.blit(textObject, textLocation)
+        if self.fullRedraw:
+            p.display.flip()
+            self.fullRedraw = False
+        else:
+            p.display.update([squareRect(r, c) for r, c in dirty])
+
+    def drawSquare(self, r, c):
+        piece, highlight, invalid, check, bounce = self.drawn[r * DIMENSION + c]
+        rect = squareRect(r, c)
+        if highlight is not None:
+            self.screen.fill(p.Color(highlight), rect)
+        else:
+            self.screen.blit(self.boardSurface, rect, rect)
+        if piece != "--" and bounce is None:
+            self.screen.blit(IMAGES[piece], rect)
+        if invalid:
+            self.screen.blit(invalidOverlay, rect)
+        if check:
+            self.screen.blit(checkAlert, (c * SQ_SIZE + SQ_SIZE - 20, r * SQ_SIZE + 5))
+
+
+def squareRect(r, c):
+    return p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+
+
+#Squares a screen rectangle overlaps
+def squaresUnder(rect):
+    firstRow, lastRow = max(rect.top // SQ_SIZE, 0), min((rect.bottom - 1) // SQ_SIZE, DIMENSION - 1)
+    firstCol, lastCol = max(rect.left // SQ_SIZE, 0), min((rect.right - 1) // SQ_SIZE, DIMENSION - 1)
+    return [(r, c) for r in range(firstRow, lastRow + 1) for c in range(firstCol, lastCol + 1)]
+
+
+#Vertical offset in pixels of the bouncing selected piece
+def bounceOffset(frameCount):
+    amplitude = 5  # pixels
+    speed = 0.1
+    return round(amplitude * math.sin(speed * frameCount))
+
+
+def drawGameState(screen, gs, captureSq, moveSq, sqSelected, frameCount, moveIndex):
     drawBoard(screen, captureSq, moveSq) #draws the squares on the board
     drawPieces(screen, gs.board, sqSelected,frameCount) #draws the pieces on the board
     drawCheckIndicator(screen, gs)
-    drawInvalidMoveOverlay(screen, gs, validMoves, sqSelected)
+    drawInvalidMoveOverlay(screen, moveIndex, sqSelected)
 
 #Draws the squares on the board
 def drawBoard(screen, captureSq, moveSq):
@@ -145,52 +409,12 @@ def drawPieces(screen, board, sqSelected, frameCount):
             if piece != "--":
                 if sqSelected == (r, c):
                     # Bounce selected piece
-                    amplitude = 5  # pixels
-                    speed = 0.1
-                    offset = amplitude * math.sin(speed * frameCount)
-                    screen.blit(IMAGES[piece], (c * SQ_SIZE, r * SQ_SIZE - offset))
+                    screen.blit(IMAGES[piece], (c * SQ_SIZE, r * SQ_SIZE - bounceOffset(frameCount)))
                 else:
                     screen.blit(IMAGES[piece], (c * SQ_SIZE, r * SQ_SIZE))
 
-def drawInvalidMoveOverlay(screen, gs, validMoves, sqSelected):
-    if sqSelected == ():
-        return
-
-    r, c = sqSelected
-    piece = gs.board[r][c]
-
-    if piece == "--" or (piece[0] == 'w' and not gs.whiteToMove) or (piece[0] == 'b' and gs.whiteToMove):
-        return  # Don't show overlay if invalid piece is selected
-
-    # Get all possible moves for this piece (ignoring checks)
-    pseudoMoves = []
-    if piece[1] == 'p':
-        gs.getPawnMoves(r, c, pseudoMoves)
-    elif piece[1] == 'R':
-        gs.getRookMoves(r, c, pseudoMoves)
-    elif piece[1] == 'B':
-        gs.getBishopMoves(r, c, pseudoMoves)
-    elif piece[1] == 'N':
-        gs.getKnightMoves(r, c, pseudoMoves)
-    elif piece[1] == 'Q':
-        gs.getQueenMoves(r, c, pseudoMoves)
-    elif piece[1] == 'K':
-        sameTeam = "w" if gs.whiteToMove else "b"
-        for m in range(-1, 2):
-            for n in range(-1, 2):
-                if m == 0 and n == 0:
-                    continue  # skip the square the king is on
-                i, j = r + m, c + n
-                if 0 <= i < 8 and 0 <= j < 8:
-                    if gs.board[i][j] == "--" or gs.board[i][j][0] != sameTeam:
-                        pseudoMoves.append(ChessEngine.Move((r, c), (i, j), gs.board))
-
-    # Find which of these were filtered out due to checks/pins
-    legalMoves = [m for m in validMoves if m.startRow == r and m.startCol == c]
-    invalidMoves = [m for m in pseudoMoves if m not in legalMoves]
-
-    for move in invalidMoves:
-        row, col = move.endRow, move.endCol
+def drawInvalidMoveOverlay(screen, moveIndex, sqSelected):
+    for row, col in moveIndex.getInvalidSquares(sqSelected):
         screen.blit(invalidOverlay, (col * SQ_SIZE, row * SQ_SIZE))
 
 
@@ -205,12 +429,21 @@ def drawCheckIndicator(screen, gs):
         screen.blit(checkAlert, (x, y))
 
 
-def drawText(screen, text):
-    font = p.font.SysFont("Arial", 42, True, True)
-    textObject = font.render(text, 0, p.Color('Black'))
+#Text drawn over the board is passed around as (text, rendered surface, location rect) so the renderer can tell when
+#it changed and which squares it covers.
+#Shows the engine is thinking, with the depth it is searching and its speed
+def thinkingOverlay(thinkingInfo):
+    depth, nodesPerSecond = thinkingInfo
+    text = "Thinking... depth %d  %d nodes/s" % (depth, nodesPerSecond)
+    textObject = thinkingFont.render(text, True, p.Color("white"), p.Color("black"))
+    return text, textObject, textObject.get_rect(bottomleft=(5, HEIGHT - 5))
+
+
+def textOverlay(text):
+    textObject = endGameFont.render(text, 0, p.Color('Black'))
     textLocation = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH//2 - textObject.get_width()//2,
                                                          HEIGHT//2 - textObject.get_height()//2)
-    screen.blit(textObject, textLocation)
+    return text, textObject, p.Rect(textLocation.topleft, textObject.get_size())
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,304 @@
+"""
+Streaming readers for PGN game collections and FEN/EPD position files, for running the engine over large archives.
+Files are read in fixed size chunks and split into games as they go, so memory use depends on the size of one game
+rather than the size of the file, and nothing is parsed until it is asked for:
+    readGames(path)       - yields a PGNGame per game, whose positions() replays its SAN moves on a game state
+    readPositions(path)   - yields a (game state, EPD operations) pair per FEN or EPD line
+    mapGames(fn, path)    - calls fn(game) for every game over a process pool, yielding the results in file order
+parseSAN turns standard algebraic notation into the matching Move of a position.
+The engine plays without castling, en passant and promotion, so replaying a game stops with a ValueError at the first
+such move.
+Run from the ChessEngine folder:
+    python -m Chess.GameReader FILE [--epd] [--bitboard] [--workers N] - replays every game (or loads every position)
+    and reports the throughput
+"""
+
+import argparse
+import collections
+import functools
+import multiprocessing
+import re
+import time
+from Chess import ChessEngine, BitboardEngine
+
+CHUNK_SIZE = 1 << 20 #bytes read from the file at a time
+GAMES_PER_TASK = 64 #games sent to a worker process at a time by mapGames
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+HEADER = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+#one movetext token: a comment, a variation bracket, a NAG, a move number or a move / result
+MOVETEXT_TOKEN = re.compile(r'\{[^}]*\}|;[^\n]*|[()]|\$\d+|\d+\.+|[^\s{}();$]+')
+SAN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(=[NBRQ])?[+#]?[!?]*$')
+
+
+def makeGameState(fen=ChessEngine.START_FEN, bitboard=False):
+    gs = BitboardEngine.BitboardGameState() if bitboard else ChessEngine.GameState()
+    gs.loadFEN(fen)
+    return gs
+
+
+"""
+Returns the move of validMoves (the legal moves of gs, generated if not given) that the SAN string stands for, such as
+"e4", "exd5", "Nbd7", "R1e2" or "Qh4+". Raises ValueError if it doesn't name exactly one legal move or names castling
+or a promotion, which the engine can't play.
+"""
+def parseSAN(gs, san, validMoves=None):
+    match = SAN.match(san)
+    if match is None:
+        if san.rstrip("+#!?") in ("O-O", "O-O-O", "0-0", "0-0-0"):
+            raise ValueError("castling is not supported: " + san)
+        raise ValueError("not a SAN move: " + san)
+    piece, fromFile, fromRank, capture, target, promotion = match.groups()
+    if promotion:
+        raise ValueError("promotion is not supported: " + san)
+    piece = piece or "p"
+    endRow = ChessEngine.Move.ranksToRows[target[1]]
+    endCol = ChessEngine.Move.filesToCols[target[0]]
+    startRow = ChessEngine.Move.ranksToRows[fromRank] if fromRank else None
+    startCol = ChessEngine.Move.filesToCols[fromFile] if fromFile else None
+    found = None
+    for move in (validMoves if validMoves is not None else gs.getValidMoves()):
+        if move.endRow == endRow and move.endCol == endCol and move.pieceMoved[1] == piece and \
+                (startRow is None or move.startRow == startRow) and (startCol is None or move.startCol == startCol):
+            if found is not None:
+                raise ValueError("ambiguous move: " + san)
+            found = move
+    if found is None:
+        if piece == "p" and capture and gs.board[endRow][endCol] == "--": #a pawn capturing onto an empty square
+            raise ValueError("en passant is not supported: " + san)
+        raise ValueError("illegal move: " + san)
+    if piece == "p" and bool(capture) != (found.pieceCaptured != "--"):
+        raise ValueError("illegal move: " + san)
+    return found
+
+
+class PGNGame():
+    def __init__(self, headers, sanMoves):
+        self.headers = headers #tag name -> value, e.g. {"White": ..., "Result": "1-0"}
+        self.sanMoves = sanMoves #main line only, comments, variations and NAGs are dropped
+
+    @property
+    def result(self):
+        return self.headers.get("Result", "*")
+
+    @property
+    def startFEN(self):
+        return self.headers.get("FEN", ChessEngine.START_FEN)
+
+    """
+    Replays the main line, yielding (gs, move) before each move is made - gs is the same game state object throughout,
+    so copy what you need (its FEN, zobristKey, ...) before asking for the next position. Raises ValueError at the
+    first move that can't be played.
+    """
+    def positions(self, bitboard=False):
+        gs = makeGameState(self.startFEN, bitboard)
+        for ply, san in enumerate(self.sanMoves):
+            try:
+                move = parseSAN(gs, san)
+            except ValueError as error:
+                raise ValueError("ply %d: %s" % (ply + 1, error)) from None
+            yield gs, move
+            gs.makeMove(move)
+
+
+"""
+Yields the lines of a file without their line endings, reading it chunkSize bytes at a time
+"""
+def readLines(path, chunkSize=CHUNK_SIZE):
+    with open(path, "rb") as f:
+        rest = b""
+        while True:
+            chunk = f.read(chunkSize)
+            if not chunk:
+                break
+            lines = (rest + chunk).split(b"\n")
+            rest = lines.pop() #the last line may carry on in the next chunk
+            for line in lines:
+                yield line.decode("utf-8", "replace").rstrip("\r")
+        if rest:
+            yield rest.decode("utf-8", "replace").rstrip("\r")
+
+
+"""
+Yields the text of each game of a PGN file, headers and movetext, without parsing it
+"""
+def readGameTexts(path, chunkSize=CHUNK_SIZE):
+    lines = []
+    inMovetext = False
+    inComment = False #inside a {comment}, where a line starting with "[" isn't a header
+    for line in readLines(path, chunkSize):
+        if line.startswith("%"): #escape mechanism, the line is ignored
+            continue
+        if line.startswith("[") and not inComment:
+            if inMovetext:
+                yield "\n".join(lines)
+                lines = []
+                inMovetext = False
+        elif line.strip():
+            inMovetext = True
+            inComment = _endsInComment(line, inComment)
+        if line.strip() or inMovetext:
+            lines.append(line)
+    if any(line.strip() for line in lines):
+        yield "\n".join(lines)
+
+
+def _endsInComment(line, inComment):
+    #whether a {comment} is still open at the end of the line, comments don't nest and ; comments end with the line
+    i = 0
+    while True:
+        if inComment:
+            i = line.find("}", i)
+            if i < 0:
+                return True
+            inComment = False
+        else:
+            brace = line.find("{", i)
+            semicolon = line.find(";", i)
+            if brace < 0 or 0 <= semicolon < brace:
+                return False
+            inComment = True
+            i = brace
+        i += 1
+
+
+def parseGame(text):
+    headers = {}
+    movetextStart = 0
+    while True: #the tag pairs at the top, header lookalikes inside comments further down are movetext
+        match = HEADER.match(text, movetextStart)
+        if match is None:
+            break
+        headers[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+        movetextStart = match.end()
+        while movetextStart < len(text) and text[movetextStart].isspace():
+            movetextStart += 1
+    sanMoves = []
+    depth = 0 #variation nesting
+    for token in MOVETEXT_TOKEN.findall(text, movetextStart):
+        first = token[0]
+        if first == "(":
+            depth += 1
+        elif first == ")":
+            depth = max(depth - 1, 0)
+        elif depth == 0 and first not in "{;$" and not token.endswith(".") and token not in RESULTS:
+            sanMoves.append(token)
+    return PGNGame(headers, sanMoves)
+
+
+def readGames(path, chunkSize=CHUNK_SIZE):
+    for text in readGameTexts(path, chunkSize):
+        yield parseGame(text)
+
+
+"""
+Yields (gs, operations) for every line of a FEN or EPD file. EPD operations such as bm, am and id are returned as a
+dict of opcode -> operand string, empty for plain FEN lines. Blank lines and lines starting with # are skipped, and so
+are lines that aren't a usable position, after calling onError(line number, message) if it is given.
+"""
+def readPositions(path, bitboard=False, chunkSize=CHUNK_SIZE, onError=None):
+    for lineNumber, line in enumerate(readLines(path, chunkSize), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split(None, 4)
+        operations = {}
+        if len(fields) == 5 and not (fields[4].split()[0].isdigit()): #EPD - operations follow the 4 position fields
+            for operation in fields[4].split(";"):
+                operation = operation.strip()
+                if operation:
+                    opcode, _, operand = operation.partition(" ")
+                    operations[opcode] = operand.strip().strip('"')
+        fen = " ".join(fields[:4])
+        try:
+            board, whiteToMove = ChessEngine.parseFEN(fen)
+            if sum(row.count("wK") for row in board) != 1 or sum(row.count("bK") for row in board) != 1:
+                raise ValueError("a position needs one king of each colour: " + fen)
+        except ValueError as error:
+            if onError is not None:
+                onError(lineNumber, str(error))
+            continue
+        yield makeGameState(fen, bitboard), operations
+
+
+def _mapGameTexts(function, texts):
+    return [function(parseGame(text)) for text in texts]
+
+
+"""
+Calls function(game) with every PGNGame of a PGN file and yields the results in the order of the games.
+With more than one worker the games are parsed and processed in worker processes, GAMES_PER_TASK at a time, so
+function has to be picklable (a module level function or a functools.partial of one). Only a few batches per worker
+are read ahead, so memory use stays flat however large the file is. Pass a multiprocessing.Pool to reuse its workers.
+"""
+def mapGames(function, path, workers=None, pool=None, chunkSize=CHUNK_SIZE, gamesPerTask=GAMES_PER_TASK):
+    workers = workers or multiprocessing.cpu_count()
+    if pool is None and workers == 1:
+        for game in readGames(path, chunkSize):
+            yield function(game)
+        return
+    ownPool = multiprocessing.Pool(workers) if pool is None else None
+    try:
+        pending = collections.deque()
+        batch = []
+        for text in readGameTexts(path, chunkSize):
+            batch.append(text)
+            if len(batch) == gamesPerTask:
+                pending.append((ownPool or pool).apply_async(_mapGameTexts, (function, batch)))
+                batch = []
+                if len(pending) > 2 * workers:
+                    yield from pending.popleft().get()
+        if batch:
+            pending.append((ownPool or pool).apply_async(_mapGameTexts, (function, batch)))
+        while pending:
+            yield from pending.popleft().get()
+    finally:
+        if ownPool is not None:
+            ownPool.terminate()
+
+
+"""
+Replays a game and returns (plies played, error message or None) - the per game work of the command line benchmark
+"""
+def replayGame(game, bitboard=False):
+    plies = 0
+    try:
+        for gs, move in game.positions(bitboard):
+            plies += 1
+    except ValueError as error:
+        return plies, str(error)
+    return plies, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream the games of a PGN file or the positions of a FEN/EPD file")
+    parser.add_argument("file")
+    parser.add_argument("--epd", action="store_true", help="the file holds one FEN or EPD position per line")
+    parser.add_argument("--bitboard", action="store_true", help="use BitboardGameState instead of GameState")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes to replay the games on")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="bytes to read at a time")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    if args.epd:
+        count = 0
+        skipped = []
+        for gs, operations in readPositions(args.file, args.bitboard, args.chunk_size,
+                                            lambda lineNumber, error: skipped.append(lineNumber)):
+            count += 1
+        elapsed = time.perf_counter() - start
+        print("%d positions (%d lines skipped) in %.2f s, %d positions/sec" %
+              (count, len(skipped), elapsed, count / max(elapsed, 1e-9)))
+        return
+    games = plies = stopped = 0
+    function = functools.partial(replayGame, bitboard=args.bitboard)
+    for gamePlies, error in mapGames(function, args.file, args.workers, chunkSize=args.chunk_size):
+        games += 1
+        plies += gamePlies
+        stopped += error is not None
+    elapsed = time.perf_counter() - start
+    print("%d games, %d positions (%d games stopped at a move the engine can't play) in %.2f s, %d positions/sec" %
+          (games, plies, stopped, elapsed, plies / max(elapsed, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
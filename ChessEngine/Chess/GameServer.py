@@ -0,0 +1,456 @@
+"""
+Asyncio game server hosting many games at once, for clients that want to play the engine without a pygame window each.
+The protocol is JSON lines over TCP: every request is one JSON object on a line and gets one JSON object back, with
+the request's "id" (if it had one) copied in so a client can have several requests in flight on one connection.
+    {"cmd": "new", "fen": FEN}                                  -> {"ok": true, "session": 1, "status": "playing"}
+    {"cmd": "moves", "session": 1}                              -> {"ok": true, "moves": ["a2a3", ...], "status": ...}
+    {"cmd": "move", "session": 1, "move": "e2e4", "reply": true} -> {"ok": true, "move": "e2e4", "reply": "e7e5", ...}
+    {"cmd": "go", "session": 1}                                 -> {"ok": true, "reply": "e7e5", "status": ...}
+    {"cmd": "undo" | "fen" | "close", "session": 1}, {"cmd": "stats"}
+"fen" is optional for new, and "movetime" (ms) and "depth" can be added to a request for an engine move. Status is
+"playing", "checkmate" or "stalemate"; a bad request gets {"ok": false, "error": "..."}. Sessions belong to the
+connection that created them and are dropped when it closes.
+
+A session is a packed board (one byte per square) and a move log of 16 bit entries (moveID and captured piece), a
+few hundred bytes instead of a GameState with a list of Move objects. Legal moves are generated on a scratch game state
+and cached per position, so the positions many games share, like the opening, are only generated once. Engine replies
+are searched in a process pool and never hold up the event loop.
+Run from the ChessEngine folder:
+    python -m Chess.GameServer [--host HOST] [--port PORT] [--workers N] [--bitboard] - serves until interrupted
+    python -m Chess.GameServer --load [--sessions N] [--connections N] [--plies N] [--reply-every N] [--remote]
+        - plays random games against a server (its own unless --remote) and reports the move latencies
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import multiprocessing
+import random
+import sys
+import time
+from array import array
+from Chess import ChessEngine, BitboardEngine, ChessAI
+from Chess.ChessEngine import Move
+from Chess.TranspositionTable import TranspositionTable
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+CACHE_ENTRIES = 1 << 16 #positions whose legal moves are kept
+ENGINE_MOVE_TIME = 100 #milliseconds the engine thinks per reply unless the request says otherwise
+MAX_ENGINE_MOVE_TIME = 10000 #longest movetime a request may ask for, so one request can't hold a worker for long
+WORKER_HASH_MB = 16 #transposition table of each engine worker process, kept between its searches
+PIECE_CODES = ("--", "wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK") #packed board bytes
+CODE_OF = {piece: code for code, piece in enumerate(PIECE_CODES)}
+PLAYING, CHECKMATE, STALEMATE = "playing", "checkmate", "stalemate"
+
+
+def makeGameState(fen=ChessEngine.START_FEN, bitboard=False):
+    gs = BitboardEngine.BitboardGameState() if bitboard else ChessEngine.GameState()
+    gs.loadFEN(fen)
+    return gs
+
+
+def parseUCI(text):
+    if not isinstance(text, str) or len(text) != 4 or text[0] not in Move.filesToCols or \
+            text[2] not in Move.filesToCols or text[1] not in Move.ranksToRows or text[3] not in Move.ranksToRows:
+        raise ValueError("not a move: %s" % (text,))
+    start = Move.ranksToRows[text[1]] * 8 + Move.filesToCols[text[0]]
+    end = Move.ranksToRows[text[3]] * 8 + Move.filesToCols[text[2]]
+    return start | end << 6
+
+
+def uciFromID(moveID):
+    start = moveID & 63
+    end = moveID >> 6
+    return Move.colsToFiles[start % 8] + Move.rowsToRanks[start // 8] + Move.colsToFiles[end % 8] + \
+        Move.rowsToRanks[end // 8]
+
+
+class Session():
+    __slots__ = ("board", "whiteToMove", "moveLog", "busy")
+
+    def __init__(self, fen=ChessEngine.START_FEN):
+        board, self.whiteToMove = ChessEngine.parseFEN(fen)
+        self.board = bytearray(CODE_OF[piece] for row in board for piece in row)
+        self.moveLog = array('H') #moveID | captured piece code << 12 per ply
+        self.busy = False #an engine move is being searched for it
+
+    def key(self):
+        return bytes(self.board) + (b"w" if self.whiteToMove else b"b")
+
+    #no castling, en passant or promotion, so a move only ever takes a piece from one square to another
+    def makeMove(self, moveID):
+        board = self.board
+        start = moveID & 63
+        end = moveID >> 6
+        self.moveLog.append(moveID | board[end] << 12)
+        board[end] = board[start]
+        board[start] = 0
+        self.whiteToMove = not self.whiteToMove
+
+    def undoMove(self):
+        entry = self.moveLog.pop()
+        board = self.board
+        start = entry & 63
+        end = entry >> 6 & 63
+        board[start] = board[end]
+        board[end] = entry >> 12
+        self.whiteToMove = not self.whiteToMove
+
+    def getFEN(self):
+        board = [[PIECE_CODES[code] for code in self.board[r * 8:r * 8 + 8]] for r in range(8)]
+        return ChessEngine.boardToFEN(board, self.whiteToMove)
+
+    def memoryUsage(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.board) + sys.getsizeof(self.moveLog)
+
+
+"""
+Legal moves of the positions sessions reach, generated on one scratch game state and kept for the most recently used
+maxEntries positions. lookup returns (array of legal moveIDs, status).
+"""
+class ValidMoveCache():
+    def __init__(self, bitboard=False, maxEntries=CACHE_ENTRIES):
+        self.gs = makeGameState(bitboard=bitboard)
+        self.maxEntries = maxEntries
+        self.entries = collections.OrderedDict() #packed position -> (moveIDs, status), least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, session):
+        key = session.key()
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        gs = self.gs
+        gs.loadFEN(session.getFEN())
+        moveIDs = array('H', [move.moveID for move in gs.getValidMoves()])
+        entry = (moveIDs, CHECKMATE if gs.checkMate else STALEMATE if gs.staleMate else PLAYING)
+        self.entries[key] = entry
+        if len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+        return entry
+
+
+_workerTT = None
+
+
+def engineMove(fen, bitboard, timeLimitMs, maxDepth):
+    #runs in an engine worker process, returns the moveID of the engine's move or None if there is none
+    global _workerTT
+    if _workerTT is None:
+        _workerTT = TranspositionTable(WORKER_HASH_MB)
+    result = ChessAI.findBestMove(makeGameState(fen, bitboard), timeLimitMs, maxDepth, _workerTT)
+    return result.bestMove.moveID if result.bestMove is not None else None
+
+
+class GameServer():
+    def __init__(self, bitboard=False, workers=None, cacheEntries=CACHE_ENTRIES, engineMoveTime=ENGINE_MOVE_TIME):
+        self.bitboard = bitboard #game state used for move generation and by the engine
+        self.workers = workers or multiprocessing.cpu_count()
+        self.engineMoveTime = engineMoveTime
+        self.cache = ValidMoveCache(bitboard, cacheEntries)
+        self.sessions = {} #session id -> Session
+        self.nextSessionID = 1
+        self.engineMoves = 0
+        self.pool = None
+        self.server = None
+        self.connections = {} #writer -> handler task of every open connection
+
+    """
+    Starts listening and returns the port, which is picked by the system when port is 0
+    """
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+        self.server = await asyncio.start_server(self.handleConnection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        handlers = list(self.connections.values())
+        for writer in list(self.connections):
+            writer.close() #the handler reads the end of the stream and cleans up
+        await asyncio.gather(*handlers, return_exceptions=True)
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    async def handleConnection(self, reader, writer):
+        owned = set() #ids of the sessions this connection created
+        writeLock = asyncio.Lock()
+        tasks = set()
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(self.respond(line, owned, writer, writeLock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            for sessionID in owned:
+                self.sessions.pop(sessionID, None)
+            del self.connections[writer]
+            writer.close()
+
+    async def respond(self, line, owned, writer, writeLock):
+        request = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request has to be a JSON object")
+            response = await self.handle(request, owned)
+        except (ValueError, TypeError) as error:
+            response = {"ok": False, "error": str(error)}
+        except Exception as error: #a broken worker pool or a failed search, the client still gets its answer
+            response = {"ok": False, "error": "internal error: %s" % (error,)}
+        if isinstance(request, dict) and "id" in request:
+            response["id"] = request["id"]
+        writer.write(json.dumps(response).encode() + b"\n")
+        async with writeLock:
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    def session(self, request, owned):
+        session = self.sessions.get(request.get("session")) if request.get("session") in owned else None
+        if session is None:
+            raise ValueError("no session %s" % (request.get("session"),))
+        if session.busy:
+            raise ValueError("session %s is waiting for an engine move" % (request.get("session"),))
+        return session
+
+    async def handle(self, request, owned):
+        command = request.get("cmd")
+        if command == "new":
+            fen = request.get("fen") or ChessEngine.START_FEN
+            if not isinstance(fen, str):
+                raise ValueError("fen has to be a string")
+            session = Session(fen)
+            if session.board.count(CODE_OF["wK"]) != 1 or session.board.count(CODE_OF["bK"]) != 1:
+                raise ValueError("a position needs one king of each colour")
+            sessionID = self.nextSessionID
+            self.nextSessionID += 1
+            self.sessions[sessionID] = session
+            owned.add(sessionID)
+            return {"ok": True, "session": sessionID, "status": self.cache.lookup(session)[1]}
+        elif command == "moves":
+            moveIDs, status = self.cache.lookup(self.session(request, owned))
+            return {"ok": True, "moves": [uciFromID(moveID) for moveID in moveIDs], "status": status}
+        elif command == "move":
+            session = self.session(request, owned)
+            moveID = parseUCI(request.get("move"))
+            if moveID not in self.cache.lookup(session)[0]:
+                raise ValueError("illegal move " + request["move"])
+            session.makeMove(moveID)
+            response = {"ok": True, "move": request["move"]}
+            status = self.cache.lookup(session)[1]
+            if request.get("reply") and status == PLAYING:
+                response["reply"], status = await self.playEngineMove(session, request)
+            response["status"] = status
+            return response
+        elif command == "go":
+            session = self.session(request, owned)
+            reply, status = await self.playEngineMove(session, request)
+            return {"ok": True, "reply": reply, "status": status}
+        elif command == "undo":
+            session = self.session(request, owned)
+            if not session.moveLog:
+                raise ValueError("no move to undo")
+            session.undoMove()
+            return {"ok": True, "status": self.cache.lookup(session)[1]}
+        elif command == "fen":
+            return {"ok": True, "fen": self.session(request, owned).getFEN()}
+        elif command == "close":
+            self.session(request, owned)
+            del self.sessions[request["session"]]
+            owned.discard(request["session"])
+            return {"ok": True}
+        elif command == "stats":
+            return {"ok": True, "sessions": len(self.sessions), "cachedPositions": len(self.cache.entries),
+                    "cacheHits": self.cache.hits, "cacheMisses": self.cache.misses, "engineMoves": self.engineMoves,
+                    "bytesPerSession": sum(session.memoryUsage() for session in self.sessions.values()) //
+                    max(len(self.sessions), 1)}
+        raise ValueError("unknown command %s" % (command,))
+
+    async def playEngineMove(self, session, request):
+        #searches in the process pool, returns (UCI move or None, status after it)
+        timeLimitMs = int(request.get("movetime", self.engineMoveTime))
+        if timeLimitMs <= 0:
+            raise ValueError("movetime has to be positive")
+        timeLimitMs = min(timeLimitMs, MAX_ENGINE_MOVE_TIME)
+        maxDepth = min(max(int(request.get("depth", ChessAI.MAX_DEPTH)), 1), ChessAI.MAX_DEPTH)
+        session.busy = True
+        try:
+            moveID = await asyncio.get_running_loop().run_in_executor(self.pool, engineMove, session.getFEN(),
+                                                                       self.bitboard, timeLimitMs, maxDepth)
+        finally:
+            session.busy = False
+        if moveID is None:
+            return None, self.cache.lookup(session)[1]
+        session.makeMove(moveID)
+        self.engineMoves += 1
+        return uciFromID(moveID), self.cache.lookup(session)[1]
+
+
+class LoadClient():
+    #one connection of the load generator, matching responses to requests by id
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {} #request id -> future of its response
+        self.nextID = 0
+        self.readTask = asyncio.ensure_future(self.readResponses())
+
+    @classmethod
+    async def connect(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def readResponses(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self.pending.pop(response.get("id"), None)
+            if future is not None:
+                future.set_result(response)
+        for future in self.pending.values():
+            future.set_exception(ConnectionError("server closed the connection"))
+
+    async def request(self, message):
+        self.nextID += 1
+        message["id"] = self.nextID
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.nextID] = future
+        self.writer.write(json.dumps(message).encode() + b"\n")
+        response = await future
+        if not response.get("ok"):
+            raise ValueError(response.get("error"))
+        return response
+
+    async def close(self):
+        self.writer.close()
+        await self.readTask
+
+
+def _percentile(values, fraction):
+    return values[min(int(fraction * len(values)), len(values) - 1)] if values else 0.0
+
+
+"""
+Plays sessions random games of up to plies moves each over the given number of connections, all at the same time.
+Every replyEvery-th move of a game asks for an engine reply (0 for never). Returns a report dict with the latencies
+in milliseconds and the server's stats taken while all the games were still open.
+"""
+async def runLoad(host, port, sessions=1000, connections=10, plies=40, replyEvery=4, movetime=ENGINE_MOVE_TIME,
+                  depth=2, seed=1):
+    rng = random.Random(seed)
+    clients = [await LoadClient.connect(host, port) for _ in range(connections)]
+    latencies = {"move": [], "reply": [], "moves": []}
+    sessionIDs = []
+
+    async def playGame(client, gameRng):
+        sessionID = (await client.request({"cmd": "new"}))["session"]
+        sessionIDs.append(sessionID)
+        for ply in range(plies):
+            start = time.perf_counter()
+            legal = await client.request({"cmd": "moves", "session": sessionID})
+            latencies["moves"].append(time.perf_counter() - start)
+            if legal["status"] != PLAYING:
+                break
+            reply = replyEvery > 0 and ply % replyEvery == replyEvery - 1
+            start = time.perf_counter()
+            result = await client.request({"cmd": "move", "session": sessionID, "move": gameRng.choice(legal["moves"]),
+                                           "reply": reply, "movetime": movetime, "depth": depth})
+            latencies["reply" if reply else "move"].append(time.perf_counter() - start)
+            if result["status"] != PLAYING:
+                break
+
+    start = time.perf_counter()
+    await asyncio.gather(*(playGame(clients[i % connections], random.Random(rng.random())) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    stats = await clients[0].request({"cmd": "stats"})
+    for client in clients:
+        await client.close()
+    report = {"sessions": sessions, "connections": connections, "elapsed": elapsed, "stats": stats}
+    for name, values in latencies.items():
+        values.sort()
+        report[name] = (len(values), 1000 * _percentile(values, 0.5), 1000 * _percentile(values, 0.99))
+    return report
+
+
+async def _serve(args):
+    server = GameServer(args.bitboard, args.workers)
+    port = await server.start(args.host, args.port)
+    print("serving on %s:%d" % (args.host, port))
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.stop()
+
+
+async def _load(args):
+    server = None
+    host, port = args.host, args.port
+    if not args.remote:
+        server = GameServer(args.bitboard, args.workers)
+        port = await server.start(host, 0)
+    try:
+        report = await runLoad(host, port, args.sessions, args.connections, args.plies, args.reply_every,
+                               args.movetime, args.depth)
+    finally:
+        if server is not None:
+            await server.stop()
+    stats = report["stats"]
+    moves = report["move"][0] + report["reply"][0]
+    print("%d sessions over %d connections: %d moves (%d with an engine reply) in %.2f s, %d moves/sec" %
+          (report["sessions"], report["connections"], moves, report["reply"][0], report["elapsed"],
+           moves / max(report["elapsed"], 1e-9)))
+    for name, label in (("moves", "legal moves"), ("move", "move"), ("reply", "move + engine reply")):
+        count, p50, p99 = report[name]
+        print("%-20s %7d requests  p50 %8.2f ms  p99 %8.2f ms" % (label, count, p50, p99))
+    lookups = stats["cacheHits"] + stats["cacheMisses"]
+    print("valid move cache: %d positions, %.1f%% hits" % (stats["cachedPositions"],
+                                                          100 * stats["cacheHits"] / max(lookups, 1)))
+    print("%d open sessions, %d bytes per session" % (stats["sessions"], stats["bytesPerSession"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve games over a JSON lines protocol, or put load on a server")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, help="engine worker processes (default one per CPU)")
+    parser.add_argument("--bitboard", action="store_true", help="use BitboardGameState instead of GameState")
+    parser.add_argument("--load", action="store_true", help="run the load generator instead of serving")
+    parser.add_argument("--remote", action="store_true", help="load the server at --host/--port instead of starting one")
+    parser.add_argument("--sessions", type=int, default=1000, help="games played at the same time")
+    parser.add_argument("--connections", type=int, default=10)
+    parser.add_argument("--plies", type=int, default=40, help="moves the load generator makes per game")
+    parser.add_argument("--reply-every", type=int, default=4, help="ask for an engine reply every N moves, 0 for never")
+    parser.add_argument("--movetime", type=int, default=ENGINE_MOVE_TIME, help="engine reply time limit in ms")
+    parser.add_argument("--depth", type=int, default=2, help="engine reply depth limit")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_load(args) if args.load else _serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
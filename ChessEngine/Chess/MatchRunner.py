@@ -0,0 +1,480 @@
+"""
+Headless self-play matches between two engine configurations, to tell whether a change made the engine stronger or
+only faster. Every opening of the suite is played twice with the colours swapped, the games run on a process pool, and
+the match stops as soon as a sequential probability ratio test (SPRT) decides between "B is no stronger than A by
+elo0" and "B is stronger by elo1".
+A configuration is a comma separated list of settings, for example
+    name=list,movetime=100                  - list based GameState, 100 ms a move
+    name=bitboard,bitboard=1,movetime=100   - BitboardGameState with the same time
+    name=d4,depth=4 / name=n5k,nodes=5000   - fixed depth or node budgets, which leave speed out of the comparison
+(settings: name, bitboard, movetime, depth, nodes, hash, tablebases). Games end in mate or stalemate, or are drawn by
+threefold repetition, the fifty move rule, insufficient material or reaching maxPlies.
+Every game is appended to a record file as a fixed size header (result, plies, nodes, search time and summed depth per
+side) followed by the start FEN and the moves as 16 bit moveIDs, about 100 bytes plus 2 bytes a ply.
+Run from the ChessEngine folder:
+    python -m Chess.MatchRunner --engine SPEC --engine SPEC [--games N] [--openings FILE] [--workers N]
+                                [--elo0 E] [--elo1 E] [--records FILE]
+    python -m Chess.MatchRunner --summary FILE - the statistics of a record file
+"""
+
+import argparse
+import math
+import multiprocessing
+import random
+import struct
+import time
+from array import array
+from Chess import ChessEngine, BitboardEngine, ChessAI, GameReader
+from Chess.ChessEngine import Move
+from Chess.Tablebase import Tablebase
+from Chess.TranspositionTable import TranspositionTable
+
+MAX_PLIES = 300 #games still going after this many plies are drawn
+OPENING_PLIES = 6 #random moves played from the start position for each generated opening
+FIFTY_MOVE_PLIES = 100
+WHITE_WINS, DRAW, BLACK_WINS = 2, 1, 0 #result codes: white's points * 2
+TERMINATIONS = ("checkmate", "stalemate", "repetition", "fifty moves", "insufficient material", "max plies")
+CHECKMATE, STALEMATE, REPETITION, FIFTY_MOVES, INSUFFICIENT_MATERIAL, PLY_LIMIT = range(len(TERMINATIONS))
+RECORD_MAGIC = b"CEMR"
+RECORD_VERSION = 1
+#game index, white config, black config, result, termination, plies, nodes per side, search ms per side,
+#summed search depth per side, length of the start FEN
+RECORD_HEADER = struct.Struct("<IBBBBHQQIIHHB")
+
+
+class EngineConfig():
+    def __init__(self, name, bitboard=False, movetime=100, depth=ChessAI.MAX_DEPTH, nodes=None,
+                 hashMB=ChessAI.DEFAULT_HASH_MB, tablebases=None):
+        self.name = name
+        self.bitboard = bitboard
+        self.movetime = movetime #ms per move, None for no time limit
+        self.depth = depth
+        self.nodes = nodes #node budget per move, None for no limit
+        self.hashMB = hashMB
+        self.tablebases = tablebases #folder of Tablebase files, None to not probe
+
+    """
+    Builds a configuration from "name=...,bitboard=1,movetime=100,...". Without a movetime, a depth or node limit
+    alone bounds the search.
+    """
+    @classmethod
+    def parse(cls, spec):
+        settings = {}
+        for item in spec.split(","):
+            key, _, value = item.partition("=")
+            settings[key.strip().lower()] = value.strip()
+        unknown = set(settings) - {"name", "bitboard", "movetime", "depth", "nodes", "hash", "tablebases"}
+        if unknown:
+            raise ValueError("unknown engine settings: " + ", ".join(sorted(unknown)))
+        limited = "depth" in settings or "nodes" in settings
+        return cls(settings.get("name") or spec,
+                   settings.get("bitboard", "0").lower() in ("1", "true", "yes", ""),
+                   int(settings["movetime"]) if "movetime" in settings else None if limited else 100,
+                   int(settings.get("depth", ChessAI.MAX_DEPTH)),
+                   int(settings["nodes"]) if "nodes" in settings else None,
+                   int(settings.get("hash", ChessAI.DEFAULT_HASH_MB)),
+                   settings.get("tablebases") or None)
+
+
+class GameRecord():
+    __slots__ = ("game", "white", "black", "result", "termination", "startFEN", "moveIDs", "nodes", "times",
+                 "depths")
+
+    def __init__(self, game, white, black, result, termination, startFEN, moveIDs, nodes, times, depths):
+        self.game = game
+        self.white = white #config index playing white
+        self.black = black
+        self.result = result #WHITE_WINS, DRAW or BLACK_WINS
+        self.termination = termination #index into TERMINATIONS
+        self.startFEN = startFEN
+        self.moveIDs = moveIDs #array('H')
+        self.nodes = nodes #[white, black] nodes searched
+        self.times = times #[white, black] ms spent searching
+        self.depths = depths #[white, black] sum of the depths reached
+
+    def pointsFor(self, config):
+        return (self.result if config == self.white else 2 - self.result) / 2
+
+    def pack(self):
+        fen = self.startFEN.encode()
+        return RECORD_HEADER.pack(self.game, self.white, self.black, self.result, self.termination,
+                                  len(self.moveIDs), self.nodes[0], self.nodes[1], self.times[0], self.times[1],
+                                  self.depths[0], self.depths[1], len(fen)) + fen + self.moveIDs.tobytes()
+
+    @classmethod
+    def unpack(cls, data, offset):
+        (game, white, black, result, termination, plies, whiteNodes, blackNodes, whiteMs, blackMs, whiteDepth,
+         blackDepth, fenLength) = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        startFEN = data[offset:offset + fenLength].decode()
+        offset += fenLength
+        moveIDs = array('H', data[offset:offset + 2 * plies])
+        return cls(game, white, black, result, termination, startFEN, moveIDs, [whiteNodes, blackNodes],
+                   [whiteMs, blackMs], [whiteDepth, blackDepth]), offset + 2 * plies
+
+
+def writeRecordHeader(f, names):
+    f.write(RECORD_MAGIC + struct.pack("<HB", RECORD_VERSION, len(names)))
+    for name in names:
+        encoded = name.encode()[:255]
+        f.write(struct.pack("<B", len(encoded)) + encoded)
+
+
+"""
+Reads a record file, returns (config names, list of GameRecords)
+"""
+def readRecords(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != RECORD_MAGIC:
+        raise ValueError("not a match record file: " + path)
+    version, count = struct.unpack_from("<HB", data, 4)
+    if version != RECORD_VERSION:
+        raise ValueError("unsupported record version %d: %s" % (version, path))
+    offset = 7
+    names = []
+    for _ in range(count):
+        length = data[offset]
+        names.append(data[offset + 1:offset + 1 + length].decode())
+        offset += 1 + length
+    records = []
+    while offset < len(data):
+        record, offset = GameRecord.unpack(data, offset)
+        records.append(record)
+    return names, records
+
+
+"""
+Sequential probability ratio test between H0: elo = elo0 and H1: elo = elo1, using the normal approximation of the
+game score (draws count as half a point). Once the log likelihood ratio leaves [lowerBound, upperBound] the result
+holds with error rates alpha (accepting H1 wrongly) and beta (accepting H0 wrongly).
+"""
+class SPRT():
+    def __init__(self, elo0=0.0, elo1=10.0, alpha=0.05, beta=0.05):
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lowerBound = math.log(beta / (1 - alpha))
+        self.upperBound = math.log((1 - beta) / alpha)
+
+    def llr(self, wins, draws, losses):
+        games = wins + draws + losses
+        if games == 0:
+            return 0.0
+        wins, draws, losses, games = _regularized(wins, draws, losses)
+        score = (wins + draws / 2) / games
+        variance = (wins + draws / 4) / games - score * score
+        score0 = _expectedScore(self.elo0)
+        score1 = _expectedScore(self.elo1)
+        return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+    """
+    "H1" (the change gains elo1), "H0" (it doesn't gain elo0) or None while undecided
+    """
+    def decision(self, wins, draws, losses):
+        llr = self.llr(wins, draws, losses)
+        if llr >= self.upperBound:
+            return "H1"
+        if llr <= self.lowerBound:
+            return "H0"
+        return None
+
+
+def _expectedScore(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+#half a pseudo game added to each outcome, so a match without draws or without losses still has a score variance
+def _regularized(wins, draws, losses):
+    return wins + 0.5, draws + 0.5, losses + 0.5, wins + draws + losses + 1.5
+
+
+def _elo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+"""
+Elo difference implied by a score and its 95% confidence interval, as (elo, low, high)
+"""
+def eloEstimate(wins, draws, losses):
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, -math.inf, math.inf
+    score = (wins + draws / 2) / games
+    wins, draws, losses, games = _regularized(wins, draws, losses)
+    regularizedScore = (wins + draws / 2) / games
+    deviation = math.sqrt(((wins + draws / 4) / games - regularizedScore * regularizedScore) / games)
+    return _elo(score), _elo(score - 1.96 * deviation), _elo(score + 1.96 * deviation)
+
+
+"""
+count openings of openingPlies random legal moves from the start position, none of them repeated or already over
+"""
+def randomOpenings(count, openingPlies=OPENING_PLIES, seed=1):
+    rng = random.Random(seed)
+    gs = ChessEngine.GameState()
+    openings = []
+    seen = set()
+    attempts = 0
+    while len(openings) < count and attempts < 100 * count:
+        attempts += 1
+        gs.loadFEN(ChessEngine.START_FEN)
+        for _ in range(openingPlies):
+            moves = gs.getValidMoves()
+            if not moves:
+                break
+            gs.makeMove(rng.choice(moves))
+        fen = gs.getFEN()
+        if fen not in seen and gs.getValidMoves():
+            seen.add(fen)
+            openings.append(fen)
+    return openings
+
+
+"""
+Start FENs from a file: one per line of a FEN/EPD file, or the position after openingPlies plies of every game of a
+PGN file (games that can't be replayed that far are skipped)
+"""
+def loadOpenings(path, openingPlies=OPENING_PLIES):
+    if not path.lower().endswith(".pgn"):
+        return [gs.getFEN() for gs, operations in GameReader.readPositions(path)]
+    openings = []
+    for game in GameReader.readGames(path):
+        if len(game.sanMoves) < openingPlies:
+            continue
+        if openingPlies == 0:
+            openings.append(GameReader.makeGameState(game.startFEN).getFEN())
+            continue
+        try:
+            #positions() yields the position before each move, so the last opening move is played here
+            for ply, (gs, move) in enumerate(game.positions()):
+                if ply == openingPlies - 1:
+                    gs.makeMove(move)
+                    openings.append(gs.getFEN())
+                    break
+        except ValueError:
+            continue
+    return openings
+
+
+def _insufficientMaterial(board):
+    minors = 0
+    for row in board:
+        for piece in row:
+            if piece[1] in "pRQ":
+                return False
+            if piece[1] in "BN":
+                minors += 1
+    return minors <= 1
+
+
+"""
+Plays one game and returns its GameRecord. task is (game index, start FEN, (white index, white EngineConfig),
+(black index, black EngineConfig), maxPlies). Runs in a worker process.
+"""
+def playGame(task):
+    game, startFEN, (whiteIndex, white), (blackIndex, black), maxPlies = task
+    configs = (white, black)
+    #each side searches on a game state of its own backend, both get every move
+    states = []
+    for config in configs:
+        gs = BitboardEngine.BitboardGameState() if config.bitboard else ChessEngine.GameState()
+        gs.loadFEN(startFEN)
+        states.append(gs)
+    tts = [TranspositionTable(config.hashMB) for config in configs]
+    tablebases = [Tablebase(config.tablebases) if config.tablebases else None for config in configs]
+    gs = states[0]
+    moveIDs = array('H')
+    nodes = [0, 0]
+    times = [0.0, 0.0]
+    depths = [0, 0]
+    seen = {gs.zobristKey: 1}
+    quietPlies = 0 #since the last capture or pawn move
+    while True:
+        if not gs.getValidMoves():
+            result = DRAW if gs.staleMate else BLACK_WINS if gs.whiteToMove else WHITE_WINS
+            termination = STALEMATE if gs.staleMate else CHECKMATE
+            break
+        if seen[gs.zobristKey] >= 3:
+            result, termination = DRAW, REPETITION
+            break
+        if quietPlies >= FIFTY_MOVE_PLIES:
+            result, termination = DRAW, FIFTY_MOVES
+            break
+        if _insufficientMaterial(gs.board):
+            result, termination = DRAW, INSUFFICIENT_MATERIAL
+            break
+        if len(moveIDs) >= maxPlies:
+            result, termination = DRAW, PLY_LIMIT
+            break
+        side = 0 if gs.whiteToMove else 1
+        config = configs[side]
+        searcher = ChessAI.Searcher(states[side], config.movetime, config.depth, tts[side], nodeLimit=config.nodes,
+                                    tablebase=tablebases[side])
+        searchResult = searcher.search()
+        nodes[side] += searchResult.nodes
+        times[side] += searchResult.elapsed
+        depths[side] += searchResult.depth
+        move = searchResult.bestMove
+        start = (move.startRow, move.startCol)
+        end = (move.endRow, move.endCol)
+        quietPlies = 0 if move.pieceMoved[1] == "p" or move.pieceCaptured != "--" else quietPlies + 1
+        for state in states:
+            state.makeMove(Move(start, end, state.board))
+        moveIDs.append(move.moveID)
+        seen[gs.zobristKey] = seen.get(gs.zobristKey, 0) + 1
+    for tablebase in tablebases:
+        if tablebase is not None:
+            tablebase.close()
+    return GameRecord(game, whiteIndex, blackIndex, result, termination, startFEN, moveIDs, nodes,
+                      [min(int(1000 * t), 0xFFFFFFFF) for t in times], [min(d, 0xFFFF) for d in depths])
+
+
+class MatchStats():
+    #running totals from the point of view of config 1 (the one being tested) against config 0
+    def __init__(self):
+        self.wins = self.draws = self.losses = 0
+        self.nodes = [0, 0]
+        self.times = [0, 0] #ms
+        self.depths = [0, 0]
+        self.moves = [0, 0]
+        self.terminations = [0] * len(TERMINATIONS)
+
+    def add(self, record):
+        points = record.pointsFor(1)
+        if points == 1:
+            self.wins += 1
+        elif points == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+        self.terminations[record.termination] += 1
+        plies = len(record.moveIDs)
+        whiteMoves = plies // 2 if record.startFEN.split()[1] == "b" else (plies + 1) // 2
+        for side, config in ((0, record.white), (1, record.black)):
+            self.nodes[config] += record.nodes[side]
+            self.times[config] += record.times[side]
+            self.depths[config] += record.depths[side]
+            self.moves[config] += whiteMoves if side == 0 else plies - whiteMoves
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def nodesPerSecond(self, config):
+        return 1000 * self.nodes[config] / max(self.times[config], 1)
+
+    def averageDepth(self, config):
+        return self.depths[config] / max(self.moves[config], 1)
+
+
+def formatStats(stats, names, sprt):
+    elo, low, high = eloEstimate(stats.wins, stats.draws, stats.losses)
+    lines = ["%s vs %s: %d games, +%d =%d -%d, score %.1f%%, elo %+.1f [%+.1f, %+.1f], LLR %.2f [%.2f, %.2f]" %
+             (names[1], names[0], stats.games, stats.wins, stats.draws, stats.losses,
+              100 * (stats.wins + stats.draws / 2) / max(stats.games, 1), elo, low, high,
+              sprt.llr(stats.wins, stats.draws, stats.losses), sprt.lowerBound, sprt.upperBound)]
+    for config in (0, 1):
+        lines.append("    %-12s %8d nps, average depth %.2f" % (names[config], stats.nodesPerSecond(config),
+                                                                stats.averageDepth(config)))
+    lines.append("    " + ", ".join("%s %d" % (name, count) for name, count in zip(TERMINATIONS, stats.terminations)
+                                    if count))
+    return "\n".join(lines)
+
+
+"""
+Plays configs[1] (the candidate) against configs[0] (the baseline) over the openings, each opening with both colour
+assignments, until games have been played or the SPRT has decided. Games are written to recordPath as they finish if
+given, and progress(stats, record) is called after each. Returns (MatchStats, SPRT decision or None).
+"""
+def runMatch(configs, openings, games, workers=None, sprt=None, recordPath=None, maxPlies=MAX_PLIES, progress=None):
+    sprt = sprt or SPRT()
+    tasks = []
+    for game in range(games):
+        opening = openings[(game // 2) % len(openings)]
+        white, black = (0, 1) if game % 2 == 0 else (1, 0)
+        tasks.append((game, opening, (white, configs[white]), (black, configs[black]), maxPlies))
+    stats = MatchStats()
+    decision = None
+    recordFile = open(recordPath, "wb") if recordPath else None
+    if recordFile is not None:
+        writeRecordHeader(recordFile, [config.name for config in configs])
+    workers = workers or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        results = pool.imap_unordered(playGame, tasks) if pool is not None else map(playGame, tasks)
+        for record in results:
+            stats.add(record)
+            if recordFile is not None:
+                recordFile.write(record.pack())
+                recordFile.flush()
+            if progress is not None:
+                progress(stats, record)
+            decision = sprt.decision(stats.wins, stats.draws, stats.losses)
+            if decision is not None:
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if recordFile is not None:
+            recordFile.close()
+    return stats, decision
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play two engine configurations against each other")
+    parser.add_argument("--engine", action="append", metavar="SPEC",
+                        help="baseline first, then the candidate, e.g. name=bb,bitboard=1,movetime=100")
+    parser.add_argument("--games", type=int, default=1000, help="most games to play if the SPRT doesn't stop earlier")
+    parser.add_argument("--openings", metavar="FILE", help="FEN/EPD or PGN opening suite (default random openings)")
+    parser.add_argument("--opening-plies", type=int, default=OPENING_PLIES)
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES)
+    parser.add_argument("--workers", type=int, help="game processes (default one per CPU)")
+    parser.add_argument("--elo0", type=float, default=0.0)
+    parser.add_argument("--elo1", type=float, default=10.0)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--records", metavar="FILE", help="write a record of every game to FILE")
+    parser.add_argument("--summary", metavar="FILE", help="only print the statistics of a record file")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the random openings")
+    args = parser.parse_args()
+    sprt = SPRT(args.elo0, args.elo1, args.alpha, args.beta)
+    if args.summary:
+        names, records = readRecords(args.summary)
+        stats = MatchStats()
+        for record in records:
+            stats.add(record)
+        print(formatStats(stats, names, sprt))
+        return
+    if not args.engine or len(args.engine) != 2:
+        parser.error("give exactly two --engine specs, the baseline first")
+    try:
+        configs = [EngineConfig.parse(spec) for spec in args.engine]
+    except ValueError as error:
+        parser.error(str(error))
+    if args.openings:
+        openings = loadOpenings(args.openings, args.opening_plies)
+    else:
+        openings = randomOpenings((args.games + 1) // 2, args.opening_plies, args.seed)
+    if not openings:
+        parser.error("no openings")
+    start = time.perf_counter()
+
+    def progress(stats, record):
+        print("game %d: %s-%s %s (%s, %d plies) | %d games, +%d =%d -%d, LLR %.2f" %
+              (record.game + 1, configs[record.white].name, configs[record.black].name,
+               {WHITE_WINS: "1-0", DRAW: "1/2-1/2", BLACK_WINS: "0-1"}[record.result],
+               TERMINATIONS[record.termination], len(record.moveIDs), stats.games, stats.wins, stats.draws,
+               stats.losses, sprt.llr(stats.wins, stats.draws, stats.losses)), flush=True)
+
+    stats, decision = runMatch(configs, openings, args.games, args.workers, sprt, args.records, args.max_plies,
+                               progress)
+    print(formatStats(stats, [config.name for config in configs], sprt))
+    print("%s after %d games in %.1f s" % ({"H1": "H1 accepted: %s is stronger" % configs[1].name,
+                                            "H0": "H0 accepted: %s is not stronger" % configs[1].name,
+                                            None: "SPRT undecided"}[decision], stats.games,
+                                           time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
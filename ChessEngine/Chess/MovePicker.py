@@ -0,0 +1,178 @@
+"""
+Staged move generation for the search. Instead of building every legal move of a position up front, a MovePicker
+hands the moves out one stage at a time, best guesses first:
+    1. the hash move (from the transposition table or the previous iteration's principal variation)
+    2. winning and even captures, most valuable victim / least valuable attacker first
+    3. the killer moves - quiet moves that caused a beta cutoff at the same ply in a sibling node
+    4. the remaining quiet moves, ordered by the history table
+    5. losing captures (a more valuable piece taking a defended, less valuable one)
+The hash and killer moves are checked against the board and handed out before anything is generated, and the quiet
+moves are only generated once the captures and killers haven't caused a cutoff. Moves are generated pseudo legally
+(getCaptureMoves / getQuietMoves of the game state) and each one's legality is checked just before it's yielded,
+using the pins and checks worked out once when the picker starts.
+Works with both ChessEngine.GameState and BitboardEngine.BitboardGameState.
+"""
+
+from Chess.ChessEngine import Move
+from Chess.AttackTables import SQUARES, RAYS, KNIGHT_TARGETS, KING_TARGETS, SQUARES_BETWEEN, BETWEEN, LINE
+
+pieceScore = {"K": 0, "Q": 900, "R": 500, "B": 330, "N": 320, "p": 100}
+BAD_CAPTURE_MARGIN = 50 #a capture only counts as losing if the attacker is worth this much more than the victim
+
+
+class MovePicker():
+    def __init__(self, gs, hashMoveID=None, killers=(), history=None, capturesOnly=False):
+        self.gs = gs
+        self.hashMoveID = hashMoveID or None
+        self.killers = killers #moveIDs, tried in order after the good captures
+        self.history = history #moveID -> score list for the side to move, higher is tried first
+        self.capturesOnly = capturesOnly #only captures, for the quiescence search
+        self.legalMoves = 0 #moves handed out so far - still 0 after a full iteration means mate or stalemate
+        self.inCheck, pins, checks = gs.checkForPinsAndChecks()
+        kingRow, kingCol = gs.whiteKingLocation if gs.whiteToMove else gs.blackKingLocation
+        self.kingSq = kingRow * 8 + kingCol
+        self.allyColor = "w" if gs.whiteToMove else "b"
+        self.enemyColor = "b" if gs.whiteToMove else "w"
+        self.pinned = 0 #bitboard of the pinned pieces
+        for pin in pins:
+            self.pinned |= 1 << (pin[0] * 8 + pin[1])
+        self.doubleCheck = len(checks) > 1
+        #squares a non-king move has to end on to answer a single check: the checking piece or a square in between
+        self.evasionMask = None
+        if len(checks) == 1:
+            checkSq = checks[0][0] * 8 + checks[0][1]
+            self.evasionMask = BETWEEN[self.kingSq][checkSq] | (1 << checkSq)
+
+    def __iter__(self):
+        gs = self.gs
+        hashMoveID = self.hashMoveID
+        if hashMoveID is not None:
+            move = self.moveFromID(hashMoveID)
+            if move is not None and (not self.capturesOnly or move.pieceCaptured != "--") and self.isLegal(move):
+                self.legalMoves += 1
+                yield move
+
+        goodCaptures = []
+        badCaptures = []
+        for move in gs.getCaptureMoves():
+            if move.moveID == hashMoveID:
+                continue
+            victim = pieceScore[move.pieceCaptured[1]]
+            attacker = pieceScore[move.pieceMoved[1]]
+            order = 10 * victim - attacker
+            if attacker > victim + BAD_CAPTURE_MARGIN and \
+                    self.isAttacked(move.endRow * 8 + move.endCol, move.startRow * 8 + move.startCol):
+                badCaptures.append((order, move))
+            else:
+                goodCaptures.append((order, move))
+        goodCaptures.sort(key=lambda scored: -scored[0])
+        for order, move in goodCaptures:
+            if self.isLegal(move):
+                self.legalMoves += 1
+                yield move
+
+        if not self.capturesOnly:
+            triedIDs = {hashMoveID}
+            for killerID in self.killers:
+                if killerID is None or killerID in triedIDs:
+                    continue
+                triedIDs.add(killerID)
+                move = self.moveFromID(killerID)
+                if move is not None and move.pieceCaptured == "--" and self.isLegal(move):
+                    self.legalMoves += 1
+                    yield move
+
+            quiets = gs.getQuietMoves()
+            if self.history is not None:
+                history = self.history
+                quiets.sort(key=lambda move: -history[move.moveID])
+            for move in quiets:
+                if move.moveID not in triedIDs and self.isLegal(move):
+                    self.legalMoves += 1
+                    yield move
+
+        badCaptures.sort(key=lambda scored: -scored[0])
+        for order, move in badCaptures:
+            if self.isLegal(move):
+                self.legalMoves += 1
+                yield move
+
+    """
+    Rebuilds the move with the given ID if it is pseudo legal in the current position (a hash or killer move may come
+    from a different position), None otherwise
+    """
+    def moveFromID(self, moveID):
+        board = self.gs.board
+        start = moveID & 63
+        end = moveID >> 6
+        startRow, startCol = SQUARES[start]
+        endRow, endCol = SQUARES[end]
+        piece = board[startRow][startCol]
+        target = board[endRow][endCol]
+        if piece[0] != self.allyColor or target[0] == self.allyColor:
+            return None
+        type = piece[1]
+        if type == 'p':
+            forward = -1 if self.allyColor == "w" else 1
+            if target == "--":
+                valid = endCol == startCol and (endRow == startRow + forward or
+                                                (endRow == startRow + 2 * forward and startRow == (6 if forward == -1 else 1)
+                                                 and board[startRow + forward][startCol] == "--"))
+            else:
+                valid = endRow == startRow + forward and abs(endCol - startCol) == 1
+        elif type == 'N':
+            valid = (endRow, endCol) in KNIGHT_TARGETS[start]
+        elif type == 'K':
+            valid = (endRow, endCol) in KING_TARGETS[start]
+        else:
+            orthogonal = startRow == endRow or startCol == endCol
+            diagonal = abs(endRow - startRow) == abs(endCol - startCol)
+            valid = ((orthogonal and type != 'B') or (diagonal and type != 'R')) and \
+                    all(board[r][c] == "--" for r, c in SQUARES_BETWEEN[start][end])
+        return Move((startRow, startCol), (endRow, endCol), board) if valid else None
+
+    """
+    Legality of a pseudo legal move: the king can't step onto an attacked square, a pinned piece has to stay on the
+    line of its pin and a check has to be answered
+    """
+    def isLegal(self, move):
+        start = move.startRow * 8 + move.startCol
+        end = move.endRow * 8 + move.endCol
+        if start == self.kingSq:
+            return not self.isAttacked(end, start)
+        if self.doubleCheck:
+            return False
+        if self.pinned >> start & 1 and not LINE[self.kingSq][start] >> end & 1:
+            return False
+        return self.evasionMask is None or self.evasionMask >> end & 1 == 1
+
+    """
+    Whether the enemy attacks sq, with the square ignoreSq treated as empty (the square the moving piece leaves)
+    """
+    def isAttacked(self, sq, ignoreSq):
+        board = self.gs.board
+        enemyColor = self.enemyColor
+        r, c = SQUARES[sq]
+        pawnRow = r - 1 if enemyColor == "b" else r + 1 #row an enemy pawn attacking sq stands on
+        if 0 <= pawnRow < 8:
+            for pawnCol in (c - 1, c + 1):
+                if 0 <= pawnCol < 8 and board[pawnRow][pawnCol] == enemyColor + "p":
+                    return True
+        for i, j in KNIGHT_TARGETS[sq]:
+            if board[i][j] == enemyColor + "N":
+                return True
+        for i, j in KING_TARGETS[sq]:
+            if board[i][j] == enemyColor + "K":
+                return True
+        rays = RAYS[sq]
+        ignoreRow, ignoreCol = SQUARES[ignoreSq]
+        for d in range(8):
+            for i, j in rays[d]:
+                piece = board[i][j]
+                if piece == "--" or (i == ignoreRow and j == ignoreCol):
+                    continue
+                if piece[0] == enemyColor and (piece[1] == 'Q' or (d <= 3 and piece[1] == 'R') or
+                                               (d >= 4 and piece[1] == 'B')):
+                    return True
+                break
+        return False
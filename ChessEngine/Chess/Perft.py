@@ -0,0 +1,241 @@
+"""
+Perft (performance test) driver for the move generators.
+Counts the leaf nodes of the legal move tree to a given depth so the counts can be checked against known results,
+and reports nodes per second so every change to the move generators can be measured.
+Run from the ChessEngine folder:
+    python -m Chess.Perft                                  - run the standard suite on GameState
+    python -m Chess.Perft --bitboard --max-depth 3         - run the suite on BitboardGameState
+    python -m Chess.Perft --fen "<fen>" --depth 3 --divide - node count per root move for one position
+    python -m Chess.Perft --fen "<fen>" --depth 5 --workers 8 - split the root moves over 8 processes
+    python -m Chess.Perft --check --max-depth 3            - also verify the incremental key and evaluation at every node
+"""
+
+import argparse
+import multiprocessing
+import time
+from Chess import ChessEngine, BitboardEngine, Evaluation, Zobrist
+
+"""
+Standard perft positions with their known node counts.
+The engine doesn't play castling, en passant or pawn promotion yet, so castling rights are stripped from the FENs and
+the depths stop before a promotion can appear in the tree. Where the published counts include castling or en passant
+moves, the counts below were taken from an independent generator with those moves filtered out.
+"""
+POSITIONS = [
+    ("Start position", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1",
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865351}),
+    ("Kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w - - 0 1",
+     {1: 46, 2: 1865, 3: 86585}),
+    ("Position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2810, 4: 43087, 5: 671300}),
+    ("Position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w - - 0 1",
+     {1: 6}),
+    ("Position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890}),
+    #regression positions for pin and check handling
+    ("Battery check", "b3r1n1/n1p3pr/p3qk1p/1N1pp1B1/1b1PP1PQ/P1P4P/1P3PBR/1R1K4 b - - 0 1",
+     {1: 3, 2: 96, 3: 3592}),
+    ("Pinned pawn", "8/8/8/4K3/8/4P3/8/k3r3 w - - 0 1",
+     {1: 9, 2: 100, 3: 746, 4: 11182}),
+]
+
+
+"""
+Counts the leaf nodes of the legal move tree depth plies deep.
+Backends that can count moves without building them (BitboardGameState.countValidMoves) are bulk counted at depth 1,
+and backends with moveID make / unmake (BitboardGameState.getValidMoveIDs) are walked without Move objects.
+"""
+def perft(gs, depth):
+    if hasattr(gs, "getValidMoveIDs"):
+        return perftMoveIDs(gs, depth)
+    if depth == 0:
+        return 1
+    if depth == 1 and hasattr(gs, "countValidMoves"):
+        return gs.countValidMoves()
+    moves = gs.getValidMoves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+
+def perftMoveIDs(gs, depth):
+    if depth <= 1:
+        return gs.countValidMoves() if depth == 1 else 1
+    nodes = 0
+    makeMoveID = gs.makeMoveID
+    undoMoveID = gs.undoMoveID
+    if depth == 2: #the bulk counted last ply without a call per move
+        countValidMoves = gs.countValidMoves
+        for moveID in gs.getValidMoveIDs():
+            makeMoveID(moveID)
+            nodes += countValidMoves()
+            undoMoveID()
+        return nodes
+    for moveID in gs.getValidMoveIDs():
+        makeMoveID(moveID)
+        nodes += perftMoveIDs(gs, depth - 1)
+        undoMoveID()
+    return nodes
+
+
+"""
+Compares the state makeMove and undoMove keep up to date incrementally (Zobrist key, evaluation) with the same values
+recomputed from the board, raising AssertionError with the moves that led to the first difference
+"""
+def checkIncremental(gs):
+    errors = []
+    key = Zobrist.hashBoard(gs.board, gs.whiteToMove)
+    if gs.zobristKey != key:
+        errors.append("zobristKey %016x, board hashes to %016x" % (gs.zobristKey, key))
+    score = Evaluation.evaluate(gs)
+    fullScore = Evaluation.evaluateFull(gs)
+    if score != fullScore:
+        errors.append("evaluate %d, evaluateFull %d" % (score, fullScore))
+    if errors:
+        line = " ".join(move.getUCINotation() for move in gs.moveLog)
+        raise AssertionError("after %s: %s" % (line or "no moves", "; ".join(errors)))
+
+
+"""
+Perft that runs checkIncremental on every node of the tree, including the leaves, so it never bulk counts. Much
+slower than perft, meant for validating changes to makeMove and undoMove.
+"""
+def perftChecked(gs, depth):
+    checkIncremental(gs)
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        nodes += perftChecked(gs, depth - 1)
+        gs.undoMove()
+    checkIncremental(gs) #undoMove has to restore the values too
+    return nodes
+
+
+"""
+Perft split by root move, returns a list of (move, nodes) pairs. Used to find which branch a wrong count comes from.
+"""
+def divide(gs, depth):
+    results = []
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        results.append((move, perft(gs, depth - 1)))
+        gs.undoMove()
+    return results
+
+
+def makeGameState(fen, bitboard=False):
+    gs = BitboardEngine.BitboardGameState() if bitboard else ChessEngine.GameState()
+    gs.loadFEN(fen)
+    return gs
+
+
+def _perftRootMoves(task):
+    #runs in a worker process on its own copy of the position
+    fen, bitboard, rootMoveIDs, depth = task
+    gs = makeGameState(fen, bitboard)
+    results = []
+    for move in gs.getValidMoves():
+        if move.moveID in rootMoveIDs:
+            gs.makeMove(move)
+            results.append((move.moveID, perft(gs, depth - 1)))
+            gs.undoMove()
+    return results
+
+
+"""
+Perft with the root moves dealt out round-robin to worker processes. Returns (nodes, workerNodes, divide) where
+workerNodes is the node count of every worker and divide the (move, nodes) pairs in the order of getValidMoves.
+"""
+def perftParallel(fen, depth, workers=None, bitboard=False):
+    workers = workers or multiprocessing.cpu_count()
+    gs = makeGameState(fen, bitboard)
+    moves = gs.getValidMoves()
+    if depth <= 1 or len(moves) == 0:
+        nodes = perft(gs, depth)
+        return nodes, [nodes], [(move, 1) for move in moves] if depth == 1 else []
+    workers = min(workers, len(moves))
+    tasks = [(fen, bitboard, {move.moveID for move in moves[i::workers]}, depth) for i in range(workers)]
+    with multiprocessing.Pool(workers) as pool:
+        outcomes = pool.map(_perftRootMoves, tasks, chunksize=1)
+    counts = {moveID: nodes for results in outcomes for moveID, nodes in results}
+    workerNodes = [sum(nodes for _, nodes in results) for results in outcomes]
+    return sum(workerNodes), workerNodes, [(move, counts[move.moveID]) for move in moves]
+
+
+"""
+Runs every position of the suite up to maxDepth, printing nodes, time and nodes per second for each depth.
+Returns the list of (name, depth, expected, nodes) for the counts that didn't match. With check the nodes are counted by
+perftChecked.
+"""
+def runSuite(positions=POSITIONS, maxDepth=None, bitboard=False, check=False):
+    count = perftChecked if check else perft
+    failures = []
+    totalNodes = 0
+    totalTime = 0.0
+    print("%-16s %5s %12s %9s %12s" % ("Position", "Depth", "Nodes", "Seconds", "Nodes/sec"))
+    for name, fen, expected in positions:
+        for depth in sorted(expected):
+            if maxDepth is not None and depth > maxDepth:
+                break
+            gs = makeGameState(fen, bitboard)
+            start = time.perf_counter()
+            nodes = count(gs, depth)
+            elapsed = time.perf_counter() - start
+            totalNodes += nodes
+            totalTime += elapsed
+            status = "ok" if nodes == expected[depth] else "FAIL (expected %d)" % expected[depth]
+            if nodes != expected[depth]:
+                failures.append((name, depth, expected[depth], nodes))
+            print("%-16s %5d %12d %9.3f %12d %s" % (name, depth, nodes, elapsed, nodes / max(elapsed, 1e-9), status))
+    print("Total: %d nodes in %.3f s, %d nodes/sec, %d failure(s)" %
+          (totalNodes, totalTime, totalNodes / max(totalTime, 1e-9), len(failures)))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft move generator test and benchmark")
+    parser.add_argument("--bitboard", action="store_true", help="use BitboardGameState instead of GameState")
+    parser.add_argument("--max-depth", type=int, default=None, help="deepest suite depth to run")
+    parser.add_argument("--fen", help="run a single position instead of the suite")
+    parser.add_argument("--depth", type=int, default=3, help="depth for --fen")
+    parser.add_argument("--divide", action="store_true", help="print the node count of every root move for --fen")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes to split the root moves of --fen over")
+    parser.add_argument("--check", action="store_true",
+                        help="verify the incremental Zobrist key and evaluation at every node (single process)")
+    args = parser.parse_args()
+
+    if args.fen is None:
+        failures = runSuite(maxDepth=args.max_depth, bitboard=args.bitboard, check=args.check)
+        raise SystemExit(1 if failures else 0)
+
+    gs = makeGameState(args.fen, args.bitboard)
+    start = time.perf_counter()
+    if args.check:
+        nodes = perftChecked(gs, args.depth)
+    elif args.workers > 1:
+        nodes, workerNodes, counts = perftParallel(args.fen, args.depth, args.workers, args.bitboard)
+        if args.divide:
+            for move, count in counts:
+                print(move.getUCINotation() + ": " + str(count))
+        for i, count in enumerate(workerNodes):
+            print("worker %d: %d nodes" % (i, count))
+    elif args.divide:
+        nodes = 0
+        for move, count in divide(gs, args.depth):
+            print(move.getUCINotation() + ": " + str(count))
+            nodes += count
+    else:
+        nodes = perft(gs, args.depth)
+    elapsed = time.perf_counter() - start
+    print("Nodes: %d  Time: %.3f s  Nodes/sec: %d" % (nodes, elapsed, nodes / max(elapsed, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Opt-in instrumentation of the move generators and the search's hot paths.
+A Profiler replaces the methods it watches with timing wrappers while it is enabled and puts the originals back when
+it is disabled, so the engine runs its normal code with no overhead the rest of the time. For every watched function
+it counts the calls and their total and self time (total minus the time spent in watched functions it called), and it
+records the self time per call stack, which can be written out in the collapsed stack format flamegraph.pl and
+speedscope read ("ChessEngine.GameState.getValidMoves;ChessEngine.GameState.getPawnMoves;ChessEngine.Move.__init__ 1234"
+- microseconds). Functions are named module.qualname, so the methods GameState and BitboardGameState share a name
+with get their own rows.
+Usage:
+    with Profiler() as profiler:
+        perft(gs, 3)
+    profiler.report()
+    profiler.writeCollapsed("perft.folded")
+Run from the ChessEngine folder:
+    python -m Chess.Profiler [--fen FEN] [--bitboard] [--perft DEPTH | --search MS] [--collapsed FILE]
+"""
+
+import argparse
+import sys
+import time
+from Chess import ChessEngine, BitboardEngine, ChessAI, MovePicker, Perft
+
+#(owner, attribute names) - owners are classes or modules, names of their functions to time
+DEFAULT_TARGETS = (
+    (ChessEngine.GameState, ("getValidMoves", "getAllPossibleMoves", "getPawnMoves", "getRookMoves", "getBishopMoves",
+                             "getKnightMoves", "getQueenMoves", "getKingMoves", "getMovesTo", "getAttackedSquares",
+                             "checkForPinsAndChecks", "getPseudoLegalMoves", "makeMove", "undoMove")),
+    (BitboardEngine.BitboardGameState, ("getValidMoves", "countValidMoves", "_legalTargets", "checkForPinsAndChecks",
+                                        "getPseudoLegalMoves", "makeMove", "undoMove")),
+    (ChessEngine.Move, ("__init__",)),
+    (MovePicker.MovePicker, ("__init__", "moveFromID", "isLegal", "isAttacked")),
+    (ChessAI, ("evaluate",)),
+)
+
+
+"""
+module.qualname of a function without the package, e.g. "BitboardEngine.BitboardGameState.getValidMoves"
+"""
+def functionName(function):
+    module = function.__module__
+    return module[module.find(".") + 1:] + "." + function.__code__.co_qualname
+
+
+class Profiler():
+    def __init__(self, targets=DEFAULT_TARGETS):
+        self.targets = targets
+        self.enabled = False
+        self.originals = [] #(owner, attribute, original function) to put back on disable
+        self.stats = {} #module.qualname -> [calls, total ns, self ns]
+        self.stacks = {} #"outer;inner;..." -> self ns
+        self.frames = [] #[stack, ns spent in watched callees] of the watched calls in progress
+        self.elapsed = 0 #ns the profiler has been enabled for
+        self.enabledAt = 0
+
+    def enable(self):
+        if self.enabled:
+            return
+        for owner, names in self.targets:
+            for attribute in names:
+                original = owner.__dict__[attribute]
+                self.originals.append((owner, attribute, original))
+                setattr(owner, attribute, self._wrap(functionName(original), original))
+        self.enabled = True
+        self.enabledAt = time.perf_counter_ns()
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.elapsed += time.perf_counter_ns() - self.enabledAt
+        for owner, attribute, original in reversed(self.originals):
+            setattr(owner, attribute, original)
+        self.originals = []
+        self.enabled = False
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.disable()
+
+    def reset(self):
+        self.stats = {}
+        self.stacks = {}
+        self.elapsed = 0
+        self.enabledAt = time.perf_counter_ns()
+
+    def _wrap(self, name, function):
+        frames = self.frames
+        profiler = self
+        clock = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            frame = [frames[-1][0] + ";" + name if frames else name, 0]
+            frames.append(frame)
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                frames.pop()
+                own = elapsed - frame[1]
+                if frames:
+                    frames[-1][1] += elapsed
+                stat = profiler.stats.get(name)
+                if stat is None:
+                    stat = profiler.stats[name] = [0, 0, 0]
+                stat[0] += 1
+                stat[1] += elapsed
+                stat[2] += own
+                profiler.stacks[frame[0]] = profiler.stacks.get(frame[0], 0) + own
+        timed.__wrapped__ = function
+        return timed
+
+    """
+    Prints calls, total and self time of every watched function, sorted by self time
+    """
+    def report(self, file=None):
+        file = file or sys.stdout
+        elapsed = self.elapsed + (time.perf_counter_ns() - self.enabledAt if self.enabled else 0)
+        width = max([len(name) for name in self.stats] + [len("function")])
+        print("%-*s %10s %11s %11s %9s %7s" % (width, "function", "calls", "total ms", "self ms", "self us", "self %"),
+              file=file)
+        for name, (calls, total, own) in sorted(self.stats.items(), key=lambda item: -item[1][2]):
+            print("%-*s %10d %11.1f %11.1f %9.2f %6.1f%%" % (width, name, calls, total / 1e6, own / 1e6,
+                                                             own / calls / 1e3, 100 * own / max(elapsed, 1)), file=file)
+        print("%.1f ms profiled" % (elapsed / 1e6), file=file)
+
+    """
+    Writes the self time of every call stack in microseconds, one "outer;inner;... time" line each
+    """
+    def writeCollapsed(self, path):
+        with open(path, "w") as f:
+            for stack, own in sorted(self.stacks.items()):
+                if own >= 1000:
+                    f.write("%s %d\n" % (stack, own // 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the move generators during a perft or a search")
+    parser.add_argument("--fen", default=ChessEngine.START_FEN)
+    parser.add_argument("--bitboard", action="store_true", help="use BitboardGameState instead of GameState")
+    parser.add_argument("--perft", type=int, default=3, metavar="DEPTH", help="run a perft to this depth (default)")
+    parser.add_argument("--search", type=int, metavar="MS", help="run a search for this many milliseconds instead")
+    parser.add_argument("--collapsed", metavar="FILE", help="write collapsed stacks for flamegraph.pl to FILE")
+    args = parser.parse_args()
+    gs = Perft.makeGameState(args.fen, args.bitboard)
+    with Profiler() as profiler:
+        if args.search is not None:
+            result = ChessAI.findBestMove(gs, args.search)
+            print("searched %d nodes to depth %d" % (result.nodes, result.depth))
+        else:
+            print("perft(%d) = %d" % (args.perft, Perft.perft(gs, args.perft)))
+    profiler.report()
+    if args.collapsed:
+        profiler.writeCollapsed(args.collapsed)
+        print("collapsed stacks written to " + args.collapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,526 @@
+"""
+Endgame tablebases for the endings with a lone king against king and one or two pieces: KQvK, KRvK, KPvK and KBNvK.
+The tables are generated here by retrograde analysis rather than downloaded: starting from every checkmate, moves are
+taken back one ply at a time - a position where the stronger side can reach a lost position is won, a position where
+every move of the lone king reaches a won position is lost - until nothing changes, and whatever was never reached is
+a draw. They follow the engine's rules, so a pawn on the last row stays a pawn and KPvK is a draw nearly everywhere.
+
+Every position is stored as a single byte, distance to mate in plies + 1 (0 for a draw). Whoever is to move wins when
+the distance is odd and is mated when it is even. The stronger side is always stored as white, with the white king
+moved into the a1-d1-d4 triangle by the board's 8 symmetries (into the a-d files by mirroring for tables with a pawn),
+so a table holds (king squares) * 64 ^ (pieces + 1) positions for each side to move:
+    KQvK 80 KB, KRvK 80 KB, KPvK 256 KB, KBNvK 5 MB
+The files are memory mapped and a probe is a board scan, an index computation and a single byte read.
+Usage:
+    tablebase = Tablebase()
+    tablebase.probe(gs)     -> (1 win / 0 draw / -1 loss for the side to move, plies to mate or None), None if the
+                               material isn't covered
+    tablebase.bestMove(gs)  -> the legal move that mates fastest, holds the draw or delays mate longest
+Run from the ChessEngine folder:
+    python -m Chess.Tablebase [--build] [--verify] [--probe FEN] [--directory DIR] [MATERIAL ...]
+"""
+
+import argparse
+import itertools
+import mmap
+import os
+import random
+import struct
+import time
+from Chess import ChessEngine
+from Chess.AttackTables import KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, rookAttacks, bishopAttacks
+
+MATERIALS = ("KQvK", "KRvK", "KPvK", "KBNvK")
+DRAWN_MATERIALS = ("KvK", "KNvK", "KBvK") #no mate is possible, nothing to store
+MAX_PIECES = 4
+PIECE_ORDER = "KQRBNP"
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+FILE_EXTENSION = ".tb"
+MAGIC = b"CETB"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sII4x") #magic, format version, positions per side to move
+MAX_DISTANCE = 254 #longest distance to mate in plies a byte can hold
+VERIFY_SAMPLES = 2000 #random positions checked against the engine's own move generator by verify
+
+#the 8 symmetries of the board as (row, col) -> (row, col), the first 2 also hold for tables with pawns
+SYMMETRIES = (lambda r, c: (r, c), lambda r, c: (r, 7 - c), lambda r, c: (7 - r, c), lambda r, c: (7 - r, 7 - c),
+              lambda r, c: (c, r), lambda r, c: (c, 7 - r), lambda r, c: (7 - c, r), lambda r, c: (7 - c, 7 - r))
+TRANSFORMS = [[row * 8 + col for row, col in (symmetry(sq // 8, sq % 8) for sq in range(64))] for symmetry in SYMMETRIES]
+ON_DIAGONAL = [sq // 8 + sq % 8 == 7 for sq in range(64)] #the a1-h8 diagonal
+ABOVE_DIAGONAL = [sq // 8 + sq % 8 < 7 for sq in range(64)]
+
+
+class EndgameTable():
+    def __init__(self, material):
+        self.material = material
+        self.pieces = material[1:material.index("v")] #the stronger side's pieces besides the king, e.g. "BN"
+        self.pawns = "P" in self.pieces
+        if self.pawns: #mirroring files is the only symmetry left
+            self.kingSquares = [sq for sq in range(64) if sq % 8 <= 3]
+            transforms = TRANSFORMS[:2]
+        else: #king in the a1-d1-d4 triangle: file a-d, rank 1-4 and rank <= file
+            self.kingSquares = [sq for sq in range(64) if 7 - sq // 8 <= sq % 8 <= 3]
+            transforms = TRANSFORMS
+        self.kingIndex = [-1] * 64
+        for i, sq in enumerate(self.kingSquares):
+            self.kingIndex[sq] = i
+        #transformFor[sq] - the symmetry that moves a white king on sq onto one of kingSquares
+        self.transformFor = [next(t for t in transforms if self.kingIndex[t[sq]] >= 0) for sq in range(64)]
+        #a king on the a1-d4 diagonal stays in the triangle when the board is mirrored along the a1-h8 diagonal, so then
+        #the first piece off the diagonal decides: it has to end up below it, as the king would
+        self.mirroredFor = [[TRANSFORMS[7][t[sq]] for sq in range(64)] for t in self.transformFor]
+        self.kingOnDiagonal = [not self.pawns and ON_DIAGONAL[t[sq]] for sq, t in enumerate(self.transformFor)]
+        self.size = len(self.kingSquares) << 6 * (len(self.pieces) + 1)
+
+    """
+    Index of the position with the white king on wk, the other white pieces on squares (in the order of self.pieces)
+    and the black king on bk, in any of their symmetric forms
+    """
+    def index(self, wk, squares, bk):
+        t = self.transformFor[wk]
+        if self.kingOnDiagonal[wk]:
+            for sq in itertools.chain(squares, (bk,)):
+                if not ON_DIAGONAL[t[sq]]:
+                    if ABOVE_DIAGONAL[t[sq]]:
+                        t = self.mirroredFor[wk]
+                    break
+        index = self.kingIndex[t[wk]]
+        for sq in squares:
+            index = index << 6 | t[sq]
+        return index << 6 | t[bk]
+
+    """
+    (wk, squares, bk) of an index, in the symmetric form the index stands for
+    """
+    def position(self, index):
+        bk = index & 63
+        squares = []
+        for _ in self.pieces:
+            index >>= 6
+            squares.append(index & 63)
+        return self.kingSquares[index >> 6], squares[::-1], bk
+
+    """
+    Whether white pieces on these squares can exist at all - no two on one square, no pawn on the first row
+    """
+    def validSquares(self, wk, squares):
+        if len(set(squares)) < len(squares) or wk in squares:
+            return False
+        return not self.pawns or all(sq < 56 for sq, piece in zip(squares, self.pieces) if piece == "P")
+
+
+def _attacks(piece, sq, occupied):
+    if piece == "Q":
+        return rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+    if piece == "R":
+        return rookAttacks(sq, occupied)
+    if piece == "B":
+        return bishopAttacks(sq, occupied)
+    if piece == "N":
+        return KNIGHT_ATTACKS[sq]
+    return PAWN_ATTACKS[0][sq]
+
+
+def _whiteAttacks(pieces, wk, squares, occupied):
+    #squares the white pieces attack or defend, occupied should leave out the black king so a slider checking it also
+    #covers the squares behind it
+    attacked = KING_ATTACKS[wk]
+    for piece, sq in zip(pieces, squares):
+        attacked |= _attacks(piece, sq, occupied)
+    return attacked
+
+
+def _whiteOrigins(piece, sq, occupied):
+    #empty squares a white piece now on sq could have come from, without a capture
+    if piece != "P":
+        return _attacks(piece, sq, occupied) & ~occupied
+    origins = 0
+    if sq < 48 and not occupied >> (sq + 8) & 1: #one row back, pawns never stand on the first row
+        origins = 1 << (sq + 8)
+        if sq // 8 == 4 and not occupied >> (sq + 16) & 1: #double step from the second row
+            origins |= 1 << (sq + 16)
+    return origins
+
+
+def _whiteTargets(piece, sq, occupied):
+    #squares a white piece on sq can move to - the lone king is never captured, so these are non-captures only
+    if piece != "P":
+        return _attacks(piece, sq, occupied) & ~occupied
+    targets = 0
+    if sq >= 8 and not occupied >> (sq - 8) & 1: #no promotion, a pawn on the last row is stuck
+        targets = 1 << (sq - 8)
+        if sq // 8 == 6 and not occupied >> (sq - 16) & 1:
+            targets |= 1 << (sq - 16)
+    return targets
+
+
+def _squares(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+"""
+Builds the table of a material by retrograde analysis and returns (table, white to move values, black to move values),
+the values being bytearrays of distance to mate in plies + 1 indexed by table.index. log is called with a progress line
+per ply if given.
+"""
+def generate(material, log=None):
+    table = EndgameTable(material)
+    pieces = table.pieces
+    size = table.size
+    whiteToMove = bytearray(size)
+    blackToMove = bytearray(size)
+
+    #ply 0: the black king is checkmated
+    current = []
+    index = 0
+    for wk in table.kingSquares:
+        for squares in itertools.product(range(64), repeat=len(pieces)):
+            if not table.validSquares(wk, squares):
+                index += 64
+                continue
+            occupied = 1 << wk
+            for sq in squares:
+                occupied |= 1 << sq
+            attacked = _whiteAttacks(pieces, wk, squares, occupied)
+            for bk in range(64):
+                if attacked >> bk & 1 and not occupied >> bk & 1 and not KING_ATTACKS[wk] >> bk & 1 and \
+                        not KING_ATTACKS[bk] & ~attacked and table.index(wk, squares, bk) == index:
+                    blackToMove[index] = 1
+                    current.append(index)
+                index += 1
+
+    ply = 0
+    while current:
+        if log is not None:
+            log("%s ply %d: %d positions" % (material, ply, len(current)))
+        found = []
+        if ply % 2 == 0: #black to move is mated in ply plies, white wins in ply + 1 by playing into it
+            for index in current:
+                wk, squares, bk = table.position(index)
+                occupied = 1 << wk | 1 << bk
+                for sq in squares:
+                    occupied |= 1 << sq
+                for origin in _squares(KING_ATTACKS[wk] & ~occupied & ~KING_ATTACKS[bk]):
+                    previous = table.index(origin, squares, bk)
+                    if not whiteToMove[previous] and \
+                            not _whiteAttacks(pieces, origin, squares, occupied ^ (1 << wk | 1 << origin | 1 << bk)) \
+                            >> bk & 1:
+                        whiteToMove[previous] = ply + 2
+                        found.append(previous)
+                for i, piece in enumerate(pieces):
+                    sq = squares[i]
+                    for origin in _squares(_whiteOrigins(piece, sq, occupied)):
+                        moved = list(squares)
+                        moved[i] = origin
+                        previous = table.index(wk, moved, bk)
+                        if not whiteToMove[previous] and \
+                                not _whiteAttacks(pieces, wk, moved, occupied ^ (1 << sq | 1 << origin | 1 << bk)) \
+                                >> bk & 1:
+                            whiteToMove[previous] = ply + 2
+                            found.append(previous)
+        else: #white to move wins in ply plies, black loses in ply + 1 if all of its moves lead to such positions
+            for index in current:
+                wk, squares, bk = table.position(index)
+                occupied = 1 << wk
+                pieceMask = 0
+                for sq in squares:
+                    pieceMask |= 1 << sq
+                occupied |= pieceMask
+                attacked = _whiteAttacks(pieces, wk, squares, occupied)
+                for origin in _squares(KING_ATTACKS[bk] & ~occupied & ~KING_ATTACKS[wk]):
+                    previous = table.index(wk, squares, origin)
+                    if blackToMove[previous]:
+                        continue
+                    moves = KING_ATTACKS[origin] & ~attacked
+                    if moves & pieceMask: #taking an undefended piece draws
+                        continue
+                    if all(whiteToMove[table.index(wk, squares, target)] for target in _squares(moves)):
+                        blackToMove[previous] = ply + 2
+                        found.append(previous)
+        current = found
+        ply += 1
+    return table, whiteToMove, blackToMove
+
+
+def tablePath(material, directory=DEFAULT_DIRECTORY):
+    return os.path.join(directory, material + FILE_EXTENSION)
+
+
+def saveTable(table, whiteToMove, blackToMove, directory=DEFAULT_DIRECTORY):
+    os.makedirs(directory, exist_ok=True)
+    path = tablePath(table.material, directory)
+    with open(path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, table.size))
+        f.write(whiteToMove)
+        f.write(blackToMove)
+    os.replace(path + ".tmp", path) #a probe never sees a half written file
+    return path
+
+
+"""
+Checks every position of a table against the positions its moves lead to, using the table's own move generation:
+a won position has a move to a position lost one ply sooner and none to one lost sooner than that, a lost position
+only has moves to won positions and one of them mates one ply later, and a draw has neither. Returns the number of
+positions that disagree.
+"""
+def checkConsistency(table, whiteToMove, blackToMove):
+    pieces = table.pieces
+    errors = 0
+    index = 0
+    for wk in table.kingSquares:
+        for squares in itertools.product(range(64), repeat=len(pieces)):
+            if not table.validSquares(wk, squares):
+                index += 64
+                continue
+            pieceMask = 0
+            for sq in squares:
+                pieceMask |= 1 << sq
+            whiteMask = pieceMask | 1 << wk
+            attacked = _whiteAttacks(pieces, wk, squares, whiteMask)
+            for bk in range(64):
+                if whiteMask >> bk & 1 or KING_ATTACKS[wk] >> bk & 1 or table.index(wk, squares, bk) != index:
+                    index += 1 #not a position, or the mirror image of one stored under another index
+                    continue
+                #black to move
+                moves = KING_ATTACKS[bk] & ~attacked
+                if not moves:
+                    expected = 1 if attacked >> bk & 1 else 0
+                elif moves & pieceMask:
+                    expected = 0
+                else:
+                    values = [whiteToMove[table.index(wk, squares, target)] for target in _squares(moves)]
+                    expected = max(values) + 1 if all(values) else 0
+                errors += blackToMove[index] != expected
+                #white to move, which can only happen with the black king out of check
+                if not attacked >> bk & 1:
+                    occupied = whiteMask | 1 << bk
+                    values = [blackToMove[table.index(target, squares, bk)]
+                              for target in _squares(KING_ATTACKS[wk] & ~occupied & ~KING_ATTACKS[bk])]
+                    for i, piece in enumerate(pieces):
+                        for target in _squares(_whiteTargets(piece, squares[i], occupied)):
+                            moved = list(squares)
+                            moved[i] = target
+                            values.append(blackToMove[table.index(wk, moved, bk)])
+                    lost = [value for value in values if value]
+                    errors += whiteToMove[index] != (min(lost) + 1 if lost else 0)
+                index += 1
+    return errors
+
+
+"""
+Probes the tablebases for game states, opening the table files of the materials it is asked about on first use.
+Materials without a file in the directory, or with a file that isn't a table of this format, are simply not covered.
+"""
+class Tablebase():
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+        self.tables = {} #material -> (EndgameTable, mmap) or None when there is no file
+
+    def _open(self, material):
+        if material in self.tables:
+            return self.tables[material]
+        self.tables[material] = None
+        if material in MATERIALS:
+            try:
+                with open(tablePath(material, self.directory), "rb") as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError): #missing or empty file
+                return None
+            table = EndgameTable(material)
+            if len(data) < HEADER.size or HEADER.unpack_from(data) != (MAGIC, FORMAT_VERSION, table.size) or \
+                    len(data) != HEADER.size + 2 * table.size:
+                data.close()
+                return None
+            self.tables[material] = (table, data)
+        return self.tables[material]
+
+    def close(self):
+        for entry in self.tables.values():
+            if entry is not None:
+                entry[1].close()
+        self.tables = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    """
+    (1 if the side to move wins, 0 for a draw, -1 if it loses, distance to mate in plies or None for a draw), or None
+    if the position has more than MAX_PIECES pieces or its material has no table
+    """
+    def probe(self, gs):
+        white = []
+        black = []
+        count = 0
+        for r, row in enumerate(gs.board):
+            for c, piece in enumerate(row):
+                if piece != "--":
+                    count += 1
+                    if count > MAX_PIECES:
+                        return None
+                    (white if piece[0] == "w" else black).append((PIECE_ORDER.index(piece[1].upper()), r * 8 + c))
+        whiteToMove = gs.whiteToMove
+        if len(black) > len(white): #store the stronger side as white: swap the colours and flip the board
+            white, black = [(piece, sq ^ 56) for piece, sq in black], [(piece, sq ^ 56) for piece, sq in white]
+            whiteToMove = not whiteToMove
+        white.sort()
+        black.sort()
+        material = "".join(PIECE_ORDER[piece] for piece, sq in white) + "v" + \
+            "".join(PIECE_ORDER[piece] for piece, sq in black)
+        if material in DRAWN_MATERIALS:
+            return 0, None
+        entry = self._open(material)
+        if entry is None:
+            return None
+        table, data = entry
+        index = table.index(white[0][1], [sq for piece, sq in white[1:]], black[0][1])
+        value = data[HEADER.size + (0 if whiteToMove else table.size) + index]
+        if value == 0:
+            return 0, None
+        return (1 if value % 2 == 0 else -1), value - 1
+
+    """
+    The legal move of gs the tables rate best - the fastest mate when winning, the longest resistance when losing and a
+    drawing move otherwise - or None if gs or one of the positions its moves lead to can't be probed
+    """
+    def bestMove(self, gs):
+        if self.probe(gs) is None:
+            return None
+        bestMove = None
+        bestRating = None
+        for move in gs.getValidMoves():
+            gs.makeMove(move)
+            result = self.probe(gs)
+            gs.undoMove()
+            if result is None:
+                return None
+            wdl, distance = result
+            rating = (-wdl, distance if wdl == 1 else -distance if wdl == -1 else 0)
+            if bestRating is None or rating > bestRating:
+                bestMove = move
+                bestRating = rating
+        gs.getValidMoves() #restore the check and mate flags of gs
+        return bestMove
+
+
+def build(material, directory=DEFAULT_DIRECTORY, log=print):
+    start = time.perf_counter()
+    table, whiteToMove, blackToMove = generate(material, log)
+    path = saveTable(table, whiteToMove, blackToMove, directory)
+    longest = max(max(whiteToMove), max(blackToMove)) - 1
+    log("%s: %d positions per side in %.1f s, %s, written to %s" %
+        (material, table.size, time.perf_counter() - start,
+         "longest mate %d plies" % longest if longest >= 0 else "no mates", path))
+    return table, whiteToMove, blackToMove
+
+
+def _randomGameState(table, rng):
+    #a random legal position of the table's material, with the colours swapped half of the time
+    while True:
+        squares = rng.sample(range(64), len(table.pieces) + 2)
+        wk, bk, others = squares[0], squares[1], squares[2:]
+        if KING_ATTACKS[wk] >> bk & 1 or not table.validSquares(wk, others):
+            continue
+        whiteToMove = rng.random() < 0.5
+        occupied = 1 << wk
+        for sq in others:
+            occupied |= 1 << sq
+        if whiteToMove and _whiteAttacks(table.pieces, wk, others, occupied) >> bk & 1:
+            continue
+        board = [["--"] * 8 for _ in range(8)]
+        swap = rng.random() < 0.5
+        strong, weak = ("b", "w") if swap else ("w", "b")
+        for piece, sq in zip("K" + table.pieces, [wk] + others):
+            sq = sq ^ 56 if swap else sq
+            board[sq // 8][sq % 8] = strong + ("p" if piece == "P" else piece)
+        bk = bk ^ 56 if swap else bk
+        board[bk // 8][bk % 8] = weak + "K"
+        gs = ChessEngine.GameState()
+        gs.loadFEN(ChessEngine.boardToFEN(board, whiteToMove != swap))
+        return gs
+
+
+"""
+Checks a built table: every stored position against its successors, then random positions (with either colour as the
+stronger side) probed through a Tablebase against the legal moves ChessEngine.GameState generates for them.
+Returns the number of disagreements.
+"""
+def verify(material, directory=DEFAULT_DIRECTORY, samples=VERIFY_SAMPLES, log=print, seed=1):
+    with Tablebase(directory) as tablebase:
+        entry = tablebase._open(material)
+        if entry is None:
+            raise ValueError("no %s table in %s" % (material, directory))
+        table, data = entry
+        start = time.perf_counter()
+        whiteToMove = data[HEADER.size:HEADER.size + table.size]
+        blackToMove = data[HEADER.size + table.size:]
+        errors = checkConsistency(table, whiteToMove, blackToMove)
+        log("%s: %d inconsistent positions (%.1f s)" % (material, errors, time.perf_counter() - start))
+        rng = random.Random(seed)
+        wrong = 0
+        for _ in range(samples):
+            gs = _randomGameState(table, rng)
+            wdl, distance = tablebase.probe(gs)
+            moves = gs.getValidMoves()
+            results = []
+            for move in moves:
+                gs.makeMove(move)
+                results.append(tablebase.probe(gs))
+                gs.undoMove()
+            if not moves:
+                expected = (-1, 0) if gs.inCheck else (0, None)
+            elif any(result[0] == -1 for result in results):
+                expected = (1, min(result[1] for result in results if result[0] == -1) + 1)
+            elif all(result[0] == 1 for result in results):
+                expected = (-1, max(result[1] for result in results) + 1)
+            else:
+                expected = (0, None)
+            if (wdl, distance) != expected:
+                wrong += 1
+                log("%s: %s probes as %s, its moves say %s" % (material, gs.getFEN(), (wdl, distance), expected))
+        log("%s: %d of %d random positions disagree with the engine's move generator" % (material, wrong, samples))
+        return errors + wrong
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build, verify and probe the endgame tablebases")
+    parser.add_argument("materials", nargs="*", default=list(MATERIALS), metavar="MATERIAL",
+                        help="tables to build or verify, out of " + ", ".join(MATERIALS) + " (default all)")
+    parser.add_argument("--build", action="store_true", help="generate the tables and write them to the directory")
+    parser.add_argument("--verify", action="store_true", help="check the tables in the directory")
+    parser.add_argument("--probe", metavar="FEN", help="probe a position and print the best move")
+    parser.add_argument("--directory", default=DEFAULT_DIRECTORY)
+    args = parser.parse_args()
+    for material in args.materials:
+        if material not in MATERIALS:
+            parser.error("unknown material %s, choose from %s" % (material, ", ".join(MATERIALS)))
+    if args.build:
+        for material in args.materials:
+            build(material, args.directory)
+    if args.verify:
+        errors = sum(verify(material, args.directory) for material in args.materials)
+        print("all tables verified" if errors == 0 else "%d errors" % errors)
+    if args.probe:
+        gs = ChessEngine.GameState()
+        gs.loadFEN(args.probe)
+        with Tablebase(args.directory) as tablebase:
+            result = tablebase.probe(gs)
+            if result is None:
+                print("not in the tablebases")
+            else:
+                wdl, distance = result
+                print({1: "win", 0: "draw", -1: "loss"}[wdl] + ("" if distance is None else " in %d plies" % distance))
+                move = tablebase.bestMove(gs)
+                if move is not None:
+                    print("best move " + move.getUCINotation())
+    if not (args.build or args.verify or args.probe):
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Fixed size transposition table for the search, keyed by GameState.zobristKey.
+Memory is allocated once as two flat arrays of 64 bit words (one for keys, one for packed entry data), so the table
+never grows past the size it was created with. The table is split into buckets of two slots: the first slot keeps
+the deepest result seen for its bucket (depth-preferred) and the second takes everything else (always-replace).
+"""
+
+from array import array
+
+EXACT = 0
+LOWER_BOUND = 1 #score is at least this (failed high)
+UPPER_BOUND = 2 #score is at most this (failed low)
+
+SLOT_BYTES = 16 #8 byte key + 8 byte data word
+BUCKET_SLOTS = 2
+SCORE_OFFSET = 1 << 29 #scores are stored biased so they pack as unsigned
+
+"""
+Layout of a data word:
+    bits 0-15  - moveID of the best move (0 for none)
+    bits 16-23 - depth
+    bits 24-25 - bound type
+    bits 26-33 - generation of the search that stored it
+    bits 34-63 - score + SCORE_OFFSET
+"""
+
+
+class TranspositionTable():
+    def __init__(self, sizeMB=16):
+        #number of buckets is rounded down to a power of two so the index is a mask instead of a modulo
+        buckets = max(1, sizeMB * 1024 * 1024 // (SLOT_BYTES * BUCKET_SLOTS))
+        self.bucketCount = 1 << (buckets.bit_length() - 1)
+        self.mask = self.bucketCount - 1
+        slots = self.bucketCount * BUCKET_SLOTS
+        self.keys = array('Q', bytes(8 * slots))
+        self.data = array('Q', bytes(8 * slots))
+        self.generation = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.probes = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0 #probes that found the bucket holding other positions
+        self.stores = 0
+        self.overwrites = 0 #stores that evicted a different position
+
+    def clear(self):
+        slots = self.bucketCount * BUCKET_SLOTS
+        self.keys = array('Q', bytes(8 * slots))
+        self.data = array('Q', bytes(8 * slots))
+        self.generation = 0
+        self.resetStats()
+
+    #Call at the start of every search so entries from older searches become the first to be replaced
+    def newSearch(self):
+        self.generation = (self.generation + 1) & 0xFF
+
+    def sizeBytes(self):
+        return self.keys.itemsize * len(self.keys) + self.data.itemsize * len(self.data)
+
+    """
+    Returns (depth, score, boundType, moveID) stored for the key, or None
+    """
+    def probe(self, key):
+        self.probes += 1
+        slot = (key & self.mask) * BUCKET_SLOTS
+        keys = self.keys
+        for i in (slot, slot + 1):
+            if keys[i] == key:
+                data = self.data[i]
+                if data:
+                    self.hits += 1
+                    return (data >> 16) & 0xFF, (data >> 34) - SCORE_OFFSET, (data >> 24) & 0x3, data & 0xFFFF
+        self.misses += 1
+        if self.data[slot] or self.data[slot + 1]:
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, score, boundType, moveID=0):
+        self.stores += 1
+        slot = (key & self.mask) * BUCKET_SLOTS
+        keys = self.keys
+        data = self.data
+        #keep a best move we already know about if the new result doesn't have one
+        for i in (slot, slot + 1):
+            if keys[i] == key and data[i]:
+                if moveID == 0:
+                    moveID = data[i] & 0xFFFF
+                break
+        depth = min(max(depth, 0), 0xFF)
+        word = moveID | (depth << 16) | (boundType << 24) | (self.generation << 26) | ((score + SCORE_OFFSET) << 34)
+        preferred = data[slot]
+        if keys[slot] == key or not preferred or depth >= (preferred >> 16) & 0xFF or \
+                (preferred >> 26) & 0xFF != self.generation:
+            target = slot
+            if preferred and keys[slot] != key:
+                #the displaced entry is still useful, move it into the always-replace slot
+                if data[slot + 1] and keys[slot + 1] != key:
+                    self.overwrites += 1
+                keys[slot + 1] = keys[slot]
+                data[slot + 1] = preferred
+        else:
+            target = slot + 1
+            if data[target] and keys[target] != key:
+                self.overwrites += 1
+        keys[target] = key
+        data[target] = word
+
+    """
+    Permille of the first 1000 slots in use by the current search, as reported by UCI engines
+    """
+    def hashfull(self):
+        sample = min(1000, len(self.data))
+        used = 0
+        for i in range(sample):
+            if self.data[i] and (self.data[i] >> 26) & 0xFF == self.generation:
+                used += 1
+        return used * 1000 // sample
+
+    def statsReport(self):
+        hitRate = 100.0 * self.hits / self.probes if self.probes else 0.0
+        return ("tt %d MB, %d buckets: probes %d hits %d (%.1f%%) misses %d collisions %d stores %d overwrites %d "
+                "hashfull %d" % (self.sizeBytes() // (1024 * 1024), self.bucketCount, self.probes, self.hits, hitRate,
+                                 self.misses, self.collisions, self.stores, self.overwrites, self.hashfull()))
@@ -0,0 +1,40 @@
+"""
+Zobrist keys used to give every position a 64 bit identity.
+A position's key is the XOR of one random number per (piece, square) pair on the board, plus one more if black is
+to move. A move only changes a handful of those terms, so GameState.makeMove and undoMove keep the key up to date by
+XORing them in and out instead of rehashing the whole board.
+"""
+
+import random
+
+PIECES = ["wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK"]
+
+_generator = random.Random(0x5EED) #fixed seed so keys are identical across runs and processes
+#PIECE_KEYS[piece][square] with square = row * 8 + col
+PIECE_KEYS = {piece: [_generator.getrandbits(64) for _ in range(64)] for piece in PIECES}
+BLACK_TO_MOVE = _generator.getrandbits(64)
+
+
+"""
+Full hash of a board in the GameState format. Used to initialise the incremental key and to validate it.
+"""
+def hashBoard(board, whiteToMove):
+    key = 0 if whiteToMove else BLACK_TO_MOVE
+    for r in range(8):
+        for c in range(8):
+            piece = board[r][c]
+            if piece != "--":
+                key ^= PIECE_KEYS[piece][r * 8 + c]
+    return key
+
+
+"""
+Key change of making (or unmaking) a move
+"""
+def moveKey(move):
+    keys = PIECE_KEYS[move.pieceMoved]
+    end = move.moveID >> 6
+    key = keys[move.moveID & 63] ^ keys[end] ^ BLACK_TO_MOVE
+    if move.pieceCaptured != "--":
+        key ^= PIECE_KEYS[move.pieceCaptured][end]
+    return key
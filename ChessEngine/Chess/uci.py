@@ -0,0 +1,245 @@
+"""
+UCI (Universal Chess Interface) front-end, so the engine can be driven by tournament managers and scripts.
+Reads commands from stdin and answers on stdout. Doesn't import pygame, so it starts quickly and can be run headless.
+Supported: uci, isready, ucinewgame, setoption (Hash, UseBitboards, OwnBook, BookFile, TablebasePath),
+position startpos/fen ... moves ..., go depth/movetime/wtime/btime/winc/binc/movestogo/nodes/infinite, stop, quit.
+The engine plays without castling, en passant and promotion, so moves using them are rejected.
+Run from the ChessEngine folder: python -m Chess.uci
+"""
+
+import sys
+import threading
+from Chess import ChessEngine, BitboardEngine, ChessAI
+from Chess.TranspositionTable import TranspositionTable
+from Chess.OpeningBook import OpeningBook
+from Chess.Tablebase import Tablebase
+
+ENGINE_NAME = "Chess-Engine-Python"
+ENGINE_AUTHOR = "Chess-Engine-Python developers"
+MAX_HASH_MB = 1024
+MOVE_OVERHEAD_MS = 50 #kept back from every clock based time budget for communication delays
+DEFAULT_MOVES_TO_GO = 30 #moves the remaining clock time is shared over when the GUI doesn't say
+
+
+"""
+Milliseconds to think for, given the remaining clock time and increment of the side to move
+"""
+def timeForMove(timeLeft, increment=0, movesToGo=None):
+    budget = timeLeft // (movesToGo or DEFAULT_MOVES_TO_GO) + increment * 3 // 4
+    return max(1, min(budget, timeLeft // 2) - MOVE_OVERHEAD_MS)
+
+
+def formatScore(score):
+    if score >= ChessAI.MATE_BOUND:
+        return "mate %d" % ((ChessAI.CHECKMATE - score + 1) // 2)
+    if score <= -ChessAI.MATE_BOUND:
+        return "mate -%d" % ((ChessAI.CHECKMATE + score) // 2)
+    return "cp %d" % score
+
+
+class UCIEngine():
+    def __init__(self, output=None):
+        self.output = output if output is not None else self.printLine
+        self.hashMB = ChessAI.DEFAULT_HASH_MB
+        self.useBitboards = False
+        self.tt = TranspositionTable(self.hashMB)
+        self.gs = self.newGameState()
+        self.searchThread = None
+        self.stopEvent = threading.Event()
+        self.infinite = False
+        self.ownBook = False #play book moves while the position is in the book
+        self.book = None #OpeningBook opened from the BookFile option
+        self.tablebase = None #Tablebase of the TablebasePath folder
+
+    @staticmethod
+    def printLine(line):
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    def newGameState(self):
+        gs = BitboardEngine.BitboardGameState() if self.useBitboards else ChessEngine.GameState()
+        gs.loadFEN(ChessEngine.START_FEN)
+        return gs
+
+    """
+    Handles one line of input, returns False once the engine should exit
+    """
+    def handle(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+        if command == "uci":
+            self.output("id name " + ENGINE_NAME)
+            self.output("id author " + ENGINE_AUTHOR)
+            self.output("option name Hash type spin default %d min 1 max %d" % (ChessAI.DEFAULT_HASH_MB, MAX_HASH_MB))
+            self.output("option name UseBitboards type check default false")
+            self.output("option name OwnBook type check default false")
+            self.output("option name BookFile type string default <empty>")
+            self.output("option name TablebasePath type string default <empty>")
+            self.output("uciok")
+        elif command == "isready":
+            self.output("readyok")
+        elif command == "ucinewgame":
+            self.stopSearch()
+            self.tt.clear()
+            self.gs = self.newGameState()
+        elif command == "setoption":
+            self.stopSearch()
+            self.setOption(tokens[1:])
+        elif command == "position":
+            self.stopSearch()
+            self.setPosition(tokens[1:])
+        elif command == "go":
+            self.stopSearch()
+            self.go(tokens[1:])
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "quit":
+            self.stopSearch()
+            return False
+        else:
+            self.output("info string unknown command " + command)
+        return True
+
+    def setOption(self, tokens):
+        #setoption name <name> [value <value>], names may contain spaces
+        if "name" not in tokens:
+            return
+        valueAt = tokens.index("value") if "value" in tokens else len(tokens)
+        name = " ".join(tokens[tokens.index("name") + 1:valueAt]).lower()
+        value = " ".join(tokens[valueAt + 1:])
+        if name == "hash":
+            try:
+                self.hashMB = min(max(int(value), 1), MAX_HASH_MB)
+            except ValueError:
+                self.output("info string invalid Hash value " + value)
+                return
+            self.tt = TranspositionTable(self.hashMB)
+        elif name == "ownbook":
+            self.ownBook = value.lower() == "true"
+        elif name == "bookfile":
+            if self.book is not None:
+                self.book.close()
+                self.book = None
+            if value and value != "<empty>":
+                try:
+                    self.book = OpeningBook(value)
+                except (OSError, ValueError) as error:
+                    self.output("info string cannot open book: " + str(error))
+        elif name == "tablebasepath":
+            if self.tablebase is not None:
+                self.tablebase.close()
+            self.tablebase = Tablebase(value) if value and value != "<empty>" else None
+        elif name == "usebitboards":
+            self.useBitboards = value.lower() == "true"
+            fen = self.gs.getFEN()
+            self.gs = BitboardEngine.BitboardGameState() if self.useBitboards else ChessEngine.GameState()
+            self.gs.loadFEN(fen)
+        else:
+            self.output("info string unknown option " + name)
+
+    def setPosition(self, tokens):
+        movesAt = tokens.index("moves") if "moves" in tokens else len(tokens)
+        if tokens and tokens[0] == "startpos":
+            fen = ChessEngine.START_FEN
+        elif tokens and tokens[0] == "fen":
+            fen = " ".join(tokens[1:movesAt])
+        else:
+            self.output("info string invalid position command")
+            return
+        gs = BitboardEngine.BitboardGameState() if self.useBitboards else ChessEngine.GameState()
+        try:
+            gs.loadFEN(fen)
+        except ValueError as error:
+            self.output("info string " + str(error))
+            return
+        for text in tokens[movesAt + 1:]:
+            move = self.findMove(gs, text)
+            if move is None:
+                self.output("info string illegal move " + text)
+                break
+            gs.makeMove(move)
+        self.gs = gs
+
+    @staticmethod
+    def findMove(gs, text):
+        for move in gs.getValidMoves():
+            if move.getUCINotation() == text:
+                return move
+        return None
+
+    def go(self, tokens):
+        params = {}
+        i = 0
+        while i < len(tokens):
+            if tokens[i] == "infinite":
+                params["infinite"] = True
+                i += 1
+            elif i + 1 < len(tokens) and tokens[i + 1].lstrip("-").isdigit():
+                params[tokens[i]] = int(tokens[i + 1])
+                i += 2
+            else: #ponder, searchmoves and anything else we don't support
+                i += 1
+        timeLimitMs = None
+        if "movetime" in params:
+            timeLimitMs = max(1, params["movetime"] - MOVE_OVERHEAD_MS)
+        else:
+            clock, increment = ("wtime", "winc") if self.gs.whiteToMove else ("btime", "binc")
+            if clock in params:
+                timeLimitMs = timeForMove(max(params[clock], 0), params.get(increment, 0), params.get("movestogo"))
+        maxDepth = min(max(params.get("depth", ChessAI.MAX_DEPTH), 1), ChessAI.MAX_DEPTH)
+        self.infinite = params.get("infinite", False)
+        if self.ownBook and self.book is not None and not self.infinite:
+            bookMove = self.book.pickMove(self.gs)
+            if bookMove is not None:
+                self.output("info string book move")
+                self.output("bestmove " + bookMove.getUCINotation())
+                return
+        if self.tablebase is not None and not self.infinite:
+            tablebaseMove = self.tablebase.bestMove(self.gs)
+            if tablebaseMove is not None:
+                self.output("info string tablebase move")
+                self.output("bestmove " + tablebaseMove.getUCINotation())
+                return
+        self.stopEvent.clear()
+        searcher = ChessAI.Searcher(self.gs, timeLimitMs, maxDepth, self.tt, stopEvent=self.stopEvent,
+                                    nodeLimit=params.get("nodes"), tablebase=self.tablebase)
+        searcher.infoCallback = lambda result: self.sendInfo(searcher, result)
+        self.searchThread = threading.Thread(target=self.runSearch, args=(searcher,), daemon=True)
+        self.searchThread.start()
+
+    def sendInfo(self, searcher, result):
+        line = "info depth %d" % result.depth
+        if result is searcher.result: #a completed iteration, the others are progress reports
+            line += " score " + formatScore(result.score)
+        line += " nodes %d nps %d time %d" % (result.nodes, result.nodesPerSecond(), int(result.elapsed * 1000))
+        if result is searcher.result:
+            line += " pv " + " ".join(move.getUCINotation() for move in result.pv)
+        else:
+            line += " hashfull %d" % self.tt.hashfull()
+        self.output(line)
+
+    def runSearch(self, searcher):
+        result = searcher.search()
+        if self.infinite: #in infinite mode the best move is only sent once the GUI says stop
+            self.stopEvent.wait()
+        self.output("bestmove " + (result.bestMove.getUCINotation() if result.bestMove else "0000"))
+
+    def stopSearch(self):
+        if self.searchThread is not None:
+            self.stopEvent.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+
+def main():
+    engine = UCIEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.stopSearch()
+
+
+if __name__ == '__main__':
+    main()